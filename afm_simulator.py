@@ -1,10 +1,15 @@
 # AFM 控制程序框架 v0.1（Python 模拟版）
 # 模拟扫描过程、PID控制、成像过程
 
+import threading
+import time
+
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 
+from surface_models import cached_grid, load_surface
+
 # -------------------- 扫描参数设置 --------------------
 x_range = 5.0  # 扫描范围 (μm)，X方向
 
@@ -21,27 +26,103 @@ def sample_surface(x, y):
     # 一个虚拟的表面函数，模拟高度变化（单位可看作 μm）
     return 0.5 * np.sin(2 * np.pi * x / 5.0) * np.cos(2 * np.pi * y / 5.0)
 
+def step_surface(x, y):
+    # 台阶表面：沿 X 每 1.25 μm 一级、高 0.2 μm 的台阶，用来看过冲和稳定
+    return 0.2 * np.floor(np.asarray(x) / 1.25) + 0.0 * np.asarray(y)
+
+def bump_surface(x, y):
+    # 孤立的高斯凸起，模拟颗粒
+    return 0.4 * np.exp(-((x - 2.5) ** 2 + (y - 2.5) ** 2) / 0.5)
+
+# 闭环模拟可选的表面（按名字选择，便于在多进程中传递）
+SURFACES = {"sine": sample_surface, "steps": step_surface, "bumps": bump_surface}
+
+def resolve_surface(surface, x_len=x_range, y_len=y_range, step=step_size):
+    # surface：SURFACES 中的名字（按范围和步长生成网格，结果缓存）、形貌图文件路径
+    #          （见 surface_models.load_surface）或任意 f(x, y) 函数
+    if callable(surface):
+        return surface
+    if surface in SURFACES:
+        return cached_grid(SURFACES[surface], float(x_len), float(y_len), float(step))
+    return load_surface(surface, x_len, y_len)
+
 # -------------------- PID 控制器类 --------------------
 class PIDController:
-    def __init__(self, Kp=1.0, Ki=0.0, Kd=0.0):
+    def __init__(self, Kp=1.0, Ki=0.0, Kd=0.0, integral_limit=None, output_limits=None):
         # 初始化比例、积分、微分增益
         self.Kp = Kp
         self.Ki = Ki
         self.Kd = Kd
+        # integral_limit：积分项绝对值上限（抗积分饱和），None 为不限制
+        # output_limits：(下限, 上限) 输出饱和，None 为不限制
+        self.integral_limit = integral_limit
+        self.output_limits = output_limits
         self.integral = 0
         self.prev_error = 0
 
     def update(self, setpoint, measured, dt):
         # setpoint：目标值；measured：测量值；dt：时间间隔
+        # measured 也可以是数组，此时每个元素是一个独立的回路（状态按元素保存）
         error = setpoint - measured  # 当前误差
         self.integral += error * dt  # 积分项累加
+        if self.integral_limit is not None:
+            self.integral = np.clip(self.integral, -self.integral_limit, self.integral_limit)
         derivative = (error - self.prev_error) / dt if dt > 0 else 0  # 微分项
         output = self.Kp * error + self.Ki * self.integral + self.Kd * derivative  # PID 输出
         self.prev_error = error  # 保存当前误差供下次使用
+        if self.output_limits is not None:
+            output = np.clip(output, *self.output_limits)
+        return output
+
+    def reset(self):
+        self.integral = 0
+        self.prev_error = 0
+
+    def update_block(self, setpoint, measured, dt):
+        # 对一整段测量序列做与逐点 update() 等价的批量计算
+        # 在开环扫描中误差序列与输出无关，PID 即一个线性滤波器：
+        # 积分项为误差的累加和，微分项为误差的一阶差分
+        error = setpoint - np.asarray(measured, dtype=float)
+        if error.size == 0:
+            return np.zeros_like(error)
+        if self.integral_limit is not None and self.Ki != 0:
+            # 积分限幅与路径有关，不再是线性滤波器，逐点计算
+            return np.array([self.update(setpoint, m, dt) for m in np.ravel(measured)])
+        output = self.Kp * error
+        # 增益为 0 的项对输出没有贡献，只更新状态，省去整段的累加/差分
+        if self.Ki != 0:
+            integral = self.integral + np.cumsum(error * dt)
+            output += self.Ki * integral
+            self.integral = integral[-1]  # 保留状态，下一段接着计算
+        else:
+            self.integral += error.sum() * dt
+            if self.integral_limit is not None:
+                self.integral = float(np.clip(self.integral, -self.integral_limit, self.integral_limit))
+        if self.Kd != 0 and dt > 0:
+            output += self.Kd * np.diff(error, prepend=self.prev_error) / dt
+        self.prev_error = error[-1]
+        if self.output_limits is not None:
+            output = np.clip(output, *self.output_limits)
         return output
 
 # -------------------- 主扫描函数（非动画） --------------------
-def scan_surface():
+def scan_surface(mode="vectorized", seed=None, rows_per_block=64, store=None, surface=sample_surface):
+    # mode："vectorized" 按行块批量计算；"reference" 为原始逐点循环
+    # seed：随机种子，给定时两种模式得到相同结果
+    # store：scan_store.ScanStore（含 "height" 通道），给定时每算完一块行就写入磁盘，
+    #        返回值为该通道的内存映射数组，帧大小不受内存限制（只支持 vectorized 模式）
+    # surface：样品表面，见 resolve_surface（默认为解析的 sample_surface）
+    rng = np.random.default_rng(seed)
+    surface = resolve_surface(surface)
+    if mode == "reference":
+        if store is not None:
+            raise ValueError("reference 模式不支持 store，请使用 vectorized 模式")
+        return _scan_surface_reference(rng, surface)
+    if mode == "vectorized":
+        return _scan_surface_vectorized(rng, rows_per_block, store, surface)
+    raise ValueError(f"未知扫描模式: {mode}")
+
+def _scan_surface_reference(rng, surface=sample_surface):
     height_map = np.zeros((y_points, x_points))  # 初始化形貌图矩阵
     pid = PIDController(Kp=2.0)  # 创建一个 PID 控制器实例
     setpoint = 0.0  # 设定目标偏折信号为 0
@@ -50,15 +131,211 @@ def scan_surface():
         y = j * step_size
         for i in range(x_points):
             x = i * step_size
-            true_z = sample_surface(x, y)  # 获取真实表面高度
+            true_z = surface(x, y)  # 获取真实表面高度
             # 模拟探针测量带有一定噪声
-            measured_signal = np.random.normal(loc=true_z, scale=0.02)
+            measured_signal = rng.normal(loc=true_z, scale=0.02)
             z_adjust = pid.update(setpoint, measured_signal, dt=0.01)  # 调用PID调节高度
             height_map[j, i] = true_z + z_adjust  # 存储调节后的值
     return height_map
 
+def iter_scan_blocks(rng, rows_per_block=64, surface=sample_surface):
+    # 逐块产生扫描结果 (起始行号, 行块)，供 scan_surface 和 scan_pipeline 的模拟数据源使用
+    # 按行块处理：表面、噪声和 PID 均以数组形式计算，内存占用只与块大小有关
+    # 噪声按逐点扫描的顺序（行优先）抽取，因此与参考模式的随机数序列一致
+    pid = PIDController(Kp=2.0)
+    setpoint = 0.0
+    xs = np.arange(x_points) * step_size
+    for j0 in range(0, y_points, rows_per_block):
+        j1 = min(j0 + rows_per_block, y_points)
+        ys = np.arange(j0, j1) * step_size
+        true_z = surface(xs[np.newaxis, :], ys[:, np.newaxis]) * np.ones((j1 - j0, x_points))
+        measured_signal = true_z + 0.02 * rng.standard_normal(true_z.shape)
+        z_adjust = pid.update_block(setpoint, measured_signal.ravel(), dt=0.01)
+        yield j0, true_z + z_adjust.reshape(true_z.shape)
+
+def _scan_surface_vectorized(rng, rows_per_block, store=None, surface=sample_surface):
+    if store is not None:
+        height_map = store.channel("height")
+    else:
+        height_map = np.zeros((y_points, x_points))
+    for j0, block in iter_scan_blocks(rng, rows_per_block, surface):
+        j1 = j0 + len(block)
+        if store is not None:
+            store.write_lines(j0, {"height": block})
+        else:
+            height_map[j0:j1] = block
+    if store is not None:
+        store.finish()
+    return height_map
+
+# -------------------- 闭环跟踪模拟 --------------------
+# 上面的扫描是开环的：PID 输出不影响测量值。下面的模拟把 PID 接在一阶压电管模型上：
+#   测量值 = Z 位置 - 表面高度 + 噪声，PID 输出为 Z 指令，Z 以时间常数 plant_tau 跟随指令。
+# 每行是一个独立的回路，所有行按列同时推进（数组运算），循环次数只等于每行点数。
+def simulate_tracking(Kp=2.0, Ki=0.0, Kd=0.0, step=step_size, noise=0.02, surface="sine",
+                      scan_speed=10.0, plant_tau=0.001, seed=None, x_len=x_range, y_len=y_range,
+                      output_limits=None):
+    # step：像素间距 (μm)；scan_speed：扫描速度 (μm/s)，每像素的控制周期 dt = step / scan_speed
+    # noise：测量噪声标准差；surface：见 resolve_surface（名字、形貌图文件或函数）
+    # 返回 (形貌图, 跟踪误差图)，形貌图为每个像素的 Z 位置
+    surface_fn = resolve_surface(surface, x_len, y_len, step)
+    rng = np.random.default_rng(seed)
+    nx = int(round(x_len / step))
+    ny = int(round(y_len / step))
+    xs = np.arange(nx) * step
+    ys = np.arange(ny) * step
+    true_z = surface_fn(xs[np.newaxis, :], ys[:, np.newaxis]) * np.ones((ny, nx))
+    dt = step / scan_speed
+    alpha = 1.0 - np.exp(-dt / plant_tau)  # 一个周期内压电管走完的比例
+
+    pid = PIDController(Kp=Kp, Ki=Ki, Kd=Kd, output_limits=output_limits)
+    z = np.zeros(ny)
+    height = np.empty((ny, nx))
+    with np.errstate(over="ignore", invalid="ignore"):
+        for i in range(nx):
+            measured = z - true_z[:, i] + noise * rng.standard_normal(ny)
+            command = pid.update(0.0, measured, dt)
+            z = z + alpha * (command - z)
+            height[:, i] = z
+    return height, height - true_z
+
+def step_response(Kp=2.0, Ki=0.0, Kd=0.0, dt=0.01, plant_tau=0.001, samples=500, band=0.02):
+    # 无噪声的单位阶跃响应，返回 {"overshoot": 相对过冲, "settling_time": 进入 ±band 后不再离开的时间}
+    # 稳态不是 1（纯比例控制有静差）时以最后的值为终值；发散时 settling_time 为 inf
+    pid = PIDController(Kp=Kp, Ki=Ki, Kd=Kd)
+    alpha = 1.0 - np.exp(-dt / plant_tau)
+    z = 0.0
+    trace = np.empty(samples)
+    with np.errstate(over="ignore", invalid="ignore"):
+        for k in range(samples):
+            z = z + alpha * (pid.update(0.0, z - 1.0, dt) - z)
+            trace[k] = z
+    final = trace[-1]
+    if not np.all(np.isfinite(trace)) or abs(final) < 1e-12:
+        return {"overshoot": np.inf, "settling_time": np.inf}
+    overshoot = max(0.0, (trace.max() - final) / abs(final)) if final > 0 else np.inf
+    outside = np.nonzero(np.abs(trace - final) > band * abs(final))[0]
+    settled = 0 if outside.size == 0 else outside[-1] + 1
+    # 最后 10% 的样本里仍在带外，说明还没收敛（振荡或发散）
+    settling_time = settled * dt if settled < samples * 0.9 else np.inf
+    return {"overshoot": float(overshoot), "settling_time": float(settling_time)}
+
+# -------------------- 后台模拟（与显示解耦） --------------------
+class ScanProducer(threading.Thread):
+    """在后台线程中逐行计算扫描图像，写入共享缓冲区
+
+    显示端随时读取 rows_done 之前的行，不会拖慢模拟；
+    rows_per_second 给定时按该速度限速（演示用），否则以计算速度运行。
+    """
+
+    def __init__(self, seed=None, rows_per_second=None, Kp=2.0, Ki=0.0, Kd=0.0,
+                 surface=sample_surface):
+        super().__init__(daemon=True)
+        self.surface = resolve_surface(surface)
+        self.data = np.full((y_points, x_points), np.nan)
+        self.rows_done = 0  # 已完成的行数，只由本线程增加
+        self.rows_per_second = rows_per_second
+        self.pid = PIDController(Kp=Kp, Ki=Ki, Kd=Kd)
+        self._rng = np.random.default_rng(seed)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        setpoint = 0.0
+        xs = np.arange(x_points) * step_size
+        period = 1.0 / self.rows_per_second if self.rows_per_second else 0.0
+        next_time = time.monotonic()
+        for j in range(y_points):
+            if self._stop_event.is_set():
+                break
+            true_z = self.surface(xs, j * step_size)
+            measured_signal = true_z + 0.02 * self._rng.standard_normal(x_points)
+            z_adjust = self.pid.update_block(setpoint, measured_signal, dt=0.01)
+            self.data[j] = true_z + z_adjust  # 先写数据，再更新行数
+            self.rows_done = j + 1
+            if period:
+                next_time += period
+                self._stop_event.wait(max(0.0, next_time - time.monotonic()))
+
+    def stop(self):
+        self._stop_event.set()
+
+    @property
+    def finished(self):
+        return self.rows_done >= y_points
+
 # -------------------- 动画显示扫描过程 --------------------
-def animate_scan():
+def animate_scan(background=True, fps=20, every=1, output=None, seed=None,
+                 rows_per_second=None, surface=sample_surface):
+    # background：True 时模拟在后台线程运行，显示按固定帧率从共享缓冲区取最新的行，
+    #             显示跟不上时丢弃中间帧；False 为原来的每帧计算一行
+    # fps：显示帧率上限
+    # every：只显示每第 N 行完成时的画面（帧 = 完成一行）
+    # output：给定文件名时不弹出窗口：.png 保存最终图像，.gif/.mp4 等保存动画（不丢帧）
+    # rows_per_second：后台模拟的限速（演示用），None 为全速
+    # surface：样品表面，见 resolve_surface（只用于后台模式）
+    if not background:
+        return _animate_scan_inline()
+    if output is not None:
+        plt.switch_backend("Agg")
+
+    fig, ax = plt.subplots()  # 创建图像窗口和坐标轴
+    producer = ScanProducer(seed=seed, rows_per_second=rows_per_second, surface=surface)
+    shown = np.full((y_points, x_points), np.nan)  # 已显示的行，未显示的行为空
+    im = ax.imshow(np.ma.masked_invalid(shown), cmap='viridis', origin='lower', vmin=-1, vmax=1,
+                   extent=[0, x_range, 0, y_range])  # 设置显示属性
+    plt.title("AFM 扫描模拟")
+    plt.xlabel("X (μm)")
+    plt.ylabel("Y (μm)")
+    stats = {"shown": 0, "dropped": 0}
+    shown_rows = [0]
+
+    def draw(rows):
+        # 只复制上一帧之后新完成的行
+        shown[shown_rows[0]:rows] = producer.data[shown_rows[0]:rows]
+        im.set_array(np.ma.masked_invalid(shown))
+        stats["dropped"] += max(0, (rows - shown_rows[0]) // every - 1)
+        stats["shown"] += 1
+        shown_rows[0] = rows
+        return [im]
+
+    producer.start()
+    if output is not None and output.lower().endswith(".png"):
+        producer.join()
+        draw(producer.rows_done)
+        fig.savefig(output)
+    elif output is not None:
+        # 写文件时每个目标帧都等待模拟完成，不丢帧
+        targets = list(range(every, y_points, every)) + [y_points]
+
+        def update_file(target):
+            while producer.rows_done < target and producer.is_alive():
+                time.sleep(0.001)
+            return draw(min(target, producer.rows_done))
+
+        ani = animation.FuncAnimation(fig, update_file, frames=targets, init_func=lambda: [im],
+                                      blit=True, repeat=False)
+        ani.save(output, fps=fps)
+    else:
+        # 每个显示周期取最新完成的第 N 行；两个周期之间完成的其他帧被丢弃
+        def ticks():
+            while shown_rows[0] < y_points:
+                yield producer.rows_done
+
+        def update_live(rows):
+            if rows < y_points:
+                rows -= rows % every
+            if rows <= shown_rows[0]:
+                return [im]
+            return draw(rows)
+
+        ani = animation.FuncAnimation(fig, update_live, frames=ticks, init_func=lambda: [im], blit=True,
+                                      interval=1000.0 / fps, repeat=False, cache_frame_data=False)
+        plt.show()
+    producer.stop()
+    plt.close(fig)
+    return producer.data, stats
+
+def _animate_scan_inline():
     fig, ax = plt.subplots()  # 创建图像窗口和坐标轴
     data = np.zeros((y_points, x_points))  # 初始化图像数据
     im = ax.imshow(data, cmap='viridis', origin='lower', vmin=-1, vmax=1,
@@ -88,4 +365,20 @@ def animate_scan():
 
 # -------------------- 执行主程序 --------------------
 if __name__ == "__main__":
-    animate_scan()  # 运行动画模拟
+    import argparse
+
+    parser = argparse.ArgumentParser(description="AFM 扫描模拟动画")
+    parser.add_argument("--inline", action="store_true", help="每帧计算一行（原始方式）")
+    parser.add_argument("--fps", type=float, default=20, help="显示帧率上限")
+    parser.add_argument("--every", type=int, default=1, help="每 N 行显示一帧")
+    parser.add_argument("--output", help="不显示窗口，保存到文件（.png/.gif/.mp4）")
+    parser.add_argument("--rows-per-second", type=float, help="模拟限速（演示用）")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--surface", default="sine",
+                        help=f"表面：{'/'.join(SURFACES)} 或形貌图文件（.npy/.npz/.txt/.csv）")
+    args = parser.parse_args()
+    result = animate_scan(background=not args.inline, fps=args.fps, every=args.every,
+                          output=args.output, seed=args.seed,
+                          rows_per_second=args.rows_per_second, surface=args.surface)  # 运行动画模拟
+    if result is not None:
+        print(f"显示 {result[1]['shown']} 帧，丢弃 {result[1]['dropped']} 帧")
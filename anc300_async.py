@@ -0,0 +1,227 @@
+# ANC300 的 asyncio 驱动
+# 每台控制器一个命令队列和一个专用的串口线程：同一台控制器的命令严格按提交顺序执行，
+# 不同控制器的命令互不等待（例如粗调定位器和扫描压电管在两台控制器上同时动作）。
+# 命令经 controller_session.ControllerSession 执行（阻塞），在设备自己的线程中运行，
+# 事件循环不会被阻塞；可以直接使用 SessionManager 中的会话，与扫描线程等共用同一个连接，
+# 会话锁保证两边的命令不会交错。
+#
+# 用法：
+#   async with AsyncANC300("/dev/ttyUSB0") as coarse, AsyncANC300("/dev/ttyUSB1") as scan:
+#       await asyncio.gather(coarse.stepu(1, 100), scan.seta(1, 10.0))
+#       v = await scan.geta(1)
+#
+#   device = AsyncANC300(sessions.get(port))   # 共用 GUI 的持久连接
+#
+# Qt 界面通过 qt_bridge.AsyncBridge 调用，不阻塞 GUI 线程。
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from controller_session import ControllerSession
+
+_STOP = object()
+
+
+class AsyncANC300:
+    """一台 ANC300 控制器
+
+    target：串口名（connect() 时自己打开会话，close() 时关闭），
+            或已有的 ControllerSession（共用其连接，close() 时不关闭）
+    name：日志和线程名中使用的名字，默认为串口名
+    window：run() 批量执行时同时在途的命令数（见 CommandPipeline）
+    """
+
+    def __init__(self, target, baudrate=9600, timeout=1.0, window=4, name=None):
+        if isinstance(target, ControllerSession):
+            self.session = target
+            self.port = target.port
+            self._owns_session = False
+        else:
+            self.session = None
+            self.port = target
+            self._owns_session = True
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.window = window
+        self.name = name or self.port
+        self._executor = None
+        self._queue = None
+        self._worker = None
+
+    # -------------------- 连接 --------------------
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"anc300-{self.name}")
+        if self._owns_session:
+            session = ControllerSession(self.port, self.baudrate, self.timeout, keepalive=None)
+            self.session = await loop.run_in_executor(self._executor, session.open)
+        else:
+            await loop.run_in_executor(self._executor, self.session.ensure_connected)
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run_queue())
+        return self
+
+    async def close(self):
+        if self._worker is None:
+            return
+        await self._queue.put((_STOP, None))
+        await self._worker
+        self._worker = None
+        if self._owns_session:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.session.close)
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def connected(self):
+        return self._worker is not None
+
+    @property
+    def queued(self):
+        """排队中（尚未开始执行）的命令数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run_queue(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, future = await self._queue.get()
+            if job is _STOP:
+                break
+            if future.cancelled():
+                continue
+            try:
+                result = await loop.run_in_executor(self._executor, job)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+    def _submit(self, job):
+        if self._worker is None:
+            raise RuntimeError(f"控制器 {self.name} 未连接")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((job, future))
+        return future
+
+    # -------------------- 通用命令 --------------------
+    async def command(self, cmd, timeout=None, check=True):
+        """执行一条命令，返回 Reply；check 为 True 时 ERROR 抛出 ANC300Error"""
+        return await self._submit(functools.partial(self.session.command, cmd, timeout, check))
+
+    async def run(self, commands):
+        """流水线执行一组命令（中间不插入其他命令），返回 Reply 列表"""
+        commands = list(commands)
+
+        def job():
+            with self.session:  # 独占连接，其他线程的命令不会插进流水线
+                return self.session.pipeline(window=self.window).run(commands)
+
+        return await self._submit(job)
+
+    # -------------------- 常用命令 --------------------
+    async def ver(self):
+        return "\n".join((await self.command("ver")).lines)
+
+    async def setm(self, axis, mode):
+        await self.command(f"setm {axis} {mode}")
+
+    async def getm(self, axis):
+        return (await self.command(f"getm {axis}")).values.get("mode")
+
+    async def seta(self, axis, volts):
+        await self.command(f"seta {axis} {volts:.3f}")
+
+    async def geta(self, axis):
+        return (await self.command(f"geta {axis}")).value
+
+    async def geto(self, axis):
+        return (await self.command(f"geto {axis}")).value
+
+    async def setf(self, axis, hz):
+        await self.command(f"setf {axis} {int(hz)}")
+
+    async def getf(self, axis):
+        return (await self.command(f"getf {axis}")).value
+
+    async def setv(self, axis, volts):
+        await self.command(f"setv {axis} {volts:.3f}")
+
+    async def getv(self, axis):
+        return (await self.command(f"getv {axis}")).value
+
+    async def stepu(self, axis, count=1, wait=False):
+        await self.command(f"stepu {axis} {int(count)}")
+        if wait:
+            await self.stepw(axis)
+
+    async def stepd(self, axis, count=1, wait=False):
+        await self.command(f"stepd {axis} {int(count)}")
+        if wait:
+            await self.stepw(axis)
+
+    async def stepw(self, axis):
+        await self.command(f"stepw {axis}")
+
+    async def stop(self, axis):
+        await self.command(f"stop {axis}")
+
+    async def capw(self, axis):
+        await self.command(f"capw {axis}")
+
+    async def getc(self, axis):
+        return (await self.command(f"getc {axis}")).value
+
+    async def measure_capacitance(self, axis):
+        """切到 cap 模式测量电容 (nF)，完成后恢复原模式"""
+        previous = await self.getm(axis)
+        await self.setm(axis, "cap")
+        try:
+            await self.capw(axis)
+            return await self.getc(axis)
+        finally:
+            if previous and previous != "cap":
+                await self.setm(axis, previous)
+
+
+async def open_all(ports, sessions=None, **kwargs):
+    """同时连接多台控制器，返回 {串口: AsyncANC300}
+
+    sessions：controller_session.SessionManager，给出时使用其中的会话（与其他操作共用连接）
+    """
+    if sessions is not None:
+        loop = asyncio.get_running_loop()
+        targets = await asyncio.gather(*(loop.run_in_executor(None, sessions.get, port)
+                                         for port in ports))
+    else:
+        targets = ports
+    devices = [AsyncANC300(target, **kwargs) for target in targets]
+    await asyncio.gather(*(d.connect() for d in devices))
+    return {d.port: d for d in devices}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="同时查询多台 ANC300")
+    parser.add_argument("ports", nargs="+", help="串口名")
+    args = parser.parse_args()
+
+    async def main():
+        devices = await open_all(args.ports)
+        try:
+            versions = await asyncio.gather(*(d.ver() for d in devices.values()))
+            for port, version in zip(devices, versions):
+                print(f"{port}: {version}")
+        finally:
+            await asyncio.gather(*(d.close() for d in devices.values()))
+
+    asyncio.run(main())
@@ -0,0 +1,281 @@
+# ANC300 控制器模拟器
+# 在伪终端 (pty) 上模拟 ANC300 的串口命令，用于离线测试传输层和扫描流程，
+# 不占用真实控制器。
+#
+# 用法：
+#   python anc300_emulator.py --latency 0.002 --jitter 0.0005 --baudrate 38400
+# 启动后打印设备路径（如 /dev/pts/5），把它填到扫描程序的串口号即可。
+#
+# 也可以在程序内使用：
+#   emu = ANC300Emulator(latency=0.001)
+#   port = emu.start()
+#   ...
+#   emu.stop()
+
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+NUM_AXES = 7
+MODES = ("gnd", "inp", "cap", "stp", "off", "stp+", "stp-")
+MAX_VOLTAGE = 150.0  # 偏置/步进电压上限 (V)
+
+VERSION = "attocube ANC300 controller version 1.1.0 (emulator)"
+
+
+class AxisState:
+    def __init__(self):
+        self.mode = "gnd"
+        self.offset = 0.0       # 偏置电压 (V)
+        self.frequency = 1000   # 步进频率 (Hz)
+        self.amplitude = 30.0   # 步进幅度 (V)
+        self.position = 0       # 累计步数（向上为正）
+        self.capacitance = 1000.0  # 电容 (nF)
+        self.cap_measured = False
+        self.busy_until = 0.0   # 步进或电容测量结束的时刻
+
+    def output_voltage(self):
+        if self.mode in ("off", "stp+", "stp-"):
+            return self.offset
+        return 0.0
+
+
+class ANC300Emulator:
+    """ANC300 模拟器
+
+    latency：每条命令的基本处理时间 (s)
+    jitter：处理时间的随机抖动（正态分布标准差，s）
+    baudrate：按 10 bit/字节 模拟串口收发耗时，0 表示不限速
+    command_latency：个别命令的处理时间，如 {"capw": 0.05}
+    cap_time：一次电容测量所需时间 (s)
+    """
+
+    def __init__(self, latency=0.001, jitter=0.0, baudrate=0, command_latency=None,
+                 cap_time=0.1, echo=True, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.baudrate = baudrate
+        self.command_latency = dict(command_latency or {})
+        self.cap_time = cap_time
+        self.echo = echo
+        self.axes = {i: AxisState() for i in range(1, NUM_AXES + 1)}
+        self.command_count = 0
+        self._rng = random.Random(seed)
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+        self.device = None
+
+    # -------------------- pty 与主循环 --------------------
+    def start(self):
+        """打开伪终端并在后台线程中运行，返回设备路径"""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.device = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self.device
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def _serve(self):
+        buf = b""
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                continue
+            self._transfer_delay(len(data))
+            buf += data
+            while b"\n" in buf or b"\r" in buf:
+                # 命令以 CR、LF 或 CR+LF 结尾
+                idx = min(i for i in (buf.find(b"\r"), buf.find(b"\n")) if i >= 0)
+                line = buf[:idx].decode(errors="ignore").strip()
+                buf = buf[idx + 1:].lstrip(b"\r\n")
+                if line:
+                    self._respond(line)
+
+    def _transfer_delay(self, nbytes):
+        if self.baudrate > 0:
+            time.sleep(nbytes * 10.0 / self.baudrate)
+
+    def _respond(self, line):
+        name = line.split()[0]
+        delay = self.command_latency.get(name, self.latency)
+        if self.jitter > 0:
+            delay += self._rng.gauss(0.0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        lines, ok, wait = self.execute(line)
+        if wait > 0:
+            time.sleep(wait)
+        out = []
+        if self.echo:
+            out.append(line)
+        out.extend(lines)
+        out.append("OK" if ok else "ERROR")
+        payload = ("\r\n".join(out) + "\r\n> ").encode()
+        self._transfer_delay(len(payload))
+        os.write(self._master, payload)
+
+    # -------------------- 命令解释 --------------------
+    def execute(self, line):
+        """执行一条命令，返回 (数据行列表, 是否成功, 需要额外等待的时间)"""
+        self.command_count += 1
+        parts = line.split()
+        name, args = parts[0], parts[1:]
+        handler = getattr(self, "_cmd_" + name, None)
+        if handler is None:
+            return [f"Unknown command: {name}"], False, 0.0
+        try:
+            return handler(*args)
+        except (TypeError, ValueError):
+            return ["Wrong parameters"], False, 0.0
+        except KeyError:
+            return ["Axis not present"], False, 0.0
+
+    def _axis(self, axis):
+        return self.axes[int(axis)]
+
+    def _cmd_ver(self):
+        return [VERSION], True, 0.0
+
+    def _cmd_echo(self, state):
+        if state not in ("on", "off"):
+            raise ValueError(state)
+        self.echo = state == "on"
+        return [], True, 0.0
+
+    def _cmd_setm(self, axis, mode):
+        ax = self._axis(axis)
+        if mode not in MODES:
+            raise ValueError(mode)
+        ax.mode = mode
+        if mode == "cap":
+            ax.cap_measured = False
+            ax.busy_until = time.monotonic() + self.cap_time
+        return [], True, 0.0
+
+    def _cmd_getm(self, axis):
+        return [f"mode = {self._axis(axis).mode}"], True, 0.0
+
+    def _cmd_seta(self, axis, value):
+        ax = self._axis(axis)
+        v = float(value)
+        if not 0.0 <= v <= MAX_VOLTAGE:
+            return ["Value out of range"], False, 0.0
+        ax.offset = v
+        return [], True, 0.0
+
+    def _cmd_geta(self, axis):
+        return [f"voltage = {self._axis(axis).offset:.6f} V"], True, 0.0
+
+    def _cmd_geto(self, axis):
+        return [f"voltage = {self._axis(axis).output_voltage():.6f} V"], True, 0.0
+
+    def _cmd_setf(self, axis, value):
+        f = int(value)
+        if not 1 <= f <= 10000:
+            return ["Value out of range"], False, 0.0
+        self._axis(axis).frequency = f
+        return [], True, 0.0
+
+    def _cmd_getf(self, axis):
+        return [f"frequency = {self._axis(axis).frequency} Hz"], True, 0.0
+
+    def _cmd_setv(self, axis, value):
+        v = float(value)
+        if not 0.0 <= v <= MAX_VOLTAGE:
+            return ["Value out of range"], False, 0.0
+        self._axis(axis).amplitude = v
+        return [], True, 0.0
+
+    def _cmd_getv(self, axis):
+        return [f"voltage = {self._axis(axis).amplitude:.6f} V"], True, 0.0
+
+    def _step(self, axis, count, direction):
+        ax = self._axis(axis)
+        if ax.mode not in ("stp", "stp+", "stp-"):
+            return ["Axis not in stepping mode"], False, 0.0
+        n = int(count)
+        ax.position += direction * n
+        ax.busy_until = time.monotonic() + n / ax.frequency
+        return [], True, 0.0
+
+    def _cmd_stepu(self, axis, count=1):
+        return self._step(axis, count, +1)
+
+    def _cmd_stepd(self, axis, count=1):
+        return self._step(axis, count, -1)
+
+    def _cmd_stepw(self, axis):
+        ax = self._axis(axis)
+        return [], True, max(0.0, ax.busy_until - time.monotonic())
+
+    def _cmd_stop(self, axis):
+        self._axis(axis).busy_until = 0.0
+        return [], True, 0.0
+
+    def _cmd_capw(self, axis):
+        ax = self._axis(axis)
+        if ax.mode != "cap":
+            return ["Axis not in cap mode"], False, 0.0
+        wait = max(0.0, ax.busy_until - time.monotonic())
+        ax.cap_measured = True
+        return [], True, wait
+
+    def _cmd_getc(self, axis):
+        ax = self._axis(axis)
+        if not ax.cap_measured:
+            return ["No capacitance measured"], False, 0.0
+        return [f"capacitance = {ax.capacitance:.1f} nF"], True, 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANC300 控制器模拟器（伪终端）")
+    parser.add_argument("--latency", type=float, default=0.001, help="每条命令的处理时间 (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="处理时间抖动的标准差 (s)")
+    parser.add_argument("--baudrate", type=int, default=0, help="模拟的串口波特率，0 为不限速")
+    parser.add_argument("--cap-time", type=float, default=0.1, help="一次电容测量的时间 (s)")
+    parser.add_argument("--command-latency", action="append", default=[], metavar="CMD=SECONDS",
+                        help="单个命令的处理时间，可重复，如 --command-latency capw=0.05")
+    parser.add_argument("--seed", type=int, default=None, help="抖动的随机种子")
+    args = parser.parse_args()
+
+    command_latency = {}
+    for item in args.command_latency:
+        name, _, value = item.partition("=")
+        command_latency[name] = float(value)
+
+    emu = ANC300Emulator(latency=args.latency, jitter=args.jitter, baudrate=args.baudrate,
+                         command_latency=command_latency, cap_time=args.cap_time, seed=args.seed)
+    emu.start()
+    print(f"ANC300 模拟器已启动: {emu.device}", flush=True)
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"共处理 {emu.command_count} 条命令")
+        emu.stop()
+
+
+if __name__ == "__main__":
+    main()
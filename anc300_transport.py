@@ -0,0 +1,232 @@
+# ANC300 串口传输层
+# 按控制器的 "OK"/"ERROR" 结束符读取回应，代替固定 sleep + read_all()
+#
+# ANC300 的一次回应大致为：
+#   > geta 2                 <- 回显（echo on 时）
+#   voltage = 2.345678 V     <- 数据行（可能没有）
+#   OK                       <- 结束符（失败时为错误信息 + ERROR）
+#   >                        <- 提示符
+
+import time
+
+# 各命令的默认超时（秒），其余命令使用 ANC300Transport.timeout
+COMMAND_TIMEOUTS = {
+    "capw": 10.0,   # 等待电容测量完成
+    "stepw": 60.0,  # 等待步进完成
+}
+
+# 各命令成功时应有的数据行数：设置类命令没有数据行，读取类命令恰好一行 "名称 = 值"。
+# 流水线用它逐条校验回应；echo off 时没有回显可比对，回应丢失或错位只能靠形状发现。
+REPLY_LINES = {
+    "seta": 0, "setm": 0, "setf": 0, "setv": 0, "stepu": 0, "stepd": 0, "stop": 0,
+    "geta": 1, "geto": 1, "getc": 1, "getm": 1, "getf": 1, "getv": 1,
+}
+
+# 串口读取的超时（秒）。只在建立传输时设置一次：pyserial 每次修改 timeout 都会重新配置串口
+# （tcsetattr），放在每条命令里会给逐像素的热路径增加系统调用。每条命令的截止时间
+# 由 read_reply 自己检查，一次读取最多越过截止时间 POLL_INTERVAL。
+POLL_INTERVAL = 0.05
+
+
+class ANC300Error(Exception):
+    """控制器返回 ERROR 或回应无法解析"""
+
+    def __init__(self, message, reply=None):
+        super().__init__(message)
+        self.reply = reply
+
+
+class ANC300Timeout(ANC300Error):
+    """在超时时间内没有收到结束符"""
+
+
+class Reply:
+    """一条命令的解析结果"""
+
+    def __init__(self, command, lines, ok):
+        self.command = command
+        self.lines = lines  # 去掉回显和结束符后的数据行
+        self.ok = ok
+        self.values = {}  # 形如 "voltage = 2.345678 V" 的行解析为 {"voltage": 2.345678}
+        self.units = {}
+        for line in lines:
+            if "=" not in line:
+                continue
+            key, _, rest = line.partition("=")
+            parts = rest.split()
+            if not parts:
+                continue
+            key = key.strip()
+            try:
+                self.values[key] = float(parts[0])
+            except ValueError:
+                self.values[key] = parts[0]
+            if len(parts) > 1:
+                self.units[key] = parts[1]
+
+    @property
+    def value(self):
+        # 第一项数值（如 geta/getc 的结果），没有则为 None
+        for v in self.values.values():
+            return v
+        return None
+
+    @property
+    def error(self):
+        # 失败时控制器给出的错误信息
+        return None if self.ok else "\n".join(self.lines)
+
+    @property
+    def text(self):
+        return "\n".join(self.lines + ["OK" if self.ok else "ERROR"])
+
+    def shape_error(self):
+        """回应的数据行与命令不符时返回说明，否则返回 None（未知命令不检查）"""
+        name = self.command.split()[0] if self.command.strip() else ""
+        expected = REPLY_LINES.get(name)
+        if expected is None or not self.ok:
+            return None
+        if len(self.lines) != expected:
+            return f"应有 {expected} 行数据，收到 {len(self.lines)} 行"
+        if expected == 1 and not self.values:
+            return f"数据行格式不符: {self.lines[0]!r}"
+        return None
+
+    def __repr__(self):
+        return f"Reply({self.command!r}, ok={self.ok}, lines={self.lines!r})"
+
+
+class ANC300Transport:
+    """包装一个已打开的 serial.Serial，按结束符收发命令"""
+
+    def __init__(self, ser, timeout=1.0):
+        self.ser = ser
+        self.timeout = timeout
+        self._buffer = ""
+        if ser.timeout != POLL_INTERVAL:
+            ser.timeout = POLL_INTERVAL
+
+    def command_timeout(self, cmd):
+        name = cmd.split()[0] if cmd.strip() else ""
+        return COMMAND_TIMEOUTS.get(name, self.timeout)
+
+    def write(self, cmd):
+        self.ser.write((cmd + "\r\n").encode())
+
+    def command(self, cmd, timeout=None, check=True):
+        """发送命令并等待 OK/ERROR；check 为 True 时 ERROR 抛出 ANC300Error"""
+        self.write(cmd)
+        return self.read_reply(cmd, timeout=timeout, check=check)
+
+    def read_reply(self, cmd, timeout=None, check=True):
+        """读取 cmd 的回应，直到结束符或超时"""
+        if timeout is None:
+            timeout = self.command_timeout(cmd)
+        deadline = time.monotonic() + timeout
+        lines = []
+        while True:
+            line = self._next_line(deadline)
+            if line is None:
+                raise ANC300Timeout(f"等待 '{cmd}' 的回应超时 ({timeout:.2f} s)",
+                                    Reply(cmd, lines, False))
+            if not line or line == cmd.strip():  # 空行或回显
+                continue
+            if line == "OK":
+                return Reply(cmd, lines, True)
+            if line == "ERROR":
+                reply = Reply(cmd, lines, False)
+                if check:
+                    raise ANC300Error(f"'{cmd}' 执行失败: {reply.error}", reply)
+                return reply
+            lines.append(line)
+
+    def _next_line(self, deadline):
+        # 返回下一整行（已去掉提示符和首尾空白），超时返回 None
+        while "\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            chunk = self.ser.read(self.ser.in_waiting or 1)
+            if chunk:
+                self._buffer += chunk.decode(errors="ignore")
+        line, _, self._buffer = self._buffer.partition("\n")
+        return line.strip().lstrip(">").strip()
+
+    def reset(self):
+        # 丢弃尚未读取的数据
+        self._buffer = ""
+        self.ser.reset_input_buffer()
+
+    def close(self):
+        self.ser.close()
+
+
+class CommandPipeline:
+    """流水线发送：不等回应连续写出多条命令，再按顺序匹配回应
+
+    window 为同时在途（已写出、未收到回应）的命令上限，避免控制器输入缓冲溢出。
+    任何一条返回 ERROR 或回应对不上命令时，先读完其余在途回应再抛出 ANC300Error，
+    保证之后的命令与回应仍能对齐。
+    """
+
+    def __init__(self, transport, window=4):
+        if window < 1:
+            raise ValueError("window 至少为 1")
+        self.transport = transport
+        self.window = window
+        self._pending = []  # 在途命令，按写出顺序
+        self._replies = []  # 已收到、尚未被 wait() 取走的回应
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def submit(self, cmd):
+        """写出一条命令；窗口已满时先收取最早的回应"""
+        while len(self._pending) >= self.window:
+            self._collect_one()
+        self.transport.write(cmd)
+        self._pending.append(cmd)
+
+    def wait(self):
+        """等待全部在途命令的回应，按提交顺序返回 Reply 列表"""
+        while self._pending:
+            self._collect_one()
+        replies, self._replies = self._replies, []
+        return replies
+
+    def run(self, commands):
+        """流水线执行一组命令并返回全部回应"""
+        for cmd in commands:
+            self.submit(cmd)
+        return self.wait()
+
+    def _collect_one(self):
+        cmd = self._pending.pop(0)
+        try:
+            reply = self.transport.read_reply(cmd, check=False)
+        except ANC300Error:
+            self.drain()
+            raise
+        # 数据行里出现了其他在途命令的回显，或数据行数、格式与命令不符，说明回应错位
+        others = set(self._pending)
+        mismatch = reply.shape_error()
+        if others.intersection(reply.lines) or mismatch:
+            self.drain()
+            raise ANC300Error(f"'{cmd}' 的回应与命令不匹配（{mismatch or '含其他命令的回显'}）:"
+                              f" {reply.lines}", reply)
+        if not reply.ok:
+            self.drain()
+            raise ANC300Error(f"'{cmd}' 执行失败: {reply.error}", reply)
+        self._replies.append(reply)
+
+    def drain(self):
+        # 尽量读完在途回应并丢弃，用于出错后的恢复
+        pending, self._pending = self._pending, []
+        self._replies = []
+        for cmd in pending:
+            try:
+                self.transport.read_reply(cmd, check=False)
+            except ANC300Error:
+                self.transport.reset()
+                break
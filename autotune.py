@@ -0,0 +1,262 @@
+# PID 增益自动整定（基于闭环模拟）
+# 1. 用继电反馈（relay）或开环阶跃试验辨识压电管回路，按经验公式得到初始增益；
+# 2. 以 afm_simulator.simulate_tracking 的 RMS 跟踪误差为目标，用 Nelder-Mead 单纯形法
+#    在对数增益空间中细化（固定随机种子，每次评估用相同的噪声，目标函数是确定的）；
+# 3. 对得到的增益逐步提高扫描速度，找出跟踪误差仍在允许范围内的最大扫描速度。
+#
+# 用法：
+#   result = autotune(scan_speed=10.0, surface="sine", noise=0.02)
+#   print(result.summary())
+#
+# 模型与 simulate_tracking 相同：每个控制周期 dt 测量一次，Z 以时间常数 plant_tau
+# 一阶跟随 PID 输出，测量到输出之间有一个周期的延迟。
+
+import math
+
+import numpy as np
+
+from afm_simulator import simulate_tracking, step_response, x_range
+
+# 不稳定（发散或不收敛）时的目标函数值
+UNSTABLE_COST = 1e6
+
+
+class TuningResult:
+    def __init__(self, Kp, Ki, Kd, rms_error, initial, method, scan_speed, evaluations,
+                 max_scan_speed=None, x_len=x_range):
+        self.Kp = Kp
+        self.Ki = Ki
+        self.Kd = Kd
+        self.rms_error = rms_error
+        self.initial = initial  # 辨识得到的初始增益
+        self.method = method
+        self.scan_speed = scan_speed
+        self.evaluations = evaluations
+        self.max_scan_speed = max_scan_speed  # 保持跟踪的最大扫描速度 (μm/s)
+        self.x_len = x_len
+
+    @property
+    def gains(self):
+        return {"Kp": self.Kp, "Ki": self.Ki, "Kd": self.Kd}
+
+    @property
+    def max_line_rate(self):
+        """最大扫描速度对应的行频 (行/s，只算正扫)"""
+        if self.max_scan_speed is None:
+            return None
+        return self.max_scan_speed / self.x_len
+
+    def to_dict(self):
+        d = self.gains
+        d.update(rms_error=self.rms_error, initial=self.initial, method=self.method,
+                 scan_speed=self.scan_speed, evaluations=self.evaluations,
+                 max_scan_speed=self.max_scan_speed, max_line_rate=self.max_line_rate)
+        return d
+
+    def summary(self):
+        text = (f"整定结果 ({self.method}): Kp={self.Kp:.4g} Ki={self.Ki:.4g} Kd={self.Kd:.4g}，"
+                f"扫描速度 {self.scan_speed:g} μm/s 下 RMS 误差 {self.rms_error:.4g} μm"
+                f"（初始 Kp={self.initial['Kp']:.4g} Ki={self.initial['Ki']:.4g} "
+                f"Kd={self.initial['Kd']:.4g}，{self.evaluations} 次模拟）")
+        if self.max_scan_speed is not None:
+            text += f"；最大扫描速度约 {self.max_scan_speed:.3g} μm/s（{self.max_line_rate:.3g} 行/s）"
+        return text
+
+
+# -------------------- 回路辨识 --------------------
+def _alpha(dt, plant_tau):
+    # 一个控制周期内压电管走完的比例（与 simulate_tracking 相同）
+    return 1.0 - math.exp(-dt / plant_tau)
+
+
+def relay_test(dt, plant_tau, h=0.1, samples=400):
+    """继电反馈试验，返回临界增益 Ku 和临界周期 Tu (s)
+
+    输出在 ±h 之间切换，回路进入极限环；Ku = 4h / (π a)，a 为振荡幅值。
+    """
+    alpha = _alpha(dt, plant_tau)
+    z = 0.0
+    zs = np.empty(samples)
+    us = np.empty(samples)
+    for k in range(samples):
+        u = h if z < 0 else -h  # 误差为 0 - z
+        z = z + alpha * (u - z)
+        zs[k] = z
+        us[k] = u
+    tail = slice(samples // 2, samples)  # 只用稳定后的极限环
+    a = (zs[tail].max() - zs[tail].min()) / 2.0
+    switches = np.nonzero(np.diff(np.sign(us[tail])) > 0)[0]
+    if a <= 0 or len(switches) < 2:
+        raise ValueError("继电试验没有形成振荡")
+    Tu = float(np.mean(np.diff(switches))) * dt
+    Ku = 4.0 * h / (math.pi * a)
+    return Ku, Tu
+
+
+def step_test(dt, plant_tau, samples=200, band=0.63):
+    """开环阶跃试验，拟合一阶加纯滞后模型，返回 (增益 K, 时间常数 tau, 滞后 theta)"""
+    alpha = _alpha(dt, plant_tau)
+    z = 0.0
+    zs = np.empty(samples + 1)
+    zs[0] = 0.0
+    for k in range(samples):
+        z = z + alpha * (1.0 - z)
+        zs[k + 1] = z
+    K = zs[-1]
+    # 测量到输出有一个周期的延迟；63% 上升时间减去滞后为时间常数
+    theta = dt
+    k63 = int(np.argmax(zs >= band * K))
+    tau = max(k63 * dt - theta, dt / 10.0)
+    return K, tau, theta
+
+
+def initial_gains(method, dt, plant_tau, tune_kd=False):
+    if method == "relay":
+        # Tyreus-Luyben 规则，比 Ziegler-Nichols 保守，适合有一个周期延迟的采样回路
+        Ku, Tu = relay_test(dt, plant_tau)
+        Kp = Ku / 3.2
+        Ki = Kp / (2.2 * Tu)
+        Kd = Kp * Tu / 6.3 if tune_kd else 0.0
+    elif method == "step":
+        # SIMC 规则，闭环时间常数取滞后 theta
+        K, tau, theta = step_test(dt, plant_tau)
+        tc = theta
+        Kp = tau / (K * (tc + theta))
+        Ki = Kp / min(tau, 4.0 * (tc + theta))
+        Kd = 0.0
+    else:
+        raise ValueError(f"未知整定方法: {method}")
+    return {"Kp": Kp, "Ki": Ki, "Kd": Kd}
+
+
+# -------------------- 数值细化 --------------------
+def nelder_mead(f, x0, step=0.5, max_evals=200, tol=1e-4):
+    """Nelder-Mead 单纯形法求 f 的最小值，返回 (x, f(x), 评估次数)"""
+    x0 = np.asarray(x0, dtype=float)
+    n = len(x0)
+    simplex = [x0] + [x0 + step * np.eye(n)[i] for i in range(n)]
+    values = [f(x) for x in simplex]
+    evals = n + 1
+    while evals < max_evals:
+        order = np.argsort(values)
+        simplex = [simplex[i] for i in order]
+        values = [values[i] for i in order]
+        if abs(values[-1] - values[0]) <= tol * (abs(values[0]) + tol):
+            break
+        centroid = np.mean(simplex[:-1], axis=0)
+        worst = simplex[-1]
+        reflected = centroid + (centroid - worst)
+        fr = f(reflected)
+        evals += 1
+        if fr < values[0]:
+            expanded = centroid + 2.0 * (centroid - worst)
+            fe = f(expanded)
+            evals += 1
+            simplex[-1], values[-1] = (expanded, fe) if fe < fr else (reflected, fr)
+        elif fr < values[-2]:
+            simplex[-1], values[-1] = reflected, fr
+        else:
+            contracted = centroid + 0.5 * (worst - centroid)
+            fc = f(contracted)
+            evals += 1
+            if fc < values[-1]:
+                simplex[-1], values[-1] = contracted, fc
+            else:
+                # 向最好的点收缩
+                best = simplex[0]
+                simplex = [best] + [best + 0.5 * (x - best) for x in simplex[1:]]
+                values = [values[0]] + [f(x) for x in simplex[1:]]
+                evals += n
+    i = int(np.argmin(values))
+    return simplex[i], values[i], evals
+
+
+def tracking_cost(Kp, Ki, Kd, scan_speed, surface="sine", noise=0.02, step=0.1,
+                  plant_tau=0.001, seed=0, skip=5):
+    """RMS 跟踪误差 (μm)，不稳定时返回 UNSTABLE_COST"""
+    dt = step / scan_speed
+    if not math.isfinite(step_response(Kp, Ki, Kd, dt=dt, plant_tau=plant_tau)["settling_time"]):
+        return UNSTABLE_COST
+    _, error = simulate_tracking(Kp=Kp, Ki=Ki, Kd=Kd, step=step, noise=noise, surface=surface,
+                                 scan_speed=scan_speed, plant_tau=plant_tau, seed=seed)
+    rms = float(np.sqrt(np.mean(error[:, skip:] ** 2)))
+    return rms if math.isfinite(rms) else UNSTABLE_COST
+
+
+def max_scan_speed(gains, max_error, surface="sine", noise=0.02, step=0.1, plant_tau=0.001,
+                   seed=0, start=1.0, limit=1e5, iterations=12):
+    """给定增益下 RMS 误差不超过 max_error 的最大扫描速度 (μm/s)，找不到时返回 None
+
+    先按 2 倍递增找到上界，再二分。
+    """
+    def ok(speed):
+        return tracking_cost(scan_speed=speed, surface=surface, noise=noise, step=step,
+                             plant_tau=plant_tau, seed=seed, **gains) <= max_error
+
+    if not ok(start):
+        return None
+    lo, hi = start, start * 2.0
+    while ok(hi):
+        lo, hi = hi, hi * 2.0
+        if hi > limit:
+            return lo
+    for _ in range(iterations):
+        mid = math.sqrt(lo * hi)
+        lo, hi = (mid, hi) if ok(mid) else (lo, mid)
+    return lo
+
+
+def autotune(scan_speed=10.0, surface="sine", noise=0.02, step=0.1, plant_tau=0.001,
+             method="relay", tune_kd=False, max_error=None, seed=0, max_evals=200):
+    """整定 PID 增益
+
+    scan_speed：目标扫描速度 (μm/s)，决定控制周期 dt = step / scan_speed
+    method："relay"（继电反馈）或 "step"（阶跃响应）得到初始增益
+    tune_kd：是否同时整定微分增益（有噪声时通常不需要）
+    max_error：允许的 RMS 跟踪误差 (μm)，给定时估计最大扫描速度；
+               默认取整定后误差的 2 倍
+    """
+    dt = step / scan_speed
+    initial = initial_gains(method, dt, plant_tau, tune_kd)
+    sim = dict(surface=surface, noise=noise, step=step, plant_tau=plant_tau, seed=seed)
+    names = ["Kp", "Ki", "Kd"] if tune_kd else ["Kp", "Ki"]
+
+    # 在对数空间中搜索，保证增益为正，且不同量级的增益步长相当
+    def cost(logs):
+        gains = {"Kp": 0.0, "Ki": 0.0, "Kd": 0.0}
+        gains.update({n: math.exp(v) for n, v in zip(names, logs)})
+        return tracking_cost(scan_speed=scan_speed, **gains, **sim)
+
+    x0 = [math.log(max(initial[n], 1e-6)) for n in names]
+    x, rms, evals = nelder_mead(cost, x0, max_evals=max_evals)
+    gains = {"Kp": 0.0, "Ki": 0.0, "Kd": 0.0}
+    gains.update({n: math.exp(v) for n, v in zip(names, x)})
+    if rms >= UNSTABLE_COST:
+        raise ValueError("没有找到稳定的增益")
+
+    if max_error is None:
+        max_error = 2.0 * rms
+    fastest = max_scan_speed(gains, max_error, start=scan_speed, **sim)
+    return TuningResult(gains["Kp"], gains["Ki"], gains["Kd"], rms, initial, method,
+                        scan_speed, evals, fastest)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PID 增益自动整定（模拟）")
+    parser.add_argument("--scan-speed", type=float, default=10.0, help="扫描速度 (μm/s)")
+    parser.add_argument("--surface", default="sine")
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--step", type=float, default=0.1, help="像素间距 (μm)")
+    parser.add_argument("--plant-tau", type=float, default=0.001, help="压电管时间常数 (s)")
+    parser.add_argument("--method", choices=["relay", "step"], default="relay")
+    parser.add_argument("--tune-kd", action="store_true")
+    parser.add_argument("--max-error", type=float, help="允许的 RMS 跟踪误差 (μm)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = autotune(scan_speed=args.scan_speed, surface=args.surface, noise=args.noise,
+                      step=args.step, plant_tau=args.plant_tau, method=args.method,
+                      tune_kd=args.tune_kd, max_error=args.max_error, seed=args.seed)
+    print(result.summary())
@@ -0,0 +1,214 @@
+# 扫描吞吐量基准测试
+# 让各条采集路径对本地 ANC300 模拟器运行标准尺寸的扫描，统计每像素耗时
+# （中位数和尾部）、每秒命令数和总耗时，结果保存为 JSON 以便不同版本之间对比。
+#
+# 用法：
+#   python benchmark_scan.py --sizes 11 21 --output bench.json
+#   python benchmark_scan.py --compare old.json --output new.json
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import serial
+
+from anc300_emulator import ANC300Emulator
+from anc300_transport import ANC300Transport
+
+# 每边像素数
+STANDARD_SIZES = (11, 21, 41)
+SCAN_RANGE = 50.0  # μm
+
+PATHS = ("scanGUIv1", "scanUI", "testscanv1", "afm_simulator")
+
+
+class PixelTimer:
+    """记录每个像素到位的时刻"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stamps = []
+
+    def __call__(self, *args):
+        self.stamps.append(time.perf_counter())
+
+    def per_pixel(self):
+        return np.diff(np.array([self.start] + self.stamps))
+
+
+def _stats(per_pixel):
+    ms = np.asarray(per_pixel) * 1e3
+    if ms.size == 0:
+        return None
+    return {
+        "median": float(np.median(ms)),
+        "p90": float(np.percentile(ms, 90)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max()),
+        "mean": float(ms.mean()),
+    }
+
+
+@contextlib.contextmanager
+def _quiet():
+    # 扫描脚本每个像素都会 print，测试时丢弃输出
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+# -------------------- 各采集路径 --------------------
+def bench_scangui(emu, n, delay):
+    import scanGUIv1
+    d = SCAN_RANGE / (n - 1)
+    with serial.Serial(emu.device, 9600, timeout=1) as ser, _quiet():
+        timer = PixelTimer()
+        scanGUIv1.run_scan(ANC300Transport(ser), SCAN_RANGE, d, delay, on_move=timer)
+    return timer
+
+
+def bench_scanui(emu, n, delay):
+    import scanUI
+    d = SCAN_RANGE / (n - 1)
+    thread = scanUI.ScanThread(emu.device, SCAN_RANGE, d, delay)
+    timer = PixelTimer()
+    thread.on_pixel = timer
+    thread.run()  # 在当前线程中同步执行
+    return timer
+
+
+def bench_testscan(emu, n, delay):
+    import testscanv1
+    d = SCAN_RANGE / n
+    with serial.Serial(emu.device, 9600, timeout=1) as ser, _quiet():
+        timer = PixelTimer()
+        testscanv1.raster_scan(ANC300Transport(ser), SCAN_RANGE, d, delay, on_pixel=timer)
+    return timer
+
+
+def bench_simulator(n, mode):
+    import afm_simulator
+    saved = afm_simulator.x_points, afm_simulator.y_points
+    afm_simulator.x_points = afm_simulator.y_points = n
+    try:
+        t0 = time.perf_counter()
+        afm_simulator.scan_surface(mode=mode, seed=0)
+        wall = time.perf_counter() - t0
+    finally:
+        afm_simulator.x_points, afm_simulator.y_points = saved
+    return wall
+
+
+def run_benchmarks(paths, sizes, delay, latency, jitter, baudrate, repeat=1):
+    results = []
+    for path in paths:
+        for n in sizes:
+            for _ in range(repeat):
+                if path == "afm_simulator":
+                    for mode in ("reference", "vectorized"):
+                        wall = bench_simulator(n, mode)
+                        pixels = n * n
+                        results.append({
+                            "path": f"afm_simulator[{mode}]", "size": n, "pixels": pixels,
+                            "wall_s": wall, "pixels_per_s": pixels / wall,
+                            "commands": 0, "commands_per_s": 0.0,
+                            # 模拟器整帧计算，只有平均每像素耗时
+                            "per_pixel_ms": {"mean": wall / pixels * 1e3},
+                        })
+                        print(_format(results[-1]), file=sys.stderr)
+                    continue
+
+                emu = ANC300Emulator(latency=latency, jitter=jitter, baudrate=baudrate, seed=0)
+                emu.start()
+                try:
+                    runner = {"scanGUIv1": bench_scangui, "scanUI": bench_scanui,
+                              "testscanv1": bench_testscan}[path]
+                    t0 = time.perf_counter()
+                    timer = runner(emu, n, delay)
+                    wall = time.perf_counter() - t0
+                finally:
+                    emu.stop()
+                pixels = len(timer.stamps)
+                results.append({
+                    "path": path, "size": n, "pixels": pixels,
+                    "wall_s": wall, "pixels_per_s": pixels / wall,
+                    "commands": emu.command_count, "commands_per_s": emu.command_count / wall,
+                    "per_pixel_ms": _stats(timer.per_pixel()),
+                })
+                print(_format(results[-1]), file=sys.stderr)
+    return results
+
+
+def _format(r):
+    pp = r["per_pixel_ms"] or {}
+    tail = f"p99 {pp['p99']:.2f} ms" if "p99" in pp else ""
+    center = pp.get("median", pp.get("mean", float("nan")))
+    return (f"{r['path']:<28} {r['size']:>4}²  {r['wall_s']:8.3f} s  "
+            f"{r['pixels_per_s']:10.1f} px/s  {center:8.3f} ms/px  {tail}")
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """按 (path, size) 对比两次结果的像素速率"""
+    before = {(r["path"], r["size"]): r for r in old["results"]}
+    print(f"{'path':<28} {'size':>5} {'old px/s':>12} {'new px/s':>12} {'ratio':>7}")
+    for r in new["results"]:
+        key = (r["path"], r["size"])
+        if key not in before:
+            continue
+        o = before[key]["pixels_per_s"]
+        print(f"{r['path']:<28} {r['size']:>5} {o:12.1f} {r['pixels_per_s']:12.1f} "
+              f"{r['pixels_per_s'] / o:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描吞吐量基准测试")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(STANDARD_SIZES),
+                        help="每边像素数")
+    parser.add_argument("--delay", type=float, default=0.0, help="每像素停留时间 (s)，默认 0 只测开销")
+    parser.add_argument("--latency", type=float, default=0.001, help="模拟器每条命令处理时间 (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="模拟器处理时间抖动 (s)")
+    parser.add_argument("--baudrate", type=int, default=0, help="模拟串口波特率，0 为不限速")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default="bench_scan.json")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="与以前保存的结果对比")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.paths, args.sizes, args.delay, args.latency,
+                             args.jitter, args.baudrate, args.repeat)
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "emulator": {"latency": args.latency, "jitter": args.jitter, "baudrate": args.baudrate},
+            "delay": args.delay,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已保存到 {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
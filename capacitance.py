@@ -0,0 +1,132 @@
+# 多轴电容测量
+# 电容可以反映定位器是否正常（断线时接近 0，短路或受潮时异常偏大）。
+# 各轴的电容测量在 setm cap 后由各自的模块同时进行，所以先把所有要测的轴切到 cap 模式，
+# 再依次 capw 等待（第一个轴等完后其余轴基本也已完成）、getc 读数，
+# 最后把各轴恢复到原来的模式。测量结果按轴缓存 ttl 秒，扫描前的检查不必每次重测。
+#
+# 用法：
+#   survey = survey_for(session)            # session 为 controller_session.ControllerSession
+#   results = survey.measure([1, 2, 3])     # {轴号: CapacitanceResult}
+#   problems = survey.check([1, 2, 3])      # 超出正常范围的轴
+
+import time
+import weakref
+
+from anc300_transport import ANC300Error
+
+# 结果缓存时间（秒）
+CACHE_TTL = 60.0
+
+# 正常定位器的电容范围 (nF)，超出即报告
+CAP_RANGE = (50.0, 5000.0)
+
+
+class CapacitanceResult:
+    def __init__(self, axis, value=None, unit="nF", error=None, measured_at=None):
+        self.axis = axis
+        self.value = value  # 电容值，测量失败为 None
+        self.unit = unit
+        self.error = error  # 失败原因
+        self.measured_at = time.time() if measured_at is None else measured_at
+
+    @property
+    def ok(self):
+        return self.error is None and self.value is not None
+
+    @property
+    def age(self):
+        return time.time() - self.measured_at
+
+    def __repr__(self):
+        if self.ok:
+            return f"CapacitanceResult(axis={self.axis}, {self.value:g} {self.unit})"
+        return f"CapacitanceResult(axis={self.axis}, error={self.error!r})"
+
+
+class CapacitanceSurvey:
+    """一台控制器的批量电容测量与结果缓存
+
+    session：ControllerSession（需要 command() 和 modes 镜像）
+    ttl：结果有效期（秒）
+    """
+
+    def __init__(self, session, ttl=CACHE_TTL):
+        self.session = session
+        self.ttl = ttl
+        self.cache = {}  # 轴号 -> CapacitanceResult
+
+    def measure(self, axes, max_age=None):
+        """返回各轴的电容；缓存中不超过 max_age（默认 ttl）秒的成功结果直接使用，max_age=0 强制重测"""
+        max_age = self.ttl if max_age is None else max_age
+        axes = list(axes)
+        stale = [a for a in axes
+                 if a not in self.cache or not self.cache[a].ok or self.cache[a].age > max_age]
+        if stale:
+            with self.session:  # 测量和恢复模式期间不允许其他命令插入
+                self.cache.update(self._measure(stale))
+        return {a: self.cache[a] for a in axes}
+
+    def _measure(self, axes):
+        results = {}
+        previous = {}
+        started = []
+        # 1. 记下原模式，所有轴切到 cap 模式（测量随即开始）
+        for axis in axes:
+            try:
+                mode = self.session.modes.get(axis)
+                if mode is None:
+                    mode = self.session.command(f"getm {axis}").values.get("mode")
+                previous[axis] = mode
+                self.session.command(f"setm {axis} cap")  # 已是 cap 模式也重发，开始新的测量
+                started.append(axis)
+            except ANC300Error as e:
+                results[axis] = CapacitanceResult(axis, error=str(e))
+        # 2. 等待并读数：测量同时进行，总时间约等于最慢一个轴
+        for axis in started:
+            try:
+                self.session.command(f"capw {axis}")
+                reply = self.session.command(f"getc {axis}")
+                value = reply.value
+                if not isinstance(value, float):
+                    raise ANC300Error(f"无法解析电容值: {reply.lines}", reply)
+                unit = next(iter(reply.units.values()), "nF")
+                results[axis] = CapacitanceResult(axis, value, unit)
+            except ANC300Error as e:
+                results[axis] = CapacitanceResult(axis, error=str(e))
+        # 3. 恢复原模式（即使测量失败）
+        for axis in started:
+            mode = previous.get(axis)
+            if mode and mode != "cap":
+                try:
+                    self.session.set_mode(axis, mode)
+                except ANC300Error as e:
+                    results[axis].error = results[axis].error or f"恢复模式 {mode} 失败: {e}"
+        return results
+
+    def check(self, axes, low=CAP_RANGE[0], high=CAP_RANGE[1], max_age=None):
+        """返回 {轴号: 问题描述}，全部正常时为空字典"""
+        problems = {}
+        for axis, result in self.measure(axes, max_age).items():
+            if not result.ok:
+                problems[axis] = f"测量失败: {result.error}"
+            elif not low <= result.value <= high:
+                problems[axis] = f"电容 {result.value:g} {result.unit} 超出正常范围 {low:g}~{high:g}"
+        return problems
+
+    def invalidate(self, axes=None):
+        if axes is None:
+            self.cache.clear()
+        else:
+            for axis in axes:
+                self.cache.pop(axis, None)
+
+
+# 每个会话共用一个测量对象（和缓存）
+_surveys = weakref.WeakKeyDictionary()
+
+
+def survey_for(session, ttl=CACHE_TTL):
+    survey = _surveys.get(session)
+    if survey is None:
+        survey = _surveys[session] = CapacitanceSurvey(session, ttl)
+    return survey
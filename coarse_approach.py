@@ -0,0 +1,209 @@
+# 自动粗逼近
+# 交替进行两步，直到在 Z 压电管的行程内检测到表面：
+#   1. Z 检查：Z 压电管偏置电压从 0 逐步升到 z_max（探针伸向样品），每一步读取反馈信号；
+#      信号超过阈值即为接触，立刻把 Z 收回到 0 并停止。
+#   2. 粗调步进：Z 收回后，粗调定位器朝样品方向走一簇 burst 步（stepu/stepd + stepw）。
+# 每簇的位移不超过 Z 行程的 overlap 倍（按每步位移 step_size 换算），
+# 所以即使信号在接触前毫无变化，表面也一定先落在下一次 Z 检查的范围内，不会被一簇步子越过。
+# Z 检查中信号已明显升高（接近表面）时，后续每簇步数再按 shrink 缩小，直到 min_burst。
+# 每个阶段的步数和耗时都记入日志，便于比较和调参。
+#
+# 反馈信号（偏折、振幅或隧道电流等）不经过 ANC300，由 read_signal() 提供。
+#
+# 用法：
+#   approach = CoarseApproach(coarse_session, scan_session, read_signal,
+#                             coarse_axis=3, z_axis=3, z_travel=5.0, step_size=0.02,
+#                             threshold=0.5)
+#   result = approach.run()
+#   print(result.summary())
+
+import threading
+import time
+
+from anc300_transport import ANC300Error
+from scan_log import ScanLog
+
+
+class ApproachResult:
+    def __init__(self, contact, total_steps, contact_z, elapsed, phases, reason=""):
+        self.contact = contact          # 是否检测到接触
+        self.total_steps = total_steps  # 粗调总步数
+        self.contact_z = contact_z      # 接触时的 Z 偏置电压 (V)
+        self.elapsed = elapsed          # 总耗时 (s)
+        self.phases = phases            # 每个阶段的记录
+        self.reason = reason            # 未接触时的停止原因
+
+    def time_in(self, phase):
+        return sum(p["duration"] for p in self.phases if p["phase"] == phase)
+
+    def summary(self):
+        bursts = [p for p in self.phases if p["phase"] == "burst"]
+        text = (f"粗逼近{'完成：检测到接触' if self.contact else '停止：' + self.reason}，"
+                f"共 {self.total_steps} 步 / {len(bursts)} 簇，用时 {self.elapsed:.1f}s"
+                f"（步进 {self.time_in('burst'):.1f}s，Z 检查 {self.time_in('z_check'):.1f}s）")
+        if self.contact:
+            text += f"，接触时 Z = {self.contact_z:.2f} V"
+        return text
+
+
+class CoarseApproach:
+    """粗调定位器 + Z 压电管的自动逼近
+
+    coarse、z：ControllerSession（可以是同一个，此时 coarse_axis 和 z_axis 必须不同），
+               分别控制粗调轴 coarse_axis 和 Z 压电管 z_axis
+    read_signal()：返回当前反馈信号
+    z_travel：Z 压电管偏置从 0 到 z_max 的伸长 (μm)
+    step_size：粗调定位器朝样品方向每步的位移 (μm)，取偏大的估计更安全
+    overlap：每簇位移最多为 Z 行程的多少倍（小于 1，留出余量）
+    threshold：判定接触的信号阈值；near_fraction * threshold 以上视为接近表面，开始缩小步簇
+    z_max / z_points：Z 检查的最大偏置电压 (V) 和点数
+    max_burst / min_burst / shrink：每簇步数的初值、下限和接近表面时的缩小倍数；
+                                   max_burst 和 min_burst 都不超过 Z 行程对应的步数
+    direction："up"（stepu）或 "down"（stepd），朝向样品的方向
+    max_steps：总步数上限，超过后停止（防止在没有样品时一直走下去）
+    """
+
+    def __init__(self, coarse, z, read_signal, coarse_axis, z_axis, z_travel, step_size,
+                 overlap=0.5, threshold=1.0, near_fraction=0.3, z_max=60.0, z_points=30, z_settle=0.002,
+                 max_burst=1000, min_burst=10, shrink=0.5, frequency=1000, amplitude=30.0,
+                 direction="up", max_steps=200000, scan_log=None):
+        if direction not in ("up", "down"):
+            raise ValueError(f"未知方向: {direction}")
+        if not 0 < overlap < 1:
+            raise ValueError(f"overlap 应在 0 和 1 之间: {overlap}")
+        # Z 行程内能容纳的步数，每簇不能超过
+        travel_steps = int(overlap * z_travel / step_size)
+        if travel_steps < 1:
+            raise ValueError(f"Z 行程 {z_travel} μm 不足一步 ({step_size} μm)，无法安全逼近")
+        if coarse is z and coarse_axis == z_axis:
+            # 同一个轴不能既是 stp 模式的粗调轴又是 off 模式的 Z 压电管
+            raise ValueError(f"粗调轴和 Z 轴不能是同一控制器的同一个轴 ({coarse_axis})")
+        self.coarse = coarse
+        self.z = z
+        self.read_signal = read_signal
+        self.coarse_axis = coarse_axis
+        self.z_axis = z_axis
+        self.threshold = threshold
+        self.near_fraction = near_fraction
+        self.z_max = z_max
+        self.z_points = z_points
+        self.z_settle = z_settle
+        self.z_travel = z_travel
+        self.step_size = step_size
+        self.max_burst = min(max_burst, travel_steps)
+        self.min_burst = min(min_burst, self.max_burst)
+        self.shrink = shrink
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.step_cmd = "stepu" if direction == "up" else "stepd"
+        self.max_steps = max_steps
+        self.scan_log = scan_log if scan_log is not None else ScanLog()
+        self.phases = []
+        self._stop_event = threading.Event()
+
+    def log(self, msg, **fields):
+        self.scan_log.log(msg, **fields)
+
+    def stop(self):
+        """请求停止（可从其他线程调用），当前阶段结束后生效"""
+        self._stop_event.set()
+
+    # -------------------- 各阶段 --------------------
+    def _phase(self, phase, started, **fields):
+        record = {"phase": phase, "duration": time.monotonic() - started}
+        record.update(fields)
+        self.phases.append(record)
+        return record
+
+    def _setup(self):
+        t0 = time.monotonic()
+        self.coarse.set_mode(self.coarse_axis, "stp")
+        self.coarse.command(f"setf {self.coarse_axis} {int(self.frequency)}")
+        self.coarse.command(f"setv {self.coarse_axis} {self.amplitude:.3f}")
+        self.z.set_mode(self.z_axis, "off")
+        self.z.set_offset(self.z_axis, 0.0)
+        self._phase("setup", t0)
+
+    def _z_check(self):
+        """Z 从 0 伸到 z_max，返回 (接触时的 Z 电压或 None, 检查中的最大信号)"""
+        t0 = time.monotonic()
+        peak = float("-inf")
+        contact = None
+        for k in range(1, self.z_points + 1):
+            volts = self.z_max * k / self.z_points
+            self.z.set_offset(self.z_axis, volts)
+            if self.z_settle:
+                time.sleep(self.z_settle)
+            signal = self.read_signal()
+            peak = max(peak, signal)
+            if signal >= self.threshold:
+                contact = volts
+                break
+        self._retract()
+        record = self._phase("z_check", t0, points=k, peak=peak, contact_z=contact)
+        self.log(f"Z 检查: {k} 点，最大信号 {peak:.4g}，用时 {record['duration'] * 1000:.0f}ms",
+                 **record)
+        return contact, peak
+
+    def _retract(self):
+        self.z.set_offset(self.z_axis, 0.0)
+
+    def _burst(self, steps):
+        t0 = time.monotonic()
+        self.coarse.command(f"{self.step_cmd} {self.coarse_axis} {steps}")
+        # stepw 的等待时间与步数成正比
+        self.coarse.command(f"stepw {self.coarse_axis}",
+                            timeout=max(self.coarse.timeout, 2.0 * steps / self.frequency + 1.0))
+        record = self._phase("burst", t0, steps=steps)
+        self.log(f"步进 {steps} 步，用时 {record['duration'] * 1000:.0f}ms", **record)
+
+    def _safe_stop(self):
+        # 逼近结束时（接触、出错或中止）：停止步进，收回 Z，粗调轴接地
+        for action in (lambda: self.coarse.command(f"stop {self.coarse_axis}"),
+                       self._retract,
+                       lambda: self.coarse.set_mode(self.coarse_axis, "gnd")):
+            try:
+                action()
+            except ANC300Error as e:
+                self.log(f"安全停止时出错: {e}", level="error")
+
+    # -------------------- 主流程 --------------------
+    def run(self):
+        self._stop_event.clear()
+        self.phases = []
+        start = time.monotonic()
+        total = 0
+        burst = self.max_burst
+        contact = None
+        reason = ""
+        try:
+            self._setup()
+            while True:
+                contact, peak = self._z_check()
+                if contact is not None:
+                    self.log(f"检测到接触：Z = {contact:.2f} V，已收回 Z")
+                    break
+                if self._stop_event.is_set():
+                    reason = "用户中止"
+                    break
+                if total >= self.max_steps:
+                    reason = f"达到步数上限 {self.max_steps}"
+                    break
+                if peak >= self.near_fraction * self.threshold and burst > self.min_burst:
+                    burst = max(self.min_burst, int(burst * self.shrink))
+                    self.log(f"信号升高（{peak:.4g}），步簇缩小到 {burst} 步", burst=burst)
+                steps = min(burst, self.max_steps - total)
+                self._burst(steps)
+                total += steps
+        except ANC300Error as e:
+            reason = f"控制器通信错误: {e}"
+            self.log(reason, level="error")
+        finally:
+            # 任何结果（包括接触、read_signal 抛出的异常和 KeyboardInterrupt）都要停止步进、
+            # 收回 Z、粗调轴接地（接触后接地防止漂移）；清理出错只记入日志
+            self._safe_stop()
+        result = ApproachResult(contact is not None, total, contact, time.monotonic() - start,
+                                list(self.phases), reason)
+        self.log(result.summary(), total_steps=total, contact=result.contact,
+                 elapsed=result.elapsed)
+        return result
@@ -0,0 +1,202 @@
+# 定频控制回路
+# 以目标频率反复执行 读取测量值 → PID → 输出，每次用实际测得的时间间隔作为 dt，
+# 而不是固定的 0.01 s。同时记录每个周期的抖动、超时和执行时间，
+# 用来证明 Z 反馈回路能否保持设定频率，以及离极限还有多少余量。
+#
+# 用法：
+#   loop = ControlLoop(pid, read=读取函数, write=输出函数, rate=1000)
+#   stats = loop.run(duration=5.0)
+#   print(stats.summary())
+
+import threading
+import time
+
+import numpy as np
+
+# 短于该时间的等待用忙等，避免 time.sleep 的调度误差
+SPIN_THRESHOLD = 0.002
+
+
+class LoopStats:
+    """控制回路的时序统计
+
+    记录最近 capacity 个周期的实际周期、执行时间和抖动（实际周期 - 目标周期）；
+    执行时间超过目标周期的周期记为超时。
+    """
+
+    def __init__(self, period, capacity=100000):
+        self.period = period
+        self.capacity = capacity
+        self.intervals = np.zeros(capacity)
+        self.exec_times = np.zeros(capacity)
+        self.count = 0
+        self.overruns = 0
+        self.missed = 0  # 因超时被跳过的周期数
+
+    def add(self, interval, exec_time):
+        i = self.count % self.capacity
+        self.intervals[i] = interval
+        self.exec_times[i] = exec_time
+        self.count += 1
+        if exec_time > self.period:
+            self.overruns += 1
+
+    def _recorded(self, arr):
+        return arr[:min(self.count, self.capacity)]
+
+    @property
+    def jitter(self):
+        # 第一个周期没有前一周期，不计入
+        return self._recorded(self.intervals)[1:] - self.period
+
+    @property
+    def rate(self):
+        intervals = self._recorded(self.intervals)[1:]
+        return 1.0 / intervals.mean() if intervals.size else 0.0
+
+    @property
+    def utilization(self):
+        """执行时间占目标周期的比例（中位数），接近 1 说明已到极限"""
+        exec_times = self._recorded(self.exec_times)
+        return float(np.median(exec_times)) / self.period if exec_times.size else 0.0
+
+    def histogram(self, which="exec", bins=20):
+        """返回 (计数, 区间边界)；which 为 "exec"（执行时间）或 "jitter"（抖动）"""
+        data = self._recorded(self.exec_times) if which == "exec" else self.jitter
+        return np.histogram(data, bins=bins)
+
+    def to_dict(self):
+        exec_times = self._recorded(self.exec_times)
+        jitter = np.abs(self.jitter)
+
+        def pct(arr, q):
+            return float(np.percentile(arr, q)) if arr.size else 0.0
+
+        return {
+            "cycles": self.count,
+            "target_hz": 1.0 / self.period,
+            "rate_hz": self.rate,
+            "overruns": self.overruns,
+            "missed": self.missed,
+            "utilization": self.utilization,
+            "exec_p50_s": pct(exec_times, 50),
+            "exec_p99_s": pct(exec_times, 99),
+            "exec_max_s": float(exec_times.max()) if exec_times.size else 0.0,
+            "jitter_p50_s": pct(jitter, 50),
+            "jitter_p99_s": pct(jitter, 99),
+            "jitter_max_s": float(jitter.max()) if jitter.size else 0.0,
+        }
+
+    def summary(self):
+        d = self.to_dict()
+        return (f"控制回路: {d['cycles']} 周期，目标 {d['target_hz']:.0f} Hz，实际 {d['rate_hz']:.1f} Hz；"
+                f"执行时间 p50 {d['exec_p50_s'] * 1e6:.0f}μs / p99 {d['exec_p99_s'] * 1e6:.0f}μs"
+                f"（占周期 {d['utilization'] * 100:.0f}%）；"
+                f"抖动 p99 {d['jitter_p99_s'] * 1e6:.0f}μs / 最大 {d['jitter_max_s'] * 1e6:.0f}μs；"
+                f"超时 {d['overruns']} 次，跳过 {d['missed']} 个周期")
+
+    def format_histogram(self, which="exec", bins=10, width=40):
+        """文本直方图，单位 μs"""
+        counts, edges = self.histogram(which, bins)
+        peak = max(counts.max(), 1) if counts.size else 1
+        lines = []
+        for c, lo, hi in zip(counts, edges[:-1], edges[1:]):
+            bar = "#" * int(round(width * c / peak))
+            lines.append(f"{lo * 1e6:9.1f} ~ {hi * 1e6:9.1f} μs | {bar} {c}")
+        return "\n".join(lines)
+
+
+class ControlLoop:
+    """以固定频率驱动 PID
+
+    pid：afm_simulator.PIDController（或任何有 update(setpoint, measured, dt) 的对象）
+    read()：返回当前测量值
+    write(output)：输出 PID 结果
+    rate：目标频率 (Hz)
+    周期按绝对时间排定，不累积误差；某个周期超时后直接跳到下一个未来的周期，
+    被跳过的周期计入 stats.missed。
+    """
+
+    def __init__(self, pid, read, write, rate=1000.0, setpoint=0.0, capacity=100000):
+        self.pid = pid
+        self.read = read
+        self.write = write
+        self.period = 1.0 / rate
+        self.setpoint = setpoint
+        self.stats = LoopStats(self.period, capacity)
+        self._stop_event = threading.Event()
+
+    def run(self, duration=None, cycles=None):
+        """运行到 duration 秒、cycles 个周期或 stop() 为止，返回 LoopStats"""
+        self._stop_event.clear()
+        clock = time.perf_counter
+        start = clock()
+        next_time = start
+        last = None
+        n = 0
+        while not self._stop_event.is_set():
+            if cycles is not None and n >= cycles:
+                break
+            if duration is not None and next_time - start >= duration:
+                break
+            _wait_until(next_time, clock)
+            t0 = clock()
+            dt = t0 - last if last is not None else self.period  # 实测时间间隔
+            measured = self.read()
+            self.write(self.pid.update(self.setpoint, measured, dt))
+            t1 = clock()
+            self.stats.add(dt, t1 - t0)
+            last = t0
+            n += 1
+            next_time += self.period
+            if t1 > next_time:
+                # 已经错过下一个周期：跳到未来最近的周期，不补跑
+                skipped = int((t1 - next_time) / self.period) + 1
+                self.stats.missed += skipped
+                next_time += skipped * self.period
+        return self.stats
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _wait_until(deadline, clock):
+    # 先睡到截止前 SPIN_THRESHOLD，再忙等
+    remaining = deadline - clock()
+    if remaining > SPIN_THRESHOLD:
+        time.sleep(remaining - SPIN_THRESHOLD)
+    while clock() < deadline:
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from afm_simulator import PIDController, sample_surface
+
+    parser = argparse.ArgumentParser(description="控制回路时序测试（模拟测量）")
+    parser.add_argument("--rate", type=float, default=1000.0, help="目标频率 (Hz)")
+    parser.add_argument("--duration", type=float, default=2.0, help="运行时间 (s)")
+    parser.add_argument("--load", type=float, default=0.0, help="每周期额外的模拟计算时间 (s)")
+    args = parser.parse_args()
+
+    pid = PIDController(Kp=0.5, Ki=50.0, integral_limit=1.0, output_limits=(-1.0, 1.0))
+    state = {"z": 0.0, "x": 0.0}
+
+    def read():
+        # 探针沿 X 匀速移动，测量值为 Z 位置与表面高度之差
+        state["x"] = (state["x"] + 0.001) % 5.0
+        if args.load:
+            _wait_until(time.perf_counter() + args.load, time.perf_counter)
+        return state["z"] - sample_surface(state["x"], 0.0)
+
+    def write(output):
+        state["z"] = output
+
+    loop = ControlLoop(pid, read, write, rate=args.rate, setpoint=0.0)
+    stats = loop.run(duration=args.duration)
+    print(stats.summary())
+    print("执行时间分布:")
+    print(stats.format_histogram("exec"))
+    print("抖动分布:")
+    print(stats.format_histogram("jitter"))
@@ -0,0 +1,284 @@
+# 控制器会话管理
+# 每台控制器保持一个长期打开的串口连接，供检测串口、扫描等操作共用：
+#   - 空闲时定期发送 ver 作为心跳，连接断开时自动重连
+#   - 记录各轴已知的模式和偏置电压，已经是目标模式的 setm 直接跳过
+# 连续扫描无需重新打开串口、重新初始化。
+#
+# 用法：
+#   sessions = SessionManager()
+#   session = sessions.get("/dev/ttyUSB0")
+#   with session:                      # 独占使用（扫描期间心跳暂停）
+#       session.set_mode(1, "off")     # 已是 off 时不发送
+#       pipeline = session.pipeline(window=4)
+#       pipeline.run(["seta 1 10.000", "seta 2 5.000"])
+
+import threading
+import time
+
+import serial
+
+from anc300_transport import ANC300Error, ANC300Timeout, ANC300Transport, CommandPipeline
+
+
+class ControllerSession:
+    """一台控制器的持久连接
+
+    keepalive：空闲多少秒后发送一次心跳，None 表示不发送
+    所有命令都在会话锁内执行；用 with session: 可以在一段操作期间独占连接。
+    """
+
+    def __init__(self, port, baudrate=9600, timeout=1.0, keepalive=5.0, log=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.log = log or (lambda msg: None)
+        self.transport = None
+        self.modes = {}    # 轴号 -> 已知模式
+        self.offsets = {}  # 轴号 -> 已知偏置电压
+        self.reconnects = 0
+        self.skipped = 0   # 因模式已知而省去的 setm 次数
+        self._lock = threading.RLock()
+        self._last_used = 0.0
+        self._closed = False
+        self._keepalive_thread = None
+
+    # -------------------- 连接 --------------------
+    def open(self):
+        with self._lock:
+            self._connect()
+        if self.keepalive and self._keepalive_thread is None:
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True,
+                                                      name=f"keepalive-{self.port}")
+            self._keepalive_thread.start()
+        return self
+
+    def _connect(self):
+        ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+        transport = ANC300Transport(ser, timeout=self.timeout)
+        try:
+            transport.command("ver")  # 确认对端是 ANC300
+        except ANC300Error:
+            transport.close()
+            raise
+        self.transport = transport
+        self._last_used = time.monotonic()
+
+    def _disconnect(self):
+        # 连接状态未知：关闭串口并清空镜像，下次使用时重连
+        if self.transport is not None:
+            try:
+                self.transport.close()
+            except (serial.SerialException, OSError):
+                pass
+        self.transport = None
+        self.invalidate()
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            self._disconnect()
+
+    @property
+    def connected(self):
+        return self.transport is not None
+
+    def ensure_connected(self):
+        with self._lock:
+            if self.transport is None:
+                if self._closed:
+                    raise ANC300Error(f"会话 {self.port} 已关闭")
+                self._connect()
+                self.reconnects += 1
+                self.log(f"已重新连接 {self.port}")
+            return self.transport
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self.ensure_connected()
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._last_used = time.monotonic()
+        self._lock.release()
+
+    @property
+    def busy(self):
+        """是否正被其他线程独占使用"""
+        if not self._lock.acquire(blocking=False):
+            return True
+        self._lock.release()
+        return False
+
+    def healthy(self):
+        """发送 ver 检查连接，失败时断开（下次使用自动重连）"""
+        with self._lock:
+            try:
+                self.command("ver")
+                return True
+            except (ANC300Error, serial.SerialException, OSError):
+                return False
+
+    def _keepalive_loop(self):
+        while not self._closed:
+            time.sleep(min(self.keepalive, 1.0))
+            if time.monotonic() - self._last_used < self.keepalive:
+                continue
+            # 正在被独占使用（如扫描中）说明连接在工作，不打扰
+            if not self._lock.acquire(blocking=False):
+                continue
+            try:
+                if self._closed:
+                    break
+                if self.transport is None:
+                    try:
+                        self.ensure_connected()
+                    except (ANC300Error, serial.SerialException, OSError):
+                        pass
+                elif not self.healthy():
+                    self.log(f"{self.port} 心跳失败，连接已断开")
+                self._last_used = time.monotonic()
+            finally:
+                self._lock.release()
+
+    # -------------------- 命令 --------------------
+    def command(self, cmd, timeout=None, check=True):
+        """执行一条命令；串口出错或超时时断开连接并抛出 ANC300Error"""
+        with self._lock:
+            transport = self.ensure_connected()
+            try:
+                reply = transport.command(cmd, timeout=timeout, check=check)
+            except (serial.SerialException, OSError) as e:
+                self._disconnect()
+                raise ANC300Error(f"{self.port} 通信失败: {e}") from e
+            except ANC300Timeout:
+                self._disconnect()  # 超时后回应可能错位，连接状态不可信
+                raise
+            finally:
+                self._last_used = time.monotonic()
+            if reply.ok:
+                self._track(cmd)
+            return reply
+
+    def pipeline(self, window=4):
+        """返回共用本连接的命令流水线，执行的 setm/seta 同样更新镜像"""
+        return _SessionPipeline(self, window)
+
+    def set_mode(self, axis, mode):
+        """设置轴模式，已知已是该模式时不发送；返回是否实际发送"""
+        if self.modes.get(axis) == mode:
+            self.skipped += 1
+            return False
+        self.command(f"setm {axis} {mode}")
+        return True
+
+    def set_offset(self, axis, volts):
+        self.command(f"seta {axis} {volts:.3f}")
+
+    def refresh(self, axes):
+        """从控制器读取各轴模式和偏置电压，更新镜像"""
+        for axis in axes:
+            self.modes[axis] = self.command(f"getm {axis}").values.get("mode")
+            self.offsets[axis] = self.command(f"geta {axis}").value
+
+    def invalidate(self, axis=None):
+        if axis is None:
+            self.modes.clear()
+            self.offsets.clear()
+        else:
+            self.modes.pop(axis, None)
+            self.offsets.pop(axis, None)
+
+    def _track(self, cmd):
+        parts = cmd.split()
+        if len(parts) != 3:
+            return
+        name, axis, value = parts
+        try:
+            axis = int(axis)
+        except ValueError:
+            return
+        if name == "setm":
+            self.modes[axis] = value
+        elif name == "seta":
+            self.offsets[axis] = float(value)
+
+
+class _SessionPipeline(CommandPipeline):
+    def __init__(self, session, window):
+        super().__init__(session.ensure_connected(), window)
+        self.session = session
+
+    def submit(self, cmd):
+        try:
+            super().submit(cmd)
+        except (serial.SerialException, OSError) as e:
+            self._lost(e)
+
+    def _collect_one(self):
+        cmd = self._pending[0]
+        try:
+            super()._collect_one()
+        except (serial.SerialException, OSError) as e:
+            self._lost(e)
+        except ANC300Timeout:
+            self.session._disconnect()
+            raise
+        except ANC300Error:
+            self.session.invalidate()
+            raise
+        self.session._track(cmd)
+
+    def _lost(self, error):
+        self._pending = []
+        self.session._disconnect()
+        raise ANC300Error(f"{self.session.port} 通信失败: {error}") from error
+
+
+class SessionManager:
+    """按串口名管理会话，同一串口只打开一次"""
+
+    def __init__(self, baudrate=9600, timeout=1.0, keepalive=5.0, log=None):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.log = log
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, port):
+        """返回 port 的会话，尚未打开时打开（失败抛出 ANC300Error 或 serial.SerialException）"""
+        with self._lock:
+            session = self._sessions.get(port)
+            if session is None:
+                session = ControllerSession(port, self.baudrate, self.timeout, self.keepalive,
+                                            self.log).open()
+                self._sessions[port] = session
+            return session
+
+    def ports(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def healthy_port(self):
+        """已打开且心跳正常的第一个串口（正在使用中的视为正常），没有则返回 None"""
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for port, session in sessions:
+            if session.busy or session.healthy():
+                return port
+        return None
+
+    def close(self, port):
+        with self._lock:
+            session = self._sessions.pop(port, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        for port in self.ports():
+            self.close(port)
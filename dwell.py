@@ -0,0 +1,141 @@
+# 按步长自适应的停留时间调度
+# 固定停留时间只能按最大跳变（行末折返）来设，其余小步长像素都在白等。
+# 这里用一阶（指数）稳定模型，根据每步电压变化量计算需要的停留时间：
+#   t = dead_time + tau * ln(|ΔV| / tolerance)
+# 并可以用实测的阶跃响应标定 tau 和 dead_time。
+
+import json
+import os
+
+import numpy as np
+
+# 标定结果的默认保存位置
+CALIBRATION_PATH = os.path.join(os.path.expanduser("~"), ".kpfm_control", "settling.json")
+
+
+class SettlingModel:
+    """压电管一阶稳定模型
+
+    tau：时间常数 (s)
+    tolerance：认为已稳定的剩余误差 (V)
+    dead_time：响应开始前的纯延迟 (s)
+    """
+
+    def __init__(self, tau=0.01, tolerance=0.005, dead_time=0.0):
+        self.tau = tau
+        self.tolerance = tolerance
+        self.dead_time = dead_time
+
+    def settle_time(self, step):
+        """电压变化 step (V) 后稳定到 tolerance 以内所需的时间，step 可以是数组"""
+        step = np.abs(np.asarray(step, dtype=float))
+        ratio = np.maximum(step / self.tolerance, 1.0)
+        t = np.where(step > 0, self.dead_time + self.tau * np.log(ratio), 0.0)
+        return float(t) if t.ndim == 0 else t
+
+    @classmethod
+    def fit(cls, responses, tolerance=0.005, noise_floor=None):
+        """用实测阶跃响应标定模型
+
+        responses：[(times, values, start, target), ...]，times 从命令发出时刻算起 (s)，
+                   values 为对应时刻的实测位置（换算成电压）
+        noise_floor：低于该剩余误差的点不参与拟合，默认取 tolerance / 2
+        对每条响应拟合 ln(剩余误差 / 步长) = -(t - dead_time) / tau，所有响应合并做最小二乘。
+        """
+        floor = tolerance / 2.0 if noise_floor is None else noise_floor
+        ts, logs = [], []
+        for times, values, start, target in responses:
+            step = abs(target - start)
+            if step <= floor:
+                continue
+            err = np.abs(target - np.asarray(values, dtype=float))
+            keep = (err > floor) & (err < step)
+            ts.append(np.asarray(times, dtype=float)[keep])
+            logs.append(np.log(err[keep] / step))
+        if not ts or sum(len(t) for t in ts) < 2:
+            raise ValueError("阶跃响应数据不足，无法标定")
+        t = np.concatenate(ts)
+        y = np.concatenate(logs)
+        slope, intercept = np.polyfit(t, y, 1)
+        if slope >= 0:
+            raise ValueError("阶跃响应没有衰减，无法标定")
+        tau = -1.0 / float(slope)
+        dead_time = max(0.0, float(intercept) * tau)
+        return cls(tau=tau, tolerance=tolerance, dead_time=dead_time)
+
+    def to_dict(self):
+        return {"tau": self.tau, "tolerance": self.tolerance, "dead_time": self.dead_time}
+
+    def save(self, path=CALIBRATION_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path=CALIBRATION_PATH, log=print):
+        """读取标定结果；文件不存在、损坏或内容不符时返回默认模型（后两种情况记日志）"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError, TypeError) as e:
+            log(f"读取稳定时间标定 {path} 失败，使用默认模型: {e}")
+            return cls()
+
+
+class DwellScheduler:
+    """根据 X/Y 电压变化量给出每个像素的停留时间
+
+    fixed_dwell：原来的固定停留时间，用作上限和节省时间的比较基准
+    min_dwell：每个像素至少停留的时间（如测量积分时间）
+    第一个像素之前的位置未知，按 fixed_dwell 停留。
+    """
+
+    def __init__(self, model, fixed_dwell, min_dwell=0.0):
+        self.model = model
+        self.fixed_dwell = fixed_dwell
+        self.min_dwell = min_dwell
+        self._prev = None
+        self.report = DwellReport(fixed_dwell)
+
+    def dwell(self, *volts):
+        """传入本像素各轴的电压，返回应停留的时间 (s)"""
+        if self._prev is None:
+            t = self.fixed_dwell
+        else:
+            step = max(abs(v - p) for v, p in zip(volts, self._prev))
+            t = min(self.fixed_dwell, max(self.min_dwell, self.model.settle_time(step)))
+        self._prev = volts
+        self.report.add(t)
+        return t
+
+    def reset(self):
+        self._prev = None
+        self.report = DwellReport(self.fixed_dwell)
+
+
+class DwellReport:
+    """统计自适应停留相对固定停留节省的时间"""
+
+    def __init__(self, fixed_dwell):
+        self.fixed_dwell = fixed_dwell
+        self.pixels = 0
+        self.total = 0.0
+
+    def add(self, t):
+        self.pixels += 1
+        self.total += t
+
+    @property
+    def fixed_total(self):
+        return self.pixels * self.fixed_dwell
+
+    @property
+    def saved(self):
+        return self.fixed_total - self.total
+
+    def summary(self):
+        frac = self.saved / self.fixed_total * 100 if self.fixed_total > 0 else 0.0
+        return (f"停留时间: 自适应 {self.total:.1f}s / 固定 {self.fixed_total:.1f}s，"
+                f"{self.pixels} 个像素，节省 {self.saved:.1f}s ({frac:.0f}%)")
@@ -0,0 +1,167 @@
+# PID 与扫描参数的批量模拟
+# 给定增益、像素间距、噪声和表面的组合网格，在多个进程中并行运行闭环跟踪模拟
+# (afm_simulator.simulate_tracking)，每个组合得到 RMS 跟踪误差、阶跃过冲和稳定时间，
+# 汇总成一张表。每个组合的随机种子由总种子按组合序号派生，结果与进程数和完成顺序无关。
+#
+# 用法：
+#   configs = make_grid(Kp=[0.1, 0.3], Ki=[20, 50], noise=[0.01, 0.02])
+#   rows = run_ensemble(configs, seed=0)
+#   print(format_table(rows))
+#
+# 命令行：python ensemble.py --Kp 0.1 0.3 --Ki 20 50 --noise 0.01 0.02 --output sweep.csv
+
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from afm_simulator import simulate_tracking, step_response
+
+# 每个组合的默认参数（与 simulate_tracking 一致）
+DEFAULTS = {
+    "Kp": 2.0, "Ki": 0.0, "Kd": 0.0,
+    "step": 0.1, "noise": 0.02, "surface": "sine",
+    "scan_speed": 10.0, "plant_tau": 0.001,
+}
+
+# 结果表的列顺序
+COLUMNS = ["index", "Kp", "Ki", "Kd", "step", "noise", "surface", "scan_speed", "plant_tau",
+           "seed", "rms_error", "max_error", "overshoot", "settling_time", "stable", "elapsed_s"]
+
+# RMS 误差超过该值（μm）或出现非有限值时认为回路不稳定
+UNSTABLE_ERROR = 10.0
+
+
+def make_grid(**params):
+    """各参数取值列表的笛卡尔积，返回组合列表；未给出的参数取 DEFAULTS"""
+    for name in params:
+        if name not in DEFAULTS:
+            raise ValueError(f"未知参数: {name}")
+    names = list(params)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in params.values()]
+    configs = []
+    for combo in itertools.product(*values):
+        config = dict(DEFAULTS)
+        config.update(zip(names, combo))
+        configs.append(config)
+    return configs
+
+
+def run_config(config):
+    """运行一个组合，返回一行结果（进程池的工作函数，须在模块顶层）"""
+    t0 = time.perf_counter()
+    sim = {k: config[k] for k in DEFAULTS}
+    height, error = simulate_tracking(seed=config["seed"], **sim)
+    # 每行开头 Z 从 0 开始接近表面，不计入跟踪误差
+    settle_cols = min(error.shape[1] // 10, 5)
+    error = error[:, settle_cols:]
+    rms = float(np.sqrt(np.mean(error ** 2)))
+    max_error = float(np.max(np.abs(error)))
+    step = step_response(config["Kp"], config["Ki"], config["Kd"],
+                         dt=config["step"] / config["scan_speed"], plant_tau=config["plant_tau"])
+    row = dict(config)
+    row.update(
+        rms_error=rms,
+        max_error=max_error,
+        overshoot=step["overshoot"],
+        settling_time=step["settling_time"],
+        stable=bool(np.isfinite(rms) and rms < UNSTABLE_ERROR and np.isfinite(step["settling_time"])),
+        elapsed_s=time.perf_counter() - t0,
+    )
+    return row
+
+
+def run_ensemble(configs, seed=0, workers=None, chunksize=None, progress=None):
+    """并行运行所有组合，按组合顺序返回结果行
+
+    seed：总种子，第 i 个组合的种子由 SeedSequence(seed).spawn 的第 i 个子序列派生
+    workers：进程数，默认为 CPU 核数；1 时在当前进程中顺序运行（便于调试）
+    progress(done, total)：每完成一个组合调用一次
+    """
+    children = np.random.SeedSequence(seed).spawn(len(configs))
+    jobs = []
+    for i, (config, child) in enumerate(zip(configs, children)):
+        job = dict(config)
+        job["index"] = i
+        job["seed"] = int(child.generate_state(1)[0])
+        jobs.append(job)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        rows = []
+        for job in jobs:
+            rows.append(run_config(job))
+            if progress:
+                progress(len(rows), len(jobs))
+        return rows
+
+    # 每个任务只有几毫秒，按块分发以减少进程间通信
+    chunksize = chunksize or max(1, len(jobs) // (workers * 4))
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row in pool.map(run_config, jobs, chunksize=chunksize):
+            rows.append(row)
+            if progress:
+                progress(len(rows), len(jobs))
+    return rows
+
+
+def best(rows, key="rms_error"):
+    """稳定组合中 key 最小的一行，没有稳定组合时返回 None"""
+    stable = [r for r in rows if r["stable"]]
+    return min(stable, key=lambda r: r[key]) if stable else None
+
+
+def write_table(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_table(rows, columns=("Kp", "Ki", "Kd", "step", "noise", "surface",
+                                "rms_error", "overshoot", "settling_time", "stable")):
+    def fmt(v):
+        if isinstance(v, float):
+            return f"{v:.4g}"
+        return str(v)
+
+    cells = [[fmt(r[c]) for c in columns] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) if cells else len(c)
+              for i, c in enumerate(columns)]
+    lines = ["  ".join(c.rjust(w) for c, w in zip(columns, widths))]
+    lines += ["  ".join(v.rjust(w) for v, w in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PID/扫描参数批量模拟")
+    parser.add_argument("--Kp", type=float, nargs="+", default=[0.1, 0.3, 0.5])
+    parser.add_argument("--Ki", type=float, nargs="+", default=[0.0, 20.0, 50.0])
+    parser.add_argument("--Kd", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--step", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.02])
+    parser.add_argument("--surface", nargs="+", default=["sine"])
+    parser.add_argument("--scan-speed", type=float, nargs="+", default=[10.0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="结果表 CSV 文件")
+    args = parser.parse_args()
+
+    configs = make_grid(Kp=args.Kp, Ki=args.Ki, Kd=args.Kd, step=args.step, noise=args.noise,
+                        surface=args.surface, scan_speed=args.scan_speed)
+    t0 = time.perf_counter()
+    rows = run_ensemble(configs, seed=args.seed, workers=args.workers)
+    print(format_table(rows))
+    print(f"{len(rows)} 个组合，用时 {time.perf_counter() - t0:.1f}s")
+    top = best(rows)
+    if top:
+        print(f"RMS 误差最小: Kp={top['Kp']} Ki={top['Ki']} Kd={top['Kd']}，{top['rms_error']:.4g} μm")
+    if args.output:
+        write_table(rows, args.output)
+        print(f"结果已保存到 {args.output}")
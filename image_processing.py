@@ -0,0 +1,270 @@
+# 扫描图像后处理
+# 平面扣除、逐行多项式调平（屏蔽异常点）、往返扫描平均、帧间漂移估计。
+# 所有操作都按行块处理：输入可以是内存映射数组（ScanStore 通道、np.load(mmap_mode="r")），
+# 每次只读入 chunk_rows 行，结果写入 out（同样可以是内存映射数组），
+# 所以远大于内存的图像也能处理。块内对所有行一起做数组运算，逐行调平一行只需几十微秒，
+# 可以在扫描进行中逐行处理（见 scan_pipeline.level_lines）。
+# 无效点（NaN、inf）在拟合时忽略，输出中保持 NaN。
+#
+# 用法：
+#   store = ScanStore.open(path)
+#   height = store.completed("height")
+#   out = empty_like(height, "flattened.npy")      # 结果直接写到磁盘
+#   subtract_plane(height, out=out)
+#   flatten_lines(out, order=1, sigma=3.0, out=out)
+
+import numpy as np
+
+# 每次读入的行数
+CHUNK_ROWS = 256
+
+
+def _chunks(rows, chunk_rows):
+    for r0 in range(0, rows, chunk_rows):
+        yield slice(r0, min(r0 + chunk_rows, rows))
+
+
+def _read(data, rows):
+    return np.asarray(data[rows], dtype=float)
+
+
+def empty_like(data, path=None, dtype="float32"):
+    """与 data 同形状的输出数组；给出 path 时为磁盘上的 .npy 内存映射"""
+    if path is None:
+        return np.empty(data.shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=data.shape)
+
+
+def _output(data, out):
+    return np.empty(data.shape, dtype=float) if out is None else out
+
+
+def _flush(out):
+    if isinstance(out, np.memmap):
+        out.flush()
+
+
+# -------------------- 平面扣除 --------------------
+def fit_plane(data, mask=None, chunk_rows=CHUNK_ROWS):
+    """最小二乘拟合平面 z = a + b·x + c·y（x、y 为列号和行号），返回 (a, b, c)
+
+    mask：与 data 同形状的布尔数组，True 的点参与拟合（无效点总是被排除）
+    按块累加法方程，只需遍历一次数据。
+    """
+    rows, cols = data.shape
+    x = np.arange(cols, dtype=float)
+    normal = np.zeros((3, 3))
+    rhs = np.zeros(3)
+    for sl in _chunks(rows, chunk_rows):
+        z = _read(data, sl)
+        w = np.isfinite(z)
+        if mask is not None:
+            w &= np.asarray(mask[sl], dtype=bool)
+        z = np.where(w, z, 0.0)
+        y = np.arange(sl.start, sl.stop, dtype=float)[:, np.newaxis]
+        n_row = w.sum(axis=1)
+        sx_row = w @ x
+        n, sx, sy = n_row.sum(), sx_row.sum(), (n_row * y[:, 0]).sum()
+        sxx = (w @ (x * x)).sum()
+        sxy = (sx_row * y[:, 0]).sum()
+        syy = (n_row * y[:, 0] ** 2).sum()
+        normal += [[n, sx, sy], [sx, sxx, sxy], [sy, sxy, syy]]
+        rhs += [z.sum(), (z @ x).sum(), (z.sum(axis=1) * y[:, 0]).sum()]
+    if normal[0, 0] < 3:
+        raise ValueError("有效点太少，无法拟合平面")
+    return tuple(np.linalg.lstsq(normal, rhs, rcond=None)[0])
+
+
+def subtract_plane(data, out=None, mask=None, chunk_rows=CHUNK_ROWS):
+    """扣除拟合平面，返回 (结果, (a, b, c))；out=data 时原地修改"""
+    a, b, c = fit_plane(data, mask, chunk_rows)
+    out = _output(data, out)
+    x = np.arange(data.shape[1], dtype=float)
+    for sl in _chunks(data.shape[0], chunk_rows):
+        y = np.arange(sl.start, sl.stop, dtype=float)[:, np.newaxis]
+        out[sl] = _read(data, sl) - (a + b * x + c * y)
+    _flush(out)
+    return out, (a, b, c)
+
+
+# -------------------- 逐行调平 --------------------
+def fit_lines(block, order=1, sigma=None, iterations=3, mask=None):
+    """对一块行 (行, 列) 逐行拟合 order 阶多项式，返回 (系数 (行, order+1), 参与拟合的点)
+
+    sigma：给出时反复拟合，残差超过 sigma 倍标准差的点（台阶、颗粒、噪声尖峰）被屏蔽
+    有效点不足 order+1 个的行退化为只扣除均值（全无效时系数为 0）。
+    """
+    block = np.asarray(block, dtype=float)
+    cols = block.shape[1]
+    # 列坐标归一化到 [-1, 1]，高阶时法方程不会病态
+    x = np.linspace(-1.0, 1.0, cols) if cols > 1 else np.zeros(1)
+    vander = np.vander(x, order + 1, increasing=True)  # (列, order+1)
+    valid = np.isfinite(block)
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)
+    z = np.where(valid, block, 0.0)
+    w = valid.copy()
+    terms = order + 1
+    # 各行的法方程 Vᵀ W V 一次矩阵乘法得到：(行, 列) @ (列, terms²)
+    products = (vander[:, :, np.newaxis] * vander[:, np.newaxis, :]).reshape(cols, -1)
+    for k in range(iterations if sigma else 1):
+        wf = w.astype(float)
+        normal = (wf @ products).reshape(-1, terms, terms)
+        rhs = (wf * z) @ vander
+        count = wf.sum(axis=1)
+        # 点数不足的行只扣除有效点的均值
+        few = count < terms
+        if few.any():
+            means = rhs[few, 0] / np.maximum(count[few], 1)
+            normal[few] = np.eye(terms)
+            rhs[few] = 0.0
+            rhs[few, 0] = means
+        coef = np.linalg.solve(normal, rhs[..., np.newaxis])[..., 0]
+        if not sigma or k == iterations - 1:
+            break
+        resid = np.where(valid, z - coef @ vander.T, 0.0)
+        std = np.sqrt((resid ** 2 * wf).sum(axis=1) / np.maximum(count, 1))
+        keep = valid & (np.abs(resid) <= sigma * std[:, np.newaxis])
+        if np.array_equal(keep, w):
+            break
+        w = keep
+    return coef, w
+
+
+def flatten_lines(data, order=1, sigma=None, iterations=3, out=None, mask=None,
+                  chunk_rows=CHUNK_ROWS):
+    """逐行扣除多项式拟合，返回结果；参数见 fit_lines，out=data 时原地修改"""
+    out = _output(data, out)
+    cols = data.shape[1]
+    x = np.linspace(-1.0, 1.0, cols) if cols > 1 else np.zeros(1)
+    vander = np.vander(x, order + 1, increasing=True)
+    for sl in _chunks(data.shape[0], chunk_rows):
+        block = _read(data, sl)
+        coef, _ = fit_lines(block, order, sigma, iterations,
+                            None if mask is None else mask[sl])
+        out[sl] = block - coef @ vander.T
+    _flush(out)
+    return out
+
+
+# -------------------- 往返扫描平均 --------------------
+def average_trace_retrace(trace, retrace, out=None, flip=True, chunk_rows=CHUNK_ROWS):
+    """往返两个方向的扫描取平均，返回 (平均图, 两者差的 RMS)
+
+    flip：retrace 按采集顺序存放（每行从右到左）时为 True，先左右翻转再平均；
+          已经按网格方向存放的（如 LineBuffer(serpentine=True) 写入的）用 False
+    只有一个方向有效的点取该方向的值。差的 RMS 可以用来判断反馈是否跟得上。
+    """
+    if trace.shape != retrace.shape:
+        raise ValueError(f"形状不一致: {trace.shape} 与 {retrace.shape}")
+    out = _output(trace, out)
+    sq, n = 0.0, 0
+    for sl in _chunks(trace.shape[0], chunk_rows):
+        a = _read(trace, sl)
+        b = _read(retrace, sl)
+        if flip:
+            b = b[:, ::-1]
+        both = np.isfinite(a) & np.isfinite(b)
+        out[sl] = np.where(both, 0.5 * (a + b), np.where(np.isfinite(a), a, b))
+        diff = (a - b)[both]
+        sq += float(diff @ diff)
+        n += diff.size
+    _flush(out)
+    return out, (np.sqrt(sq / n) if n else np.nan)
+
+
+# -------------------- 漂移估计 --------------------
+def bin_image(data, factor, chunk_rows=CHUNK_ROWS):
+    """factor × factor 像素取平均缩小（无效点不计入），按块读取"""
+    rows, cols = data.shape[0] // factor, data.shape[1] // factor
+    out = np.empty((rows, cols))
+    step = max(1, chunk_rows // factor) * factor
+    for r0 in range(0, rows * factor, step):
+        r1 = min(r0 + step, rows * factor)
+        block = _read(data, slice(r0, r1))[:, :cols * factor]
+        block = block.reshape((r1 - r0) // factor, factor, cols, factor)
+        with np.errstate(invalid="ignore"):
+            out[r0 // factor:r1 // factor] = np.nanmean(block, axis=(1, 3))
+    return out
+
+
+def estimate_drift(reference, image, max_size=1024, chunk_rows=CHUNK_ROWS):
+    """用互相关估计 image 相对 reference 的平移，返回 (dy, dx)（像素，亚像素精度）
+
+    即 image[y, x] ≈ reference[y - dy, x - dx]。大图先分块缩小到不超过 max_size，
+    结果乘回缩小倍数（精度相应降低）。两幅图先扣除平面背景、乘窗函数，
+    互相关用 FFT 计算，峰值位置经抛物线插值得到亚像素平移。
+    """
+    if reference.shape != image.shape:
+        raise ValueError(f"形状不一致: {reference.shape} 与 {image.shape}")
+    factor = max(1, int(np.ceil(max(reference.shape) / max_size)))
+    if factor > 1:
+        a, b = bin_image(reference, factor, chunk_rows), bin_image(image, factor, chunk_rows)
+    else:
+        a, b = np.asarray(reference, dtype=float), np.asarray(image, dtype=float)
+    a = _prepare(a)
+    b = _prepare(b)
+    cross = np.fft.rfft2(b) * np.conj(np.fft.rfft2(a))
+    corr = np.fft.irfft2(cross, s=a.shape)
+    peak = np.unravel_index(np.argmax(corr), corr.shape)
+    shift = []
+    for axis, (p, n) in enumerate(zip(peak, corr.shape)):
+        # 抛物线插值得到亚像素位置
+        idx = list(peak)
+        idx[axis] = (p - 1) % n
+        left = corr[tuple(idx)]
+        idx[axis] = (p + 1) % n
+        right = corr[tuple(idx)]
+        center = corr[peak]
+        denom = left - 2 * center + right
+        frac = 0.5 * (left - right) / denom if denom != 0 else 0.0
+        s = p + frac
+        if s > n / 2:
+            s -= n
+        shift.append(s * factor)
+    return tuple(shift)
+
+
+def _prepare(img):
+    # 无效点填均值，去掉平面背景，乘 Hann 窗减小边缘不连续的影响
+    img = np.where(np.isfinite(img), img, np.nanmean(img))
+    img, _ = subtract_plane(img)
+    window = np.outer(np.hanning(img.shape[0]), np.hanning(img.shape[1]))
+    return img * window
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from scan_store import ScanStore
+
+    parser = argparse.ArgumentParser(description="扫描图像后处理（按块处理，适用于大图）")
+    parser.add_argument("input", help="ScanStore 目录或 .npy 文件")
+    parser.add_argument("output", help="结果 .npy 文件")
+    parser.add_argument("--channel", default="height", help="ScanStore 中的通道")
+    parser.add_argument("--plane", action="store_true", help="扣除平面")
+    parser.add_argument("--flatten", type=int, default=None, metavar="ORDER",
+                        help="逐行多项式调平的阶数")
+    parser.add_argument("--sigma", type=float, default=3.0, help="调平时屏蔽异常点的阈值")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if args.input.endswith(".npy"):
+        data = np.load(args.input, mmap_mode="r")
+    else:
+        data = ScanStore.open(args.input).completed(args.channel)
+    out = empty_like(data, args.output)
+    t0 = time.perf_counter()
+    src = data
+    if args.plane:
+        _, coef = subtract_plane(src, out=out, chunk_rows=args.chunk_rows)
+        print(f"平面: z = {coef[0]:.4g} + {coef[1]:.4g}·x + {coef[2]:.4g}·y")
+        src = out
+    if args.flatten is not None:
+        flatten_lines(src, args.flatten, args.sigma, out=out, chunk_rows=args.chunk_rows)
+        src = out
+    if src is data:
+        out[:] = data
+        out.flush()
+    print(f"{data.shape[0]}×{data.shape[1]} 用时 {time.perf_counter() - t0:.2f}s -> {args.output}")
@@ -0,0 +1,142 @@
+# 扫描实时图像面板
+# 扫描每完成一行，数据经 scan_pipeline 流水线（post_row）送来，面板只重绘变化的行，
+# 且刷新频率有上限；色标范围随新行增量更新，只有范围明显扩大时才重新映射整幅图。
+# 绘制都在 GUI 线程中进行，扫描线程只把行推入流水线，不会被阻塞。
+
+import numpy as np
+from PyQt5.QtCore import QRect, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter
+from PyQt5.QtWidgets import QWidget
+
+# viridis 色标的几个锚点，插值成 256 色
+_VIRIDIS = np.array([
+    [68, 1, 84], [72, 40, 120], [62, 74, 137], [49, 104, 142], [38, 130, 142],
+    [31, 158, 137], [53, 183, 121], [109, 205, 89], [180, 222, 44], [253, 231, 37],
+])
+
+
+def _color_table():
+    pos = np.linspace(0, 1, len(_VIRIDIS))
+    x = np.linspace(0, 1, 256)
+    rgb = np.stack([np.interp(x, pos, _VIRIDIS[:, c]) for c in range(3)], axis=1).astype(int)
+    return [QColor(r, g, b).rgb() for r, g, b in rgb]
+
+
+class LiveImageView(QWidget):
+    """逐行更新的扫描图像
+
+    max_fps：最高刷新频率
+    margin：色标范围扩大时额外留出的比例，避免每一行都触发整幅重映射
+    其他线程（如 scan_pipeline 的输出级）用 post_row() 送数据，经排队信号回到 GUI 线程。
+    """
+
+    _row_posted = pyqtSignal(int, object)
+
+    def __init__(self, parent=None, max_fps=20, margin=0.1):
+        super().__init__(parent)
+        self._row_posted.connect(self.add_row, Qt.QueuedConnection)
+        self.margin = margin
+        self.setMinimumSize(200, 200)
+        self._colors = _color_table()
+        self._timer = QTimer(self)
+        self._timer.setInterval(int(1000 / max_fps))
+        self._timer.timeout.connect(self._render_pending)
+        self.reset(1, 1)
+
+    def reset(self, rows, cols):
+        """开始新的一帧"""
+        self._values = np.full((rows, cols), np.nan, dtype=np.float32)
+        self._pixels = np.zeros((rows, cols), dtype=np.uint8)
+        self._image = QImage(self._pixels.data, cols, rows, cols, QImage.Format_Indexed8)
+        self._image.setColorTable(self._colors)
+        self._pending = {}
+        self._lo = np.inf
+        self._hi = -np.inf
+        self._full_redraw = False
+        self.update()
+
+    def post_row(self, row, values):
+        """可从任意线程调用：把一行数据排队交给 GUI 线程的 add_row"""
+        self._row_posted.emit(row, values)
+
+    def add_row(self, row, values):
+        """接收一行数据（槽函数），只登记，实际绘制由定时器按频率完成"""
+        self._pending[row] = np.asarray(values, dtype=np.float32)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    @property
+    def color_range(self):
+        return self._lo, self._hi
+
+    def _render_pending(self):
+        if not self._pending:
+            self._timer.stop()
+            return
+        pending, self._pending = self._pending, {}
+        dirty = []
+        for row, values in pending.items():
+            if not 0 <= row < self._values.shape[0]:
+                continue
+            self._values[row] = values
+            self._extend_range(values)
+            dirty.append(row)
+        if not dirty:
+            return
+        # _pixels 按显示方向存放：第 0 行数据在图像最下方
+        display = self._pixels[::-1]
+        if self._full_redraw:
+            # 色标范围变了，已有的行都要重新映射（只在范围明显扩大时发生）
+            display[:] = self._map(self._values)
+            self._full_redraw = False
+            self.update()
+            return
+        for row in dirty:
+            display[row] = self._map(self._values[row])
+        self.update(self._widget_rect(min(dirty), max(dirty) + 1))
+
+    def _extend_range(self, values):
+        finite = values[np.isfinite(values)]
+        if finite.size == 0:
+            return
+        lo, hi = float(finite.min()), float(finite.max())
+        if lo >= self._lo and hi <= self._hi:
+            return
+        span = max(hi, self._hi) - min(lo, self._lo)
+        pad = span * self.margin if span > 0 else 1e-12
+        if lo < self._lo:
+            self._lo = lo - pad
+        if hi > self._hi:
+            self._hi = hi + pad
+        self._full_redraw = True
+
+    def _map(self, values):
+        span = self._hi - self._lo
+        if not np.isfinite(span) or span <= 0:
+            return np.zeros(values.shape, dtype=np.uint8)
+        scaled = (values - self._lo) * (255.0 / span)
+        return np.nan_to_num(np.clip(scaled, 0, 255)).astype(np.uint8)
+
+    def _widget_rect(self, row0, row1):
+        # 图像行 [row0, row1) 在窗口中对应的区域（第 0 行在底部，与 origin='lower' 一致）
+        rows = self._values.shape[0]
+        h = self.height() / rows
+        top = int((rows - row1) * h)
+        bottom = int(np.ceil((rows - row0) * h))
+        return QRect(0, top, self.width(), bottom - top + 1)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+        # 只绘制需要更新的区域对应的图像行
+        rows = self._values.shape[0]
+        h = self.height() / rows
+        r = event.rect()
+        row0 = max(0, int((self.height() - r.bottom() - 1) / h))
+        row1 = min(rows, int(np.ceil((self.height() - r.top()) / h)))
+        if row1 <= row0:
+            return
+        source = QRect(0, rows - row1, self._image.width(), row1 - row0)
+        target = self._widget_rect(row0, row1)
+        painter.drawImage(target, self._image, source)
+        painter.end()
@@ -0,0 +1,105 @@
+# ANC300 串口自动识别
+# 并行探测所有串口，并把上次找到的串口（连同 USB VID/PID/序列号）缓存到本地，
+# 下次启动先检查缓存的串口
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import serial
+import serial.tools.list_ports
+
+from anc300_transport import ANC300Transport, ANC300Error
+
+# ver 回应中必须包含的标识；其他设备也可能对 ver 回 OK
+IDENTIFIER = "ANC300"
+
+# 缓存文件位置
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".kpfm_control", "anc300_port.json")
+
+
+def probe_port(device, baudrate=9600, timeout=0.3):
+    """向 device 发送 ver，回应成功且含 IDENTIFIER 时返回版本回应，否则返回 None；串口总会被关闭"""
+    try:
+        with serial.Serial(device, baudrate=baudrate, timeout=timeout) as ser:
+            reply = ANC300Transport(ser, timeout=timeout).command("ver", check=False)
+    except (serial.SerialException, OSError, ANC300Error):
+        return None
+    if not reply.ok or IDENTIFIER not in "\n".join(reply.lines):
+        return None
+    return reply
+
+
+def _usb_id(port):
+    return {"vid": port.vid, "pid": port.pid, "serial_number": port.serial_number}
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_cache(port, baudrate, path=CACHE_PATH):
+    entry = {"device": port.device, "baudrate": baudrate}
+    entry.update(_usb_id(port))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+    except OSError:
+        pass  # 缓存只是加速手段，写不进去不影响识别
+
+
+def _cached_port(ports, cache):
+    # USB 设备重新插拔后设备名可能变化，优先按 VID/PID/序列号匹配
+    if not cache:
+        return None
+    if cache.get("vid") is not None:
+        for port in ports:
+            if _usb_id(port) == {k: cache.get(k) for k in ("vid", "pid", "serial_number")}:
+                return port
+    for port in ports:
+        if port.device == cache.get("device"):
+            return port
+    return None
+
+
+def find_anc300_port(baudrate=9600, timeout=0.3, use_cache=True, cache_path=CACHE_PATH,
+                     log=print, exclude=()):
+    """返回 ANC300 所在的串口设备名，找不到返回 None
+
+    exclude：不探测的串口（如已被本程序打开的串口）
+    """
+    ports = [p for p in serial.tools.list_ports.comports() if p.device not in exclude]
+
+    if use_cache:
+        cached = _cached_port(ports, load_cache(cache_path))
+        if cached is not None and probe_port(cached.device, baudrate, timeout):
+            log(f"✅ 发现 ANC300 控制器在串口: {cached.device}（缓存）")
+            return cached.device
+        ports = [p for p in ports if p is not cached]
+
+    if not ports:
+        return None
+
+    # 所有串口同时探测，第一个回应的即为结果
+    pool = ThreadPoolExecutor(max_workers=len(ports))
+    futures = {pool.submit(probe_port, p.device, baudrate, timeout): p for p in ports}
+    found = None
+    try:
+        for future in as_completed(futures):
+            if future.result():
+                found = futures[future]
+                break
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if found is None:
+        return None
+    if use_cache:
+        save_cache(found, baudrate, cache_path)
+    log(f"✅ 发现 ANC300 控制器在串口: {found.device}")
+    return found.device
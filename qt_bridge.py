@@ -0,0 +1,72 @@
+# Qt 与 asyncio 之间的桥
+# asyncio 事件循环运行在一个后台线程中，GUI 线程用 submit() 提交协程，立即返回；
+# 协程完成后结果（或异常）通过 Qt 信号回到 GUI 线程，再调用回调。GUI 线程从不等待串口。
+#
+# 用法：
+#   bridge = AsyncBridge()
+#   bridge.submit(device.geta(1), on_result=lambda v: label.setText(f"{v:.3f} V"),
+#                 on_error=lambda e: log(str(e)))
+
+import asyncio
+import itertools
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class AsyncBridge(QObject):
+    # 从事件循环线程发出，Qt 自动排队到 GUI 线程执行
+    _done = pyqtSignal(int, object, object)
+    message = pyqtSignal(str)  # 任意线程可用 post_message() 发给 GUI 的日志
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="asyncio-bridge", daemon=True)
+        self._thread.start()
+        self._callbacks = {}
+        self._ids = itertools.count()
+        self._done.connect(self._dispatch)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, on_result=None, on_error=None):
+        """在事件循环中运行协程，返回 concurrent.futures.Future
+
+        on_result(result) / on_error(exception) 在 GUI 线程中调用。
+        """
+        token = next(self._ids)
+        self._callbacks[token] = (on_result, on_error)
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+        def done(f):
+            if f.cancelled():
+                self._done.emit(token, None, asyncio.CancelledError())
+            else:
+                self._done.emit(token, f.result() if f.exception() is None else None, f.exception())
+
+        future.add_done_callback(done)
+        return future
+
+    def call(self, coro, timeout=None):
+        """在非 GUI 线程中同步调用协程并返回结果（如扫描线程）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def post_message(self, text):
+        self.message.emit(str(text))
+
+    def _dispatch(self, token, result, error):
+        on_result, on_error = self._callbacks.pop(token, (None, None))
+        if error is not None:
+            if on_error is not None:
+                on_error(error)
+        elif on_result is not None:
+            on_result(result)
+
+    def shutdown(self, timeout=2.0):
+        if not self.loop.is_running():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
@@ -1,45 +1,17 @@
 import tkinter as tk
 from tkinter import messagebox
 import serial
-import serial.tools.list_ports
 import time
+from anc300_transport import ANC300Error, ANC300Transport
+from port_discovery import find_anc300_port
+from scan_path import AxisCalibration, positions_to_voltages
+from scan_patterns import make_pattern
+from dwell import DwellScheduler, SettlingModel
+from scan_log import ScanLog, throttle
 
-# 自动识别 ANC300 控制器的串口
-def find_anc300_port(baudrate=9600, timeout=1):
-    ports = list(serial.tools.list_ports.comports())
-    for port in ports:
-        try:
-            ser = serial.Serial(port.device, baudrate=baudrate, timeout=timeout)
-            ser.write(b"ver\r\n")
-            response = ser.read(128).decode(errors='ignore')
-            if "OK" in response:
-                print(f"✅ 发现 ANC300 控制器在串口: {port.device}")
-                return port.device
-            ser.close()
-        except Exception:
-            continue
-    return None
-
-# 向串口发送命令并等待回应
-def send_command(ser, command):
-    ser.write((command + '\r\n').encode())
-    time.sleep(0.1)
-    return ser.read_all().decode(errors='ignore')
-
-# 生成扫描路径
-def generate_scan_positions(a, d):
-    num_steps = int(a / d) + 1
-    positions = []
-    for i in range(num_steps):
-        for j in range(num_steps):
-            x = i * d
-            y = j * d if i % 2 == 0 else (num_steps - 1 - j) * d  # 折返扫描
-            positions.append((x, y))
-    return positions
-
-# 将电压值映射到实际电压范围（0~60V）
-def position_to_voltage(pos, max_range=50):
-    return min(60.0, max(0.0, 60.0 * pos / max_range))
+# 向串口发送命令并等待回应（读到 OK/ERROR 即返回）
+def send_command(transport, command):
+    return transport.command(command, check=False).text
 
 # 扫描函数
 def start_scan():
@@ -56,49 +28,85 @@ def start_scan():
         messagebox.showerror("错误", "未找到 ANC300 控制器，请检查连接。")
         return
 
-    ser = serial.Serial(port, 9600, timeout=1)
+    try:
+        ser = serial.Serial(port, 9600, timeout=1)
+    except (serial.SerialException, OSError) as e:
+        messagebox.showerror("错误", f"无法打开串口 {port}: {e}")
+        return
+    settling = SettlingModel.load() if adaptive_dwell.get() else None
+    scan_log = ScanLog.for_scan()
+    try:
+        # 界面最多每 0.1 s 刷新一次，逐像素日志写入文件
+        report = run_scan(ANC300Transport(ser), a, d, delay, on_move=throttle(root.update, 0.1),
+                          settling=settling, scan_log=scan_log)
+    except (ANC300Error, serial.SerialException, OSError) as e:
+        messagebox.showerror("扫描中止", f"扫描出错，X/Y 已接地: {e}")
+        return
+    finally:
+        scan_log.close()
+        ser.close()
+    messagebox.showinfo("完成", "扫描完成！" + (f"\n{report.summary()}" if report else ""))
+
+# 扫描流程（不依赖 GUI，on_move 在每个像素到位后调用）
+# settling 为 SettlingModel 时按步长自适应停留（delay 为上限），返回停留时间统计
+# scan_log 为 scan_log.ScanLog，逐像素日志记录在其中
+# 通信出错（超时、串口断开）时异常向上抛出，但无论如何 X/Y 都会先接地
+def run_scan(transport, a, d, delay, on_move=None, pattern="raster", settling=None,
+             scan_log=None):
     axes = {1: 'X', 2: 'Y'}
+    if scan_log is None:
+        scan_log = ScanLog()
+    scheduler = DwellScheduler(settling, delay) if settling else None
 
-    # 设置offset模式
-    for axis in axes:
-        send_command(ser, f"setm {axis} off")
-
-    positions = generate_scan_positions(a, d)
-    for x_pos, y_pos in positions:
-        x_volt = position_to_voltage(x_pos, max_range=a)
-        y_volt = position_to_voltage(y_pos, max_range=a)
-        send_command(ser, f"seta 1 {x_volt:.3f}")
-        send_command(ser, f"seta 2 {y_volt:.3f}")
-        print(f"已移动到位置 X: {x_volt:.2f} V, Y: {y_volt:.2f} V")
-        root.update()
-        time.sleep(delay)
-
-    # 扫描完成后接地
-    for axis in axes:
-        send_command(ser, f"setm {axis} gnd")
-
-    ser.close()
-    messagebox.showinfo("完成", "扫描完成！")
+    try:
+        # 设置offset模式
+        for axis in axes:
+            send_command(transport, f"setm {axis} off")
+
+        # 扫描范围 a 对应 0~60V
+        cal = AxisCalibration.from_range(a, v_max=60.0)
+        for xs, ys in make_pattern(pattern, a, d).chunks():
+            x_volts, y_volts = positions_to_voltages(xs, ys, cal, cal)
+            for x_volt, y_volt in zip(x_volts.tolist(), y_volts.tolist()):
+                send_command(transport, f"seta 1 {x_volt:.3f}")
+                send_command(transport, f"seta 2 {y_volt:.3f}")
+                scan_log.log(f"已移动到位置 X: {x_volt:.2f} V, Y: {y_volt:.2f} V",
+                             x_volt=x_volt, y_volt=y_volt)
+                if on_move is not None:
+                    on_move()
+                time.sleep(scheduler.dwell(x_volt, y_volt) if scheduler else delay)
+    finally:
+        # 扫描完成或中途出错都接地；接地失败只记录，不掩盖原来的异常
+        for axis in axes:
+            try:
+                send_command(transport, f"setm {axis} gnd")
+            except (ANC300Error, serial.SerialException, OSError) as e:
+                scan_log.log(f"{axes[axis]} 轴接地失败: {e}", level="error")
+    return scheduler.report if scheduler else None
 
 # GUI 构建
-root = tk.Tk()
-root.title("ANC300 XY 扫描控制器")
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.title("ANC300 XY 扫描控制器")
+
+    tk.Label(root, text="扫描范围 a (μm)").grid(row=0, column=0)
+    entry_range = tk.Entry(root)
+    entry_range.insert(0, "50")
+    entry_range.grid(row=0, column=1)
 
-tk.Label(root, text="扫描范围 a (μm)").grid(row=0, column=0)
-entry_range = tk.Entry(root)
-entry_range.insert(0, "50")
-entry_range.grid(row=0, column=1)
+    tk.Label(root, text="步长 d (μm)").grid(row=1, column=0)
+    entry_step = tk.Entry(root)
+    entry_step.insert(0, "5")
+    entry_step.grid(row=1, column=1)
 
-tk.Label(root, text="步长 d (μm)").grid(row=1, column=0)
-entry_step = tk.Entry(root)
-entry_step.insert(0, "5")
-entry_step.grid(row=1, column=1)
+    tk.Label(root, text="停留时间 (s)").grid(row=2, column=0)
+    entry_delay = tk.Entry(root)
+    entry_delay.insert(0, "0.5")
+    entry_delay.grid(row=2, column=1)
 
-tk.Label(root, text="停留时间 (s)").grid(row=2, column=0)
-entry_delay = tk.Entry(root)
-entry_delay.insert(0, "0.5")
-entry_delay.grid(row=2, column=1)
+    adaptive_dwell = tk.BooleanVar(value=False)
+    tk.Checkbutton(root, text="按步长自适应停留", variable=adaptive_dwell).grid(row=3, column=0, columnspan=2)
 
-tk.Button(root, text="开始扫描", command=start_scan).grid(row=3, column=0, columnspan=2)
+    tk.Button(root, text="开始扫描", command=start_scan).grid(row=4, column=0, columnspan=2)
 
-root.mainloop()
+    root.mainloop()
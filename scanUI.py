@@ -1,95 +1,279 @@
+import asyncio
+import os
 import sys
 import time
 import serial
-import serial.tools.list_ports
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QPushButton, QTextEdit, QMessageBox
+    QLabel, QLineEdit, QPushButton, QTextEdit, QMessageBox, QComboBox, QCheckBox
 )
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from anc300_async import AsyncANC300
+from anc300_transport import ANC300Error
+from controller_session import ControllerSession, SessionManager
+from capacitance import survey_for
+from port_discovery import find_anc300_port
+from scan_path import AxisCalibration, num_steps, positions_to_voltages
+from scan_patterns import PATTERNS, make_pattern
+from dwell import DwellScheduler, SettlingModel
+from scan_store import SAMPLES_CHANNEL, GridBuffer, LineBuffer, ScanStore, read_checkpoint
+from scan_log import ScanLog
+from live_view import LiveImageView
+from qt_bridge import AsyncBridge
+from scan_pipeline import LineSource, Pipeline, Stage, level_lines, row_sink
+
+# 日志窗口最多保留的行数和刷新频率
+LOG_MAX_LINES = 1000
+LOG_REFRESH_HZ = 10
+
+# 检测到控制器后显示模式的轴
+STATUS_AXES = (1, 2, 3)
+
+# 60V 对应 50μm 固定映射
+XY_CALIBRATION = AxisCalibration.from_range(50.0, v_max=60.0)
 
 
 class ScanThread(QThread):
-    log_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
 
-    def __init__(self, port, a, d, delay):
+    def __init__(self, port, a, d, delay, window=4, pattern="raster", settling=None,
+                 save_dir=None, resume=None, scan_log=None, z_axis=None, session=None,
+                 ground_on_finish=True, check_axes=(), line_source=None, sessions=None):
         super().__init__()
         self.port = port
+        # 共用的 ControllerSession（连续扫描不必重新打开串口）；
+        # 或给出 SessionManager，由扫描线程在 run() 中取得会话（打开串口不阻塞界面）；
+        # 两者都没有时扫描自己打开串口，结束后关闭
+        self.session = session
+        self.sessions = sessions
+        self.ground_on_finish = ground_on_finish
+        # 扫描前检查电容的定位器轴（结果按会话缓存，短时间内连续扫描不重测）
+        self.check_axes = tuple(check_axes)
         self.a = a
         self.d = d
         self.delay = delay
+        self.window = window  # 流水线在途命令上限，1 表示逐条等待回应
+        self.pattern = pattern  # 扫描轨迹，见 scan_patterns.PATTERNS
+        # 给出 SettlingModel 时按步长自适应停留，delay 作为上限；否则每个像素固定停留 delay
+        self.settling = settling
+        self.save_dir = save_dir  # 给出时每完成一行把指令电压写入 ScanStore
+        # Z 反馈轴：给出时每个像素用 geto 读取其输出电压作为形貌信号
+        self.z_axis = z_axis
+        self.store = None
+        # 断点：每完成一行更新一次；resume 为之前的断点时从该行之后继续
+        self.resume = resume
+        self.checkpoint = resume
+        self.completed = False
+        # 日志先进环形缓冲区，由 GUI 定时成批取走；完整日志写文件
+        self.scan_log = scan_log if scan_log is not None else ScanLog()
+        self.on_pixel = None  # 每个像素到位后的回调（用于测速）
+        # scan_pipeline.LineSource：给出时每完成一行推入流水线（实时显示的唯一途径），扫描结束时关闭
+        self.line_source = line_source
         self._is_running = True
 
+    def log(self, msg, **fields):
+        self.scan_log.log(msg, **fields)
+
+    @classmethod
+    def from_checkpoint(cls, port, checkpoint, settling=None, session=None, sessions=None):
+        """按断点中的扫描参数创建继续扫描的线程"""
+        return cls(port, checkpoint["a"], checkpoint["d"], checkpoint["delay"],
+                   window=checkpoint["window"], pattern=checkpoint["pattern"],
+                   settling=settling, resume=checkpoint, z_axis=checkpoint.get("z_axis"),
+                   session=session, sessions=sessions)
+
+    @property
+    def channels(self):
+        return ("x_volt", "y_volt", "z_volt") if self.z_axis else ("x_volt", "y_volt")
+
+    @property
+    def gridded(self):
+        # 非光栅轨迹的采样经 GridBuffer 平均到网格上存储和显示
+        return self.pattern != "raster"
+
+    def frame_shape(self):
+        # 所有轨迹都存成 num_steps × num_steps 的网格：光栅逐行写入，其他轨迹重采样后整幅写入
+        n = num_steps(self.a, self.d)
+        return n, n
+
+    def create_store(self, pattern):
+        rows, cols = self.frame_shape()
+        path = os.path.join(self.save_dir, time.strftime("scan_%Y%m%d_%H%M%S"))
+        channels = self.channels + (SAMPLES_CHANNEL,) if self.gridded else self.channels
+        return ScanStore.create(path, rows, cols, channels=channels,
+                                layout="grid" if self.gridded else "lines",
+                                pattern=pattern.name, a=self.a, d=self.d, delay=self.delay,
+                                volt_per_um=XY_CALIBRATION.volt_per_um, port=self.port,
+                                z_axis=self.z_axis)
+
+    def save_checkpoint(self, path_index, row, x_volt, y_volt):
+        self.checkpoint = {
+            "path_index": path_index,  # 下一个要扫描的点
+            "row": row,                # 下一行的行号
+            "x_volt": x_volt,          # 最后一个已完成点的指令电压
+            "y_volt": y_volt,
+            "a": self.a, "d": self.d, "delay": self.delay,
+            "window": self.window, "pattern": self.pattern, "z_axis": self.z_axis,
+            "store": self.store.path if self.store is not None else None,
+            "time": time.time(),
+        }
+        if self.store is not None:
+            self.store.write_checkpoint(self.checkpoint)
+
+    def approach(self, pipeline, x_volt, y_volt, max_step=1.0, settle=0.01):
+        # 从当前偏置电压以不超过 max_step 的电压步进回到断点位置，避免大跳变。
+        # setm off 会恢复控制器保留的偏置电压，所以起点要读 geta，不能假定为 0V
+        x0, y0 = (reply.value for reply in pipeline.run(["geta 1", "geta 2"]))
+        steps = max(1, int(max(abs(x_volt - x0), abs(y_volt - y0)) / max_step) + 1)
+        for k in range(1, steps + 1):
+            if not self._is_running:
+                return
+            f = k / steps
+            pipeline.run([f"seta 1 {x0 + (x_volt - x0) * f:.3f}",
+                          f"seta 2 {y0 + (y_volt - y0) * f:.3f}"])
+            time.sleep(settle)
+        time.sleep(self.delay)
+
+    def push_lines(self, done):
+        # 完成的行（网格轨迹为整幅网格）推入流水线；不阻塞，流水线积压时丢弃
+        if done is not None and self.line_source is not None:
+            self.line_source.put(*done)
+
     def run(self):
+        # 没有共用会话时临时打开一个，扫描结束后关闭
+        session = self.session
+        owned = session is None and self.sessions is None
         try:
-            ser = serial.Serial(self.port, 9600, timeout=1)
-        except Exception as e:
-            self.log_signal.emit(f"打开串口失败: {e}")
-            self.finished_signal.emit()
-            return
+            if owned:
+                session = ControllerSession(self.port, keepalive=None).open()
+            elif session is None:
+                session = self.sessions.get(self.port)
+            with session:  # 扫描期间独占连接
+                self._scan(session)
+        except (serial.SerialException, OSError) as e:
+            self.log(f"打开串口失败: {e}")
+        except ANC300Error as e:
+            self.log(f"控制器通信错误: {e}")
+        finally:
+            if owned and session is not None:
+                session.close()
+            if self.line_source is not None:
+                self.line_source.close()
+        self.log("扫描完成！" if self.completed else "扫描已中止。")
+        self.finished_signal.emit()
 
+    def _scan(self, session):
         axes = {1: 'X', 2: 'Y'}
+        scheduler = DwellScheduler(self.settling, self.delay) if self.settling else None
+        start, row = 0, 0
 
-        # 设置offset模式
-        for axis in axes:
-            cmd = f"setm {axis} off"
-            ser.write((cmd + '\r\n').encode())
-            time.sleep(0.05)
-            _ = ser.read_all()
-
-        positions = self.generate_scan_positions(self.a, self.d)
-
-        for x_pos, y_pos in positions:
-            if not self._is_running:
-                break
-            x_volt = self.position_to_voltage(x_pos)
-            y_volt = self.position_to_voltage(y_pos)
-            cmd_x = f"seta 1 {x_volt:.3f}"
-            cmd_y = f"seta 2 {y_volt:.3f}"
-            ser.write((cmd_x + '\r\n').encode())
-            time.sleep(0.05)
-            ser.write((cmd_y + '\r\n').encode())
-            time.sleep(0.05)
-            self.log_signal.emit(f"移动到 X: {x_pos:.2f}μm (电压{ x_volt:.2f}V), Y: {y_pos:.2f}μm (电压{ y_volt:.2f}V)")
-            time.sleep(self.delay)
+        try:
+            if self.check_axes:
+                problems = survey_for(session).check(self.check_axes)
+                for axis, problem in problems.items():
+                    self.log(f"定位器轴 {axis} 异常: {problem}")
+                if problems:
+                    self.log("定位器检查未通过，扫描中止")
+                    return
+            pipeline = session.pipeline(window=self.window)
+            # 设置offset模式（已是 offset 模式的轴不再发送）
+            pipeline.run(f"setm {axis} off" for axis in axes if session.modes.get(axis) != "off")
+
+            pattern = make_pattern(self.pattern, self.a, self.d)
+            cols = num_steps(self.a, self.d)
+            estimate = pattern.estimate_time()
+            self.log(f"扫描轨迹: {pattern.name}，{estimate['samples']} 点，"
+                     f"预计移动 {estimate['move_s']:.1f}s + 稳定 {estimate['settle_s']:.1f}s")
+
+            if self.resume:
+                start, row = self.resume["path_index"], self.resume["row"]
+                if self.resume.get("store"):
+                    self.store = ScanStore.open(self.resume["store"], mode="w")
+                self.log(f"从第 {row} 行（第 {start} 点）继续扫描，回到断点位置...")
+                self.approach(pipeline, self.resume["x_volt"], self.resume["y_volt"])
+            elif self.save_dir:
+                self.store = self.create_store(pattern)
+            if not self.gridded:
+                lines = LineBuffer(cols, self.channels, self.store, row=row, serpentine=True)
+            elif self.resume and self.store is not None:
+                lines = GridBuffer.for_store(self.store, self.a)
+            else:
+                lines = GridBuffer(self.a, cols, self.channels, self.store)
+            if self.store is not None:
+                self.log(f"数据保存到: {self.store.path}")
+
+            index = start
+            for xs, ys in pattern.chunks(start=start):
+                x_volts, y_volts = positions_to_voltages(xs, ys, XY_CALIBRATION, XY_CALIBRATION)
+                for x_pos, y_pos, x_volt, y_volt in zip(xs.tolist(), ys.tolist(),
+                                                        x_volts.tolist(), y_volts.tolist()):
+                    if not self._is_running:
+                        break
+                    # X/Y 两条命令同时在途，等两者都确认后才算到位
+                    pipeline.run([f"seta 1 {x_volt:.3f}", f"seta 2 {y_volt:.3f}"])
+                    self.log(f"移动到 X: {x_pos:.2f}μm (电压{ x_volt:.2f}V), Y: {y_pos:.2f}μm (电压{ y_volt:.2f}V)",
+                             index=index, x=x_pos, y=y_pos, x_volt=x_volt, y_volt=y_volt)
+                    if self.on_pixel is not None:
+                        self.on_pixel()
+                    time.sleep(scheduler.dwell(x_volt, y_volt) if scheduler else self.delay)
+                    values = {"x_volt": x_volt, "y_volt": y_volt}
+                    if self.z_axis:
+                        values["z_volt"] = pipeline.run([f"geto {self.z_axis}"])[0].value
+                    if self.gridded:
+                        # 与光栅存储的方向一致：行对应 X（慢轴），列对应 Y
+                        done = lines.append(y_pos, x_pos, **values)
+                    else:
+                        done = lines.append(**values)
+                    self.push_lines(done)
+                    index += 1
+                    if index % cols == 0:  # 行边界
+                        row += 1
+                        self.save_checkpoint(index, row, x_volt, y_volt)
+                if not self._is_running:
+                    break
+            else:
+                if self.gridded:
+                    self.push_lines(lines.finish())  # 剩余采样和空格填充
+                self.completed = True
+        except ANC300Error as e:
+            self.log(f"控制器通信错误，扫描中止: {e}")
+        if scheduler:
+            self.log(scheduler.report.summary())
+        if self.completed:
+            if self.checkpoint:
+                self.checkpoint["completed"] = True
+                if self.store is not None:
+                    self.store.write_checkpoint(self.checkpoint)
+            if self.store is not None:
+                self.store.finish()
+        elif self.checkpoint:
+            self.log(f"扫描未完成，已保存断点：第 {self.checkpoint['row']} 行，可继续扫描")
 
         # 扫描结束后接地
-        for axis in axes:
-            cmd = f"setm {axis} gnd"
-            ser.write((cmd + '\r\n').encode())
-            time.sleep(0.05)
-            _ = ser.read_all()
-
-        ser.close()
-        self.log_signal.emit("扫描完成！")
-        self.finished_signal.emit()
+        if self.ground_on_finish:
+            for axis in axes:
+                try:
+                    session.set_mode(axis, "gnd")
+                except ANC300Error as e:
+                    self.log(f"轴 {axis} 接地失败: {e}")
 
     def stop(self):
         self._is_running = False
 
-    def generate_scan_positions(self, a, d):
-        num_steps = int(a / d) + 1
-        positions = []
-        for i in range(num_steps):
-            for j in range(num_steps):
-                x = i * d
-                y = j * d if i % 2 == 0 else (num_steps - 1 - j) * d  # 折返扫描
-                positions.append((x, y))
-        return positions
-
-    def position_to_voltage(self, pos):
-        # 60V 对应 50μm 固定映射
-        return min(60.0, max(0.0, 60.0 * pos / 50.0))
-
 
 class ANC300ScanGUI(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("ANC300 XY 扫描控制器")
-        self.setGeometry(300, 300, 600, 450)
+        self.setGeometry(300, 300, 900, 550)
 
         self.scan_thread = None
+        self.pipeline = None  # 实时显示的处理流水线（扫描测形貌时）
+        # 串口检测等耗时操作在 asyncio 线程中运行，结果通过信号回到 GUI
+        self.bridge = AsyncBridge(self)
+        self.bridge.message.connect(self.log)
+        # 每台控制器一个持久连接，检测串口和各次扫描共用
+        self.sessions = SessionManager(log=self.bridge.post_message)
 
         main_layout = QVBoxLayout()
 
@@ -108,8 +292,41 @@ class ANC300ScanGUI(QWidget):
         self.entry_delay = QLineEdit("0.5")
         param_layout.addWidget(self.entry_delay)
 
+        param_layout.addWidget(QLabel("命令窗口:"))
+        self.entry_window = QLineEdit("4")
+        param_layout.addWidget(self.entry_window)
+
+        param_layout.addWidget(QLabel("轨迹:"))
+        self.combo_pattern = QComboBox()
+        self.combo_pattern.addItems(list(PATTERNS))
+        param_layout.addWidget(self.combo_pattern)
+
+        self.check_adaptive = QCheckBox("自适应停留")
+        param_layout.addWidget(self.check_adaptive)
+        self.check_level = QCheckBox("逐行调平显示")
+        self.check_level.setChecked(True)
+        param_layout.addWidget(self.check_level)
+
         main_layout.addLayout(param_layout)
 
+        # 数据保存目录（留空则不保存）
+        save_layout = QHBoxLayout()
+        save_layout.addWidget(QLabel("保存目录:"))
+        self.save_dir_input = QLineEdit()
+        self.save_dir_input.setPlaceholderText("留空不保存")
+        save_layout.addWidget(self.save_dir_input)
+
+        # Z 反馈轴（留空则不读取形貌）
+        save_layout.addWidget(QLabel("Z 轴:"))
+        self.z_axis_input = QLineEdit()
+        self.z_axis_input.setPlaceholderText("留空不测形貌")
+        save_layout.addWidget(self.z_axis_input)
+        save_layout.addWidget(QLabel("检查电容轴:"))
+        self.check_axes_input = QLineEdit()
+        self.check_axes_input.setPlaceholderText("如 1,2,3；留空不检查")
+        save_layout.addWidget(self.check_axes_input)
+        main_layout.addLayout(save_layout)
+
         # 串口号输入
         port_layout = QHBoxLayout()
         port_layout.addWidget(QLabel("串口号:"))
@@ -136,35 +353,105 @@ class ANC300ScanGUI(QWidget):
         self.btn_stop_scan.setEnabled(False)  # 默认禁用
         btn_layout.addWidget(self.btn_stop_scan)
 
+        self.btn_resume_scan = QPushButton("继续扫描")
+        self.btn_resume_scan.clicked.connect(self.resume_scan)
+        btn_layout.addWidget(self.btn_resume_scan)
+
         main_layout.addLayout(btn_layout)
 
         # 日志显示区
         self.log_area = QTextEdit()
         self.log_area.setReadOnly(True)
-        main_layout.addWidget(self.log_area)
+        self.log_area.document().setMaximumBlockCount(LOG_MAX_LINES)  # 超出后丢弃最早的行
+
+        # 实时形貌图与日志并排
+        view_layout = QHBoxLayout()
+        self.live_view = LiveImageView()
+        view_layout.addWidget(self.live_view, 1)
+        view_layout.addWidget(self.log_area, 1)
+        main_layout.addLayout(view_layout)
+
+        # 定时把扫描线程的日志成批显示
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(int(1000 / LOG_REFRESH_HZ))
+        self.log_timer.timeout.connect(self.flush_scan_log)
 
         self.setLayout(main_layout)
 
     def log(self, msg):
         self.log_area.append(msg)
 
+    def flush_scan_log(self):
+        if self.scan_thread is None:
+            return
+        lines = self.scan_thread.scan_log.drain()
+        if lines:
+            self.log_area.append("\n".join(lines))
+
     def find_port(self):
-        ports = list(serial.tools.list_ports.comports())
-        for port in ports:
-            try:
-                ser = serial.Serial(port.device, 9600, timeout=1)
-                ser.write(b"ver\r\n")
-                time.sleep(0.1)
-                response = ser.read_all().decode(errors='ignore')
-                ser.close()
-                if "ANC300" in response:
-                    self.port_input.setText(port.device)
-                    self.log(f"发现ANC300串口: {port.device}")
-                    return
-            except:
-                continue
+        # 探测在后台进行，界面保持响应
+        self.btn_find_port.setEnabled(False)
+        self.bridge.submit(self._find_controller(), on_result=self.port_found,
+                           on_error=self.port_error)
+
+    async def _find_controller(self):
+        # 串口探测（阻塞）在线程中进行；找到后经共用的持久连接读取版本和各轴模式
+        port = await asyncio.to_thread(self._open_session)
+        if not port:
+            return None
+        session = await asyncio.to_thread(self.sessions.get, port)
+        try:
+            async with AsyncANC300(session) as device:
+                version = await device.ver()
+                replies = await device.run(f"getm {axis}" for axis in STATUS_AXES)
+        except ANC300Error as e:
+            self.bridge.post_message(f"读取控制器状态失败: {e}")
+        else:
+            modes = "，".join(f"{axis}: {reply.values.get('mode')}"
+                             for axis, reply in zip(STATUS_AXES, replies))
+            self.bridge.post_message(f"{version}\n各轴模式 {modes}")
+        return port
+
+    def _open_session(self):
+        # 已有可用的连接时直接使用，否则探测其余串口并建立持久连接
+        port = self.sessions.healthy_port()
+        if port:
+            self.bridge.post_message(f"使用已连接的控制器: {port}")
+            return port
+        port = find_anc300_port(log=self.bridge.post_message, exclude=self.sessions.ports())
+        if port:
+            self.sessions.get(port)
+        return port
+
+    @staticmethod
+    def parse_axes(text):
+        # "1,2 3" -> (1, 2, 3)；有无效轴号时返回 None
+        parts = text.replace("，", ",").replace(",", " ").split()
+        if not all(p.isdigit() and 1 <= int(p) <= 7 for p in parts):
+            return None
+        return tuple(int(p) for p in parts)
+
+    def port_found(self, port):
+        self.btn_find_port.setEnabled(True)
+        if port:
+            self.port_input.setText(port)
+            return
         self.log("未找到ANC300串口，请检查连接。")
 
+    def port_error(self, error):
+        self.btn_find_port.setEnabled(True)
+        self.log(f"串口检测失败: {error}")
+
+    def closeEvent(self, event):
+        if self.scan_thread and self.scan_thread.isRunning():
+            self.scan_thread.stop()
+            self.scan_thread.wait()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        self.sessions.close_all()
+        self.bridge.shutdown()
+        super().closeEvent(event)
+
     def start_scan(self):
         if self.scan_thread and self.scan_thread.isRunning():
             QMessageBox.warning(self, "警告", "扫描正在进行中，请稍后。")
@@ -174,7 +461,8 @@ class ANC300ScanGUI(QWidget):
             a = float(self.entry_range.text())
             d = float(self.entry_step.text())
             delay = float(self.entry_delay.text())
-            if a <= 0 or d <= 0 or delay < 0:
+            window = int(self.entry_window.text())
+            if a <= 0 or d <= 0 or delay < 0 or window < 1:
                 raise ValueError
             if d > a:
                 QMessageBox.warning(self, "参数错误", "步长不能大于扫描范围。")
@@ -188,14 +476,86 @@ class ANC300ScanGUI(QWidget):
             QMessageBox.warning(self, "错误", "请填写串口号或使用自动检测。")
             return
 
-        self.scan_thread = ScanThread(port, a, d, delay)
-        self.scan_thread.log_signal.connect(self.log)
+        z_text = self.z_axis_input.text().strip()
+        if z_text and not z_text.isdigit():
+            QMessageBox.warning(self, "输入错误", "Z 轴应为轴号 1~7。")
+            return
+        check_axes = self.parse_axes(self.check_axes_input.text())
+        if check_axes is None:
+            QMessageBox.warning(self, "输入错误", "检查电容的轴应为 1~7 的轴号，用逗号分隔。")
+            return
+
+        settling = SettlingModel.load(log=self.log) if self.check_adaptive.isChecked() else None
+        self.run_thread(ScanThread(port, a, d, delay, window,
+                                   pattern=self.combo_pattern.currentText(),
+                                   settling=settling,
+                                   save_dir=self.save_dir_input.text().strip() or None,
+                                   z_axis=int(z_text) if z_text else None,
+                                   check_axes=check_axes,
+                                   sessions=self.sessions))
+        self.log("开始扫描...")
+
+    def resume_scan(self):
+        if self.scan_thread and self.scan_thread.isRunning():
+            QMessageBox.warning(self, "警告", "扫描正在进行中，请稍后。")
+            return
+        # 优先使用本次会话中断的扫描；否则把保存目录当作已有的扫描数据目录读取断点
+        checkpoint = None
+        if self.scan_thread and not self.scan_thread.completed:
+            checkpoint = self.scan_thread.checkpoint
+        if checkpoint is None and self.save_dir_input.text().strip():
+            checkpoint = read_checkpoint(self.save_dir_input.text().strip())
+        if checkpoint is None or checkpoint.get("completed"):
+            QMessageBox.warning(self, "错误", "没有可继续的扫描。")
+            return
+
+        port = self.port_input.text().strip()
+        if not port:
+            QMessageBox.warning(self, "错误", "请填写串口号或使用自动检测。")
+            return
+
+        settling = SettlingModel.load(log=self.log) if self.check_adaptive.isChecked() else None
+        check_axes = self.parse_axes(self.check_axes_input.text())
+        if check_axes is None:
+            QMessageBox.warning(self, "输入错误", "检查电容的轴应为 1~7 的轴号，用逗号分隔。")
+            return
+        thread = ScanThread.from_checkpoint(port, checkpoint, settling=settling,
+                                            sessions=self.sessions)
+        thread.check_axes = check_axes
+        self.run_thread(thread)
+        self.log(f"继续扫描（第 {checkpoint['row']} 行起）...")
+
+    def run_thread(self, thread):
+        self.scan_thread = thread
+        self.scan_thread.scan_log = ScanLog.for_scan(capacity=LOG_MAX_LINES)
+        self.log(f"扫描日志: {self.scan_thread.scan_log.path}")
+        self.log_timer.start()
+        self.live_view.reset(*thread.frame_shape())
+        if thread.z_axis and thread.resume and thread.resume.get("store"):
+            # 继续扫描时先显示已保存的行
+            store = ScanStore.open(thread.resume["store"])
+            for row, values in enumerate(store.completed("z_volt")):
+                self.live_view.add_row(row, values)
+            store.close()
+        if thread.z_axis:
+            self.pipeline = self.make_pipeline(thread)
+            self.pipeline.start()
         self.scan_thread.finished_signal.connect(self.scan_finished)
         self.scan_thread.start()
 
         self.btn_start_scan.setEnabled(False)
+        self.btn_resume_scan.setEnabled(False)
         self.btn_stop_scan.setEnabled(True)
-        self.log("开始扫描...")
+
+    def make_pipeline(self, thread):
+        # 扫描线程每完成一行推入 LineSource（不阻塞扫描），处理在流水线线程中进行，
+        # 结果经 post_row 排队送回 GUI 线程显示；显示跟不上时跳过部分行
+        thread.line_source = LineSource()
+        stages = []
+        if self.check_level.isChecked():
+            stages.append(Stage("level", level_lines("z_volt")))
+        stages.append(Stage("view", row_sink(self.live_view.post_row, "z_volt"), drop=True))
+        return Pipeline(thread.line_source, stages)
 
     def stop_scan(self):
         if self.scan_thread and self.scan_thread.isRunning():
@@ -203,8 +563,19 @@ class ANC300ScanGUI(QWidget):
             self.log("停止扫描请求已发送，等待线程结束...")
 
     def scan_finished(self):
+        self.log_timer.stop()
+        self.flush_scan_log()
+        self.scan_thread.scan_log.close()
+        if self.pipeline is not None:
+            try:
+                self.pipeline.join(timeout=2.0)
+                self.log(self.pipeline.summary())
+            except Exception as e:
+                self.log(f"显示处理出错: {e}")
+            self.pipeline = None
         self.log("扫描线程结束。")
         self.btn_start_scan.setEnabled(True)
+        self.btn_resume_scan.setEnabled(True)
         self.btn_stop_scan.setEnabled(False)
 
 
@@ -0,0 +1,120 @@
+# 扫描线程的日志
+# 扫描线程每个像素都会产生日志，逐条发给 GUI 会让 QTextEdit 无限增长、拖慢扫描。
+# ScanLog 把最近的日志保存在定长环形缓冲区里，GUI 按固定频率成批取走显示；
+# 完整的结构化日志（JSON Lines）由后台线程写到磁盘。内存和每像素开销与扫描长度无关。
+
+import collections
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+# 日志文件默认目录
+LOG_DIR = os.path.join(os.path.expanduser("~"), ".kpfm_control", "logs")
+
+_STOP = object()
+
+
+class ScanLog:
+    """线程安全的扫描日志
+
+    capacity：环形缓冲区保留的最近行数
+    batch_limit：两次 drain() 之间最多保留的待显示行数，多出的旧行只写入文件
+    path：结构化日志文件，None 表示不写文件
+    """
+
+    def __init__(self, path=None, capacity=1000, batch_limit=200, flush_interval=0.5):
+        self.path = path
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=capacity)
+        self._pending = collections.deque(maxlen=batch_limit)
+        self._dropped = 0
+        self.count = 0
+        self._queue = None
+        self._writer = None
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._queue = queue.Queue(maxsize=10000)
+            self._writer = threading.Thread(target=self._write_loop, args=(flush_interval,),
+                                            daemon=True)
+            self._writer.start()
+
+    @classmethod
+    def for_scan(cls, log_dir=LOG_DIR, **kwargs):
+        # 每次扫描一个带时间戳（到毫秒）的日志文件；用 "x" 模式先占用文件名，
+        # 同一毫秒内启动的扫描依次加序号，不会写进同一个文件
+        os.makedirs(log_dir, exist_ok=True)
+        now = time.time()
+        stem = time.strftime("scan_%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now % 1 * 1000):03d}"
+        for n in itertools.count():
+            path = os.path.join(log_dir, f"{stem}.jsonl" if n == 0 else f"{stem}_{n}.jsonl")
+            try:
+                open(path, "x").close()
+                return cls(path, **kwargs)
+            except FileExistsError:
+                continue
+
+    def log(self, message, level="info", **fields):
+        """记录一行；fields 为附加的结构化字段，只写入文件"""
+        with self._lock:
+            self.count += 1
+            self._recent.append(message)
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append(message)
+        if self._queue is not None:
+            record = {"t": time.time(), "level": level, "msg": message}
+            record.update(fields)
+            self._queue.put(record)  # 写盘跟不上时阻塞，保证文件日志完整
+
+    def drain(self):
+        """取走自上次调用以来的新行（供 GUI 定时刷新）"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            lines.insert(0, f"……省略 {dropped} 行（完整日志见 {self.path}）")
+        return lines
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    def close(self):
+        if self._queue is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._queue = None
+
+    def _write_loop(self, flush_interval):
+        with open(self.path, "a", encoding="utf-8") as f:
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    record = self._queue.get(timeout=flush_interval)
+                except queue.Empty:
+                    record = None
+                if record is _STOP:
+                    break
+                if record is not None:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if time.monotonic() - last_flush >= flush_interval:
+                    f.flush()
+                    last_flush = time.monotonic()
+
+
+def throttle(func, interval):
+    """返回一个包装函数：两次实际调用 func 之间至少间隔 interval 秒，其余调用直接忽略"""
+    last = [float("-inf")]
+
+    def wrapper(*args, **kwargs):
+        now = time.monotonic()
+        if now - last[0] >= interval:
+            last[0] = now
+            return func(*args, **kwargs)
+        return None
+
+    return wrapper
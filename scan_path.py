@@ -0,0 +1,73 @@
+# 扫描路径生成与位置→电压换算
+# 折返（boustrophedon）路径按需生成：可以逐点迭代，也可以按块得到 NumPy 数组，
+# 内存占用只与块大小有关，与扫描面积无关。
+
+import numpy as np
+
+DEFAULT_CHUNK = 4096  # 每块的点数
+
+
+class AxisCalibration:
+    """单轴位移→偏置电压的线性标定，超出范围的电压被截断到 [v_min, v_max]"""
+
+    def __init__(self, volt_per_um, v_min=0.0, v_max=60.0, offset=0.0):
+        self.volt_per_um = volt_per_um
+        self.v_min = v_min
+        self.v_max = v_max
+        self.offset = offset  # 位移为 0 时的电压
+
+    @classmethod
+    def from_range(cls, travel_um, v_max=60.0, v_min=0.0):
+        # travel_um 对应 v_max，例如 50 μm 对应 60 V
+        return cls(v_max / travel_um, v_min=v_min, v_max=v_max)
+
+    def to_voltage(self, pos):
+        """pos 可以是标量或数组"""
+        volts = np.clip(self.offset + self.volt_per_um * np.asarray(pos, dtype=float),
+                        self.v_min, self.v_max)
+        return float(volts) if volts.ndim == 0 else volts
+
+
+def num_steps(a, d):
+    # 每边的点数
+    return int(a / d) + 1
+
+
+def count_scan_positions(a, d):
+    return num_steps(a, d) ** 2
+
+
+def iter_scan_positions(a, d):
+    """逐点生成 (x, y)：x 为慢轴，y 为快轴，奇数行反向（折返扫描）"""
+    n = num_steps(a, d)
+    for i in range(n):
+        x = i * d
+        for j in range(n):
+            y = j * d if i % 2 == 0 else (n - 1 - j) * d
+            yield x, y
+
+
+def scan_position_chunks(a, d, chunk_size=DEFAULT_CHUNK, start=0):
+    """按块生成位置数组 (xs, ys)，顺序与 iter_scan_positions 相同
+
+    start 为起始点的序号，用于从中途继续扫描。
+    """
+    n = num_steps(a, d)
+    total = n * n
+    for k0 in range(start, total, chunk_size):
+        k = np.arange(k0, min(k0 + chunk_size, total))
+        i, j = np.divmod(k, n)
+        j = np.where(i % 2 == 0, j, n - 1 - j)
+        yield i * d, j * d
+
+
+def positions_to_voltages(xs, ys, cal_x, cal_y):
+    """批量换算 X/Y 位置为电压"""
+    return cal_x.to_voltage(xs), cal_y.to_voltage(ys)
+
+
+def scan_voltage_chunks(a, d, cal_x, cal_y, chunk_size=DEFAULT_CHUNK, start=0):
+    """按块生成 (xs, ys, x_volts, y_volts)"""
+    for xs, ys in scan_position_chunks(a, d, chunk_size, start):
+        x_volts, y_volts = positions_to_voltages(xs, ys, cal_x, cal_y)
+        yield xs, ys, x_volts, y_volts
@@ -0,0 +1,243 @@
+# 扫描轨迹库
+# 除了折返光栅外，提供等线速度螺旋、Lissajous 和摆线轨迹。非光栅轨迹没有大的回扫跳变，
+# 压电管的移动和稳定时间短得多，代价是采样点在图像网格上不均匀，需要用
+# resample_to_grid() 映射回规则网格。
+#
+# 所有轨迹都按块生成位置数组（与 scan_path 相同），坐标范围为 [0, a] μm。
+
+import math
+
+import numpy as np
+
+from scan_path import DEFAULT_CHUNK, num_steps, scan_position_chunks
+
+
+class ScanPattern:
+    """轨迹基类：子类实现 count() 和 positions_at(k)"""
+
+    name = ""
+
+    def __init__(self, a, d):
+        self.a = a
+        self.d = d
+
+    def count(self):
+        raise NotImplementedError
+
+    def positions_at(self, k):
+        """第 k 个采样点的位置，k 为整数数组"""
+        raise NotImplementedError
+
+    def chunks(self, chunk_size=DEFAULT_CHUNK, start=0):
+        total = self.count()
+        for k0 in range(start, total, chunk_size):
+            yield self.positions_at(np.arange(k0, min(k0 + chunk_size, total)))
+
+    def grid_size(self):
+        # 重采样目标网格的边长（与光栅扫描相同）
+        return num_steps(self.a, self.d)
+
+    def estimate_time(self, velocity=100.0, settle_tau=0.002, tolerance=0.01,
+                      chunk_size=DEFAULT_CHUNK):
+        """估计整帧的移动和稳定时间
+
+        velocity：压电管移动速度 (μm/s)
+        settle_tau：一阶稳定时间常数 (s)，每步稳定到 tolerance (μm) 以内需要
+                    settle_tau * ln(步长 / tolerance)
+        """
+        path_length = 0.0
+        settle = 0.0
+        max_jump = 0.0
+        prev = None
+        for xs, ys in self.chunks(chunk_size):
+            if prev is not None:
+                xs = np.concatenate(([prev[0]], xs))
+                ys = np.concatenate(([prev[1]], ys))
+            jumps = np.hypot(np.diff(xs), np.diff(ys))
+            prev = (xs[-1], ys[-1])
+            if jumps.size == 0:
+                continue
+            path_length += float(jumps.sum())
+            max_jump = max(max_jump, float(jumps.max()))
+            ratio = np.maximum(jumps / tolerance, 1.0)
+            settle += float(settle_tau * np.log(ratio).sum())
+        move = path_length / velocity
+        return {
+            "pattern": self.name,
+            "samples": self.count(),
+            "path_length_um": path_length,
+            "max_jump_um": max_jump,
+            "move_s": move,
+            "settle_s": settle,
+            "total_s": move + settle,
+        }
+
+
+class RasterPattern(ScanPattern):
+    """折返光栅（与 scan_path 相同）"""
+
+    name = "raster"
+
+    def count(self):
+        return num_steps(self.a, self.d) ** 2
+
+    def chunks(self, chunk_size=DEFAULT_CHUNK, start=0):
+        return scan_position_chunks(self.a, self.d, chunk_size, start)
+
+    def positions_at(self, k):
+        n = num_steps(self.a, self.d)
+        i, j = np.divmod(np.asarray(k), n)
+        j = np.where(i % 2 == 0, j, n - 1 - j)
+        return i * self.d, j * self.d
+
+
+class SpiralPattern(ScanPattern):
+    """等线速度阿基米德螺旋，从中心向外，环间距为 d，沿轨迹每 d 取一点
+
+    螺旋只覆盖扫描区域的内切圆，四角由重采样时的近邻填充。
+    """
+
+    name = "spiral"
+
+    def _length(self):
+        # 半径 R、环间距 p 的阿基米德螺旋长度约为 π R² / p
+        r_max = self.a / 2.0
+        return math.pi * r_max ** 2 / self.d
+
+    def count(self):
+        return int(self._length() / self.d) + 1
+
+    def positions_at(self, k):
+        s = np.asarray(k, dtype=float) * self.d  # 弧长
+        theta = np.sqrt(4.0 * np.pi * s / self.d)
+        r = self.d * theta / (2.0 * np.pi)
+        c = self.a / 2.0
+        return c + r * np.cos(theta), c + r * np.sin(theta)
+
+
+class LissajousPattern(ScanPattern):
+    """Lissajous 轨迹：x、y 为频率相差 1 的正弦，一帧内交叉 n 条线"""
+
+    name = "lissajous"
+
+    def __init__(self, a, d, oversample=1.0):
+        super().__init__(a, d)
+        n = num_steps(a, d)
+        self.fx = n
+        self.fy = n + 1
+        self.oversample = oversample
+
+    def count(self):
+        # x、y 方向各来回 fx、fy 次，轨迹长度约为两者的合成
+        length = 2.0 * self.a * math.hypot(self.fx, self.fy)
+        return int(self.oversample * length / self.d) + 1
+
+    def positions_at(self, k):
+        t = np.asarray(k, dtype=float) / self.count()
+        half = self.a / 2.0
+        xs = half * (1.0 - np.cos(2.0 * np.pi * self.fx * t))
+        ys = half * (1.0 - np.cos(2.0 * np.pi * self.fy * t))
+        return xs, ys
+
+
+class CycloidPattern(ScanPattern):
+    """摆线轨迹：探针沿快轴匀速前进的同时绕直径为 d 的小圆运动，行间距 d，行间折返
+
+    小圆每转一圈前进 d，相邻行首尾相接，没有回扫跳变。
+    """
+
+    name = "cycloid"
+
+    def __init__(self, a, d, samples_per_turn=8):
+        super().__init__(a, d)
+        self.rows = num_steps(a, d)
+        self.turns = max(1, int(round(a / d)))
+        self.samples_per_turn = samples_per_turn
+
+    def _per_row(self):
+        return self.turns * self.samples_per_turn + 1
+
+    def count(self):
+        return self.rows * self._per_row()
+
+    def positions_at(self, k):
+        row, m = np.divmod(np.asarray(k), self._per_row())
+        phase = 2.0 * np.pi * m / self.samples_per_turn
+        u = m * (self.a / (self._per_row() - 1))  # 沿快轴的中心位置
+        u = np.where(row % 2 == 0, u, self.a - u)
+        r = self.d / 2.0
+        xs = np.clip(u + r * np.sin(phase), 0.0, self.a)
+        ys = np.clip(row * self.d + r * (1.0 - np.cos(phase)), 0.0, self.a)
+        return xs, ys
+
+
+PATTERNS = {
+    "raster": RasterPattern,
+    "spiral": SpiralPattern,
+    "lissajous": LissajousPattern,
+    "cycloid": CycloidPattern,
+}
+
+
+def make_pattern(name, a, d, **kwargs):
+    try:
+        cls = PATTERNS[name]
+    except KeyError:
+        raise ValueError(f"未知扫描轨迹: {name}") from None
+    return cls(a, d, **kwargs)
+
+
+def resample_to_grid(xs, ys, values, a, n, fill=True):
+    """把任意位置的采样值平均到 n×n 网格上（行为 y，列为 x）
+
+    落在同一格的采样取平均；fill 为 True 时空格用相邻格的平均值逐步填充，
+    否则为 NaN。可以对多个块分别调用后用 GridAccumulator 累加。
+    """
+    acc = GridAccumulator(a, n)
+    acc.add(xs, ys, values)
+    return acc.image(fill=fill)
+
+
+class GridAccumulator:
+    """逐块累加采样值，最后得到网格图像"""
+
+    def __init__(self, a, n):
+        self.a = a
+        self.n = n
+        self.sums = np.zeros(n * n)
+        self.counts = np.zeros(n * n)
+
+    def add(self, xs, ys, values):
+        scale = self.n / self.a
+        ix = np.clip((np.asarray(xs) * scale).astype(int), 0, self.n - 1)
+        iy = np.clip((np.asarray(ys) * scale).astype(int), 0, self.n - 1)
+        idx = iy * self.n + ix
+        self.sums += np.bincount(idx, weights=np.asarray(values, dtype=float),
+                                 minlength=self.n * self.n)
+        self.counts += np.bincount(idx, minlength=self.n * self.n)
+
+    def image(self, fill=True):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            img = (self.sums / self.counts).reshape(self.n, self.n)
+        if fill:
+            img = _fill_nan(img)
+        return img
+
+
+def _fill_nan(img):
+    # 用四邻域的平均值逐圈填充空格
+    img = img.copy()
+    missing = np.isnan(img)
+    if missing.all():
+        return img
+    while missing.any():
+        padded = np.pad(img, 1, constant_values=np.nan)
+        neighbours = np.stack([padded[:-2, 1:-1], padded[2:, 1:-1],
+                               padded[1:-1, :-2], padded[1:-1, 2:]])
+        valid = ~np.isnan(neighbours)
+        count = valid.sum(axis=0)
+        total = np.where(valid, neighbours, 0.0).sum(axis=0)
+        update = missing & (count > 0)
+        img[update] = total[update] / count[update]
+        missing = np.isnan(img)
+    return img
@@ -0,0 +1,474 @@
+# 流式采集流水线
+# 数据源（硬件扫描、模拟器、已保存的 ScanStore）逐块产生若干行数据，
+# 处理级（调平、滤波、单位换算）和输出级（写盘、GUI 显示）各在自己的线程中运行，
+# 级与级之间用有界队列连接：
+#   - 下游处理不过来时，上游在 put 时阻塞（背压），内存占用有上限；
+#   - 标记为 drop 的级（如实时显示）队列满时直接丢弃新块，绝不拖慢上游；
+#   - 每一级记录处理块数、行数、处理耗时、等待输入和被下游阻塞的时间。
+# 移动/测量循环只负责采集，处理和存储在其他核上并行进行。
+#
+# 用法：
+#   pipeline = Pipeline(simulator_source(seed=0), [
+#       Stage("level", level_lines("height")),
+#       Stage("store", store_sink(store)),
+#       Stage("view", row_sink(view.post_row, "height"), drop=True),
+#   ])
+#   pipeline.run()
+#   print(pipeline.summary())
+#
+# 硬件扫描时用 LineSource 作为数据源：ScanThread 每完成一行调用 put()（从不阻塞，
+# 流水线积压时丢弃该行，原始数据仍由 ScanThread 直接写入 ScanStore），结束时 close()。
+# 输出到 Qt 控件的级运行在流水线线程中，必须经排队信号回到 GUI 线程（如 LiveImageView.post_row）。
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+import image_processing
+
+# 队列中表示数据结束的标记
+_END = object()
+
+
+class Block:
+    """连续若干行数据：row 为起始行号，data 为 {通道名: 二维数组 (行, 列)}"""
+
+    def __init__(self, row, data, meta=None):
+        self.row = row
+        self.data = data
+        self.meta = meta if meta is not None else {}
+
+    @property
+    def rows(self):
+        return len(next(iter(self.data.values()))) if self.data else 0
+
+    def __repr__(self):
+        return f"Block(row={self.row}, rows={self.rows}, channels={list(self.data)})"
+
+
+class StageStats:
+    """一级的吞吐统计（时间单位为秒）"""
+
+    def __init__(self, name):
+        self.name = name
+        self.blocks = 0
+        self.rows = 0
+        self.busy = 0.0      # 处理耗时
+        self.wait_in = 0.0   # 等待上游数据
+        self.wait_out = 0.0  # 被下游阻塞（背压）
+        self.dropped = 0     # drop 模式下因队列满而丢弃的块
+        self.max_queue = 0   # 输入队列的最大深度
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self):
+        """实际吞吐（行/秒，按运行时间）"""
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def capacity(self):
+        """处理能力（行/秒，只算处理耗时），远大于 rate 说明该级有余量"""
+        return self.rows / self.busy if self.busy > 0 else float("inf")
+
+    @property
+    def utilization(self):
+        return self.busy / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            "name": self.name, "blocks": self.blocks, "rows": self.rows,
+            "busy_s": self.busy, "wait_in_s": self.wait_in, "wait_out_s": self.wait_out,
+            "dropped": self.dropped, "max_queue": self.max_queue, "elapsed_s": self.elapsed,
+            "rate_rows_s": self.rate, "capacity_rows_s": self.capacity,
+            "utilization": self.utilization,
+        }
+
+    def summary(self):
+        text = (f"{self.name}: {self.blocks} 块 / {self.rows} 行，{self.rate:.1f} 行/s，"
+                f"占用 {self.utilization:.0%}，等待输入 {self.wait_in:.2f}s，"
+                f"被下游阻塞 {self.wait_out:.2f}s，队列最深 {self.max_queue}")
+        if self.dropped:
+            text += f"，丢弃 {self.dropped} 块"
+        return text
+
+
+class Stage:
+    """流水线中的一级
+
+    func(block)：返回处理后的块（可以是原块）；返回 None 表示丢弃该块，不再往下传
+    maxsize：输入队列长度
+    drop：为 True 时输入队列满则丢弃新块（上游不等待），适合实时显示等可以跳帧的输出
+    """
+
+    def __init__(self, name, func, maxsize=4, drop=False):
+        self.name = name
+        self.func = func
+        self.maxsize = maxsize
+        self.drop = drop
+        self.queue = queue.Queue(maxsize)
+        self.stats = StageStats(name)
+
+
+class Pipeline:
+    """数据源 + 若干级，每级（包括数据源）一个线程
+
+    source：可迭代对象，产生 Block（或 (起始行号, {通道名: 行块}) / (起始行号, 行块)，
+            后者的通道名为 channel）
+    """
+
+    def __init__(self, source, stages, channel="height"):
+        self.source = source
+        self.stages = list(stages)
+        self.channel = channel
+        self.source_stats = StageStats("source")
+        self.error = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    # -------------------- 运行 --------------------
+    def start(self):
+        self._stop_event.clear()
+        self.error = None
+        targets = [(self._run_source, "source")]
+        targets += [(lambda i=i: self._run_stage(i), stage.name)
+                    for i, stage in enumerate(self.stages)]
+        self._threads = [threading.Thread(target=target, daemon=True, name=f"pipeline-{name}")
+                         for target, name in targets]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def join(self, timeout=None):
+        """等待全部数据处理完；任何一级出错时在这里重新抛出"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if self.error is not None:
+            raise self.error
+        return all(not t.is_alive() for t in self._threads)
+
+    def run(self):
+        self.start()
+        self.join()
+        return self
+
+    def stop(self):
+        """中止：数据源不再取新块，各级尽快退出（队列中未处理的块被丢弃）"""
+        self._stop_event.set()
+        if isinstance(self.source, LineSource):
+            self.source.close()
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    # -------------------- 线程 --------------------
+    def _as_block(self, item):
+        if isinstance(item, Block):
+            return item
+        row, data = item
+        if not isinstance(data, dict):
+            data = {self.channel: data}
+        return Block(row, {name: np.atleast_2d(v) for name, v in data.items()})
+
+    def _run_source(self):
+        stats = self.source_stats
+        stats.started = time.perf_counter()
+        iterator = iter(self.source)
+        try:
+            while not self._stop_event.is_set():
+                t0 = time.perf_counter()
+                try:
+                    block = self._as_block(next(iterator))
+                except StopIteration:
+                    break
+                stats.busy += time.perf_counter() - t0
+                stats.blocks += 1
+                stats.rows += block.rows
+                self._send(0, block, stats)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()  # 中途停止时让生成器执行清理（如接地、关闭文件）
+            stats.finished = time.perf_counter()
+            stats.dropped = getattr(self.source, "dropped", 0)  # LineSource 在入口丢弃的行
+            self._send(0, _END, stats)
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        stats = stage.stats
+        stats.started = time.perf_counter()
+        try:
+            while True:
+                t0 = time.perf_counter()
+                block = stage.queue.get()
+                stats.wait_in += time.perf_counter() - t0
+                if block is _END:
+                    break
+                if self._stop_event.is_set():
+                    continue  # 中止后只排空队列，等待结束标记
+                t0 = time.perf_counter()
+                try:
+                    out = stage.func(block)
+                except Exception as e:
+                    self._fail(e)
+                    continue
+                stats.busy += time.perf_counter() - t0
+                stats.blocks += 1
+                stats.rows += block.rows
+                if out is not None:
+                    self._send(index + 1, out, stats)
+        finally:
+            stats.finished = time.perf_counter()
+            self._send(index + 1, _END, stats)
+
+    def _send(self, index, item, stats):
+        # 送到第 index 级的输入队列；最后一级的输出直接丢掉
+        if index >= len(self.stages):
+            return
+        target = self.stages[index]
+        q = target.queue
+        if target.drop and item is not _END:
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                target.stats.dropped += 1
+        else:
+            t0 = time.perf_counter()
+            while True:
+                try:
+                    q.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    # 下游已停止时不再等待（结束标记除外，下游总会取走）
+                    if self._stop_event.is_set() and item is not _END:
+                        break
+            stats.wait_out += time.perf_counter() - t0
+        target.stats.max_queue = max(target.stats.max_queue, q.qsize())
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.stop()
+
+    # -------------------- 统计 --------------------
+    def stats(self):
+        return [self.source_stats] + [stage.stats for stage in self.stages]
+
+    def to_dict(self):
+        return [s.to_dict() for s in self.stats()]
+
+    def summary(self):
+        lines = [s.summary() for s in self.stats()]
+        slowest = min(self.stages, key=lambda st: st.stats.capacity, default=None)
+        if slowest is not None and slowest.stats.rows:
+            lines.append(f"最慢的级: {slowest.name}（{slowest.stats.capacity:.1f} 行/s）")
+        return "\n".join(lines)
+
+
+# -------------------- 数据源 --------------------
+class LineSource:
+    """由采集线程逐行推入数据的数据源（硬件扫描用）
+
+    put() 从不阻塞：队列满时丢弃该行并计入 dropped，处理级慢不会拖住压电管的移动/测量循环；
+    rows_per_block 行凑成一块再交给流水线（行号不连续时提前成块），close() 时输出剩余的行。
+    """
+
+    def __init__(self, rows_per_block=1, maxsize=16):
+        self.rows_per_block = rows_per_block
+        self._queue = queue.Queue(maxsize)
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, row, line):
+        """line：{通道名: 一行数据}，或从 row 开始的连续若干行 {通道名: 二维数组}；返回是否已放入队列"""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait((row, line))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            while True:
+                try:
+                    self._queue.put_nowait(_END)
+                    return
+                except queue.Full:
+                    pass
+                # 队列满时清掉一个，保证结束标记能放进去；消费者可能同时取空了队列
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def __iter__(self):
+        pending = []
+        rows = 0
+        while True:
+            item = self._queue.get()
+            if item is _END or (pending and item[0] != pending[0][0] + rows):
+                if pending:
+                    yield _stack(pending)
+                pending, rows = [], 0
+            if item is _END:
+                return
+            pending.append(item)
+            rows += len(np.atleast_2d(next(iter(item[1].values()))))
+            if rows >= self.rows_per_block:
+                yield _stack(pending)
+                pending, rows = [], 0
+
+
+def _stack(lines):
+    names = lines[0][1].keys()
+    return Block(lines[0][0], {name: np.vstack([np.atleast_2d(line[name]) for _, line in lines])
+                               for name in names})
+
+
+def simulator_source(seed=None, rows_per_block=8, surface="sine", rows_per_second=None):
+    """afm_simulator 的逐块扫描结果（height 通道）；rows_per_second 给出时按该速度产出"""
+    import afm_simulator  # 在这里导入（含 matplotlib），不计入数据源的耗时
+
+    rng = np.random.default_rng(seed)
+    blocks = afm_simulator.iter_scan_blocks(rng, rows_per_block,
+                                            afm_simulator.resolve_surface(surface))
+
+    def generate():
+        t0 = time.perf_counter()
+        for j0, block in blocks:
+            if rows_per_second:
+                delay = t0 + (j0 + len(block)) / rows_per_second - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield Block(j0, {"height": block})
+    return generate()
+
+
+def store_source(store, rows_per_block=8, channels=None):
+    """回放 ScanStore 中已完成的行"""
+    channels = list(channels or store.channels)
+    done = store.lines_completed
+    for j0 in range(0, done, rows_per_block):
+        j1 = min(j0 + rows_per_block, done)
+        yield Block(j0, {name: np.array(store.channel(name)[j0:j1]) for name in channels})
+
+
+# -------------------- 处理级 --------------------
+def level_lines(channel="height", order=1, sigma=None):
+    """逐行减去 order 阶多项式拟合（去除每行的倾斜和偏移），一块中所有行一起拟合
+
+    sigma：给出时屏蔽残差超过 sigma 倍标准差的异常点后再拟合，见 image_processing.fit_lines
+    """
+    def level(block):
+        block.data[channel] = image_processing.flatten_lines(
+            np.asarray(block.data[channel], dtype=float), order, sigma)
+        return block
+    return level
+
+
+def smooth_lines(channel="height", width=3):
+    """沿行方向的滑动平均（边缘按实际点数平均）"""
+    def smooth(block):
+        data = np.asarray(block.data[channel], dtype=float)
+        n = data.shape[1]
+        csum = np.cumsum(np.pad(data, ((0, 0), (1, 0))), axis=1)
+        lo = np.clip(np.arange(n) - width // 2, 0, n)
+        hi = np.clip(np.arange(n) + width - width // 2, 0, n)
+        block.data[channel] = (csum[:, hi] - csum[:, lo]) / (hi - lo)
+        return block
+    return smooth
+
+
+def convert_units(channel, scale, offset=0.0, name=None, unit=None):
+    """线性单位换算 value * scale + offset；name 给出时另存为新通道，原通道保留"""
+    def convert(block):
+        block.data[name or channel] = np.asarray(block.data[channel]) * scale + offset
+        if unit is not None:
+            block.meta.setdefault("units", {})[name or channel] = unit
+        return block
+    return convert
+
+
+# -------------------- 输出级 --------------------
+def store_sink(store, channels=None):
+    """把块写入 ScanStore（只写存储中有的通道），块原样往下传"""
+    def write(block):
+        names = channels or [name for name in block.data if name in store.channels]
+        store.write_lines(block.row, {name: block.data[name] for name in names})
+        return block
+    return write
+
+
+def row_sink(callback, channel="height"):
+    """逐行调用 callback(行号, 一行数据)
+
+    callback 在流水线线程中调用；Qt 控件要用线程安全的入口，如 LiveImageView.post_row
+    或排队连接的信号的 emit，不能直接调用 add_row 这类槽函数。
+    """
+    def emit(block):
+        for k, line in enumerate(block.data[channel]):
+            callback(block.row + k, line)
+        return block
+    return emit
+
+
+class FrameSink:
+    """把各块拼成完整的帧（测试或离线处理用）：frame.data[通道名] 为 (行, 列) 数组"""
+
+    def __init__(self):
+        self.data = {}
+        self.rows = 0
+
+    def __call__(self, block):
+        for name, values in block.data.items():
+            arr = self.data.get(name)
+            need = block.row + len(values)
+            if arr is None:
+                arr = self.data[name] = np.full((need, values.shape[1]), np.nan)
+            elif len(arr) < need:
+                arr = self.data[name] = np.vstack(
+                    [arr, np.full((need - len(arr), arr.shape[1]), np.nan)])
+            arr[block.row:need] = values
+        self.rows = max(self.rows, block.row + block.rows)
+        return block
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="用模拟器数据测试采集流水线")
+    parser.add_argument("--rows-per-block", type=int, default=8)
+    parser.add_argument("--rows-per-second", type=float, default=None,
+                        help="模拟采集速度（默认不限速）")
+    parser.add_argument("--maxsize", type=int, default=4, help="各级队列长度")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    frame = FrameSink()
+    pipeline = Pipeline(
+        simulator_source(args.seed, args.rows_per_block, rows_per_second=args.rows_per_second),
+        [Stage("level", level_lines("height"), args.maxsize),
+         Stage("smooth", smooth_lines("height", 3), args.maxsize),
+         Stage("nm", convert_units("height", 1000.0, name="height_nm", unit="nm"), args.maxsize),
+         Stage("frame", frame, args.maxsize)])
+    t0 = time.perf_counter()
+    pipeline.run()
+    print(f"{frame.rows} 行，用时 {time.perf_counter() - t0:.3f}s")
+    print(pipeline.summary())
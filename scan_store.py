@@ -0,0 +1,260 @@
+# 扫描数据的增量存储
+# 每个通道是一个内存映射的 .npy 文件，每完成一行就写入并刷到磁盘，
+# 元数据（扫描范围、步长、电压、时间戳、已完成行数）保存在 meta.json。
+# 帧可以比内存大；扫描中途崩溃时已完成的行不会丢失；
+# 读取方可以在扫描进行中用 ScanStore.open() 只读打开，不复制数据。
+#
+# 目录结构：
+#   <path>/meta.json
+#   <path>/<通道名>.npy
+#   <path>/line_times.npy   每行完成的时间戳（未完成为 NaN）
+#   <path>/checkpoint.json  断点信息（可选，用于中断后继续扫描）
+#   <path>/samples.npy      非光栅轨迹的网格存储中各格的采样数（见 GridBuffer）
+
+import json
+import os
+import time
+
+import numpy as np
+
+from scan_patterns import GridAccumulator
+
+META_FILE = "meta.json"
+CHECKPOINT_FILE = "checkpoint.json"
+# 网格存储中记录各格采样数的通道
+SAMPLES_CHANNEL = "samples"
+
+
+class ScanStore:
+    def __init__(self, path, meta, mode):
+        self.path = path
+        self.meta = meta
+        self.mode = mode
+        self._channels = {}
+        mmap_mode = "r+" if mode == "w" else "r"
+        for name in meta["channels"]:
+            self._channels[name] = np.load(self._file(name), mmap_mode=mmap_mode)
+        self.line_times = np.load(self._file("line_times"), mmap_mode=mmap_mode)
+
+    # -------------------- 创建与打开 --------------------
+    @classmethod
+    def create(cls, path, rows, cols, channels=("height",), dtype="float32", **metadata):
+        """新建存储；metadata 为任意可 JSON 序列化的扫描参数（范围、步长、电压等）"""
+        os.makedirs(path, exist_ok=False)
+        shape = (rows, cols)
+        for name in channels:
+            arr = np.lib.format.open_memmap(os.path.join(path, name + ".npy"), mode="w+",
+                                            dtype=dtype, shape=shape)
+            del arr  # 只分配文件，数据按行写入
+        times = np.lib.format.open_memmap(os.path.join(path, "line_times.npy"), mode="w+",
+                                          dtype="float64", shape=(rows,))
+        times[:] = np.nan
+        times.flush()
+        del times
+        meta = {
+            "shape": list(shape),
+            "channels": list(channels),
+            "dtype": np.dtype(dtype).name,
+            "lines_completed": 0,
+            "created": time.time(),
+            "finished": None,
+            "metadata": metadata,
+        }
+        _write_meta(path, meta)
+        return cls(path, meta, "w")
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """打开已有的存储；mode="r" 只读（可在扫描进行中打开），"w" 继续写入"""
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(path, meta, mode)
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".npy")
+
+    # -------------------- 写入 --------------------
+    def write_line(self, row, **values):
+        """写入第 row 行的各通道数据并刷盘"""
+        self.write_lines(row, {name: np.asarray(v)[np.newaxis] for name, v in values.items()})
+
+    def write_lines(self, row, blocks):
+        """从第 row 行开始写入一块连续行，blocks 为 {通道名: 二维数组}"""
+        if self.mode != "w":
+            raise IOError("存储以只读方式打开")
+        n = None
+        for name, block in blocks.items():
+            block = np.asarray(block)
+            self._channels[name][row:row + len(block)] = block
+            self._channels[name].flush()
+            n = len(block)
+        if n is None:
+            return
+        self.line_times[row:row + n] = time.time()
+        self.line_times.flush()
+        # 数据落盘后再更新行数，读取方看到的行一定是完整的
+        self.meta["lines_completed"] = max(self.meta["lines_completed"], row + n)
+        _write_meta(self.path, self.meta)
+
+    def update_metadata(self, **metadata):
+        self.meta["metadata"].update(metadata)
+        if self.mode == "w":
+            _write_meta(self.path, self.meta)
+
+    def finish(self):
+        self.meta["finished"] = time.time()
+        _write_meta(self.path, self.meta)
+
+    def write_checkpoint(self, checkpoint):
+        _write_json(os.path.join(self.path, CHECKPOINT_FILE), checkpoint)
+
+    def read_checkpoint(self):
+        return read_checkpoint(self.path)
+
+    # -------------------- 读取 --------------------
+    def refresh(self):
+        """重新读取元数据（读取方用来获得最新的已完成行数）"""
+        with open(os.path.join(self.path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        return self.lines_completed
+
+    @property
+    def lines_completed(self):
+        return self.meta["lines_completed"]
+
+    @property
+    def shape(self):
+        return tuple(self.meta["shape"])
+
+    @property
+    def channels(self):
+        return list(self.meta["channels"])
+
+    @property
+    def metadata(self):
+        return self.meta["metadata"]
+
+    def channel(self, name):
+        """整个通道的内存映射数组"""
+        return self._channels[name]
+
+    def completed(self, name):
+        """已完成的行（内存映射视图，不复制）"""
+        return self._channels[name][:self.lines_completed]
+
+    def close(self):
+        self._channels.clear()
+        self.line_times = None
+
+
+class LineBuffer:
+    """逐点累积数据，每满一行写入存储
+
+    serpentine 为 True 时奇数行反向写入，使折返扫描的数据按网格方向存放。
+    store 为 None 时只组装行、不写盘。
+    append() 在一行写完时返回 (行号, {通道名: 一行数据})，否则返回 None。
+    """
+
+    def __init__(self, cols, channels, store=None, row=0, serpentine=False):
+        self.store = store
+        self.row = row
+        self.cols = cols
+        self.serpentine = serpentine
+        self._values = {name: [] for name in channels}
+
+    @classmethod
+    def for_store(cls, store, row=0, serpentine=False):
+        return cls(store.shape[1], store.channels, store, row, serpentine)
+
+    def append(self, **values):
+        for name, v in values.items():
+            self._values[name].append(v)
+        if len(next(iter(self._values.values()))) < self.cols:
+            return None
+        row = self.row
+        line = {}
+        for name, vals in self._values.items():
+            arr = np.asarray(vals)
+            line[name] = arr[::-1] if self.serpentine and row % 2 == 1 else arr
+            vals.clear()
+        if self.store is not None:
+            self.store.write_line(row, **line)
+        self.row += 1
+        return row, line
+
+
+class GridBuffer:
+    """非光栅轨迹（螺旋、Lissajous、摆线）的采样逐点平均到 n×n 网格，定期整幅写入存储
+
+    采样位置 x、y (μm) 按 scan_patterns.GridAccumulator 落到覆盖 [0, a] 的网格（行为 y，列为 x）。
+    每 flush_every 个采样写一次（默认 n 个，与光栅一行的节奏相同），存储中空格为 NaN，
+    各格的采样数写在 samples 通道；finish() 写入剩余采样并用近邻填充空格。
+    store 为 None 时只累加。append() 写入时返回 (0, {通道名: 整幅网格})，否则返回 None。
+    """
+
+    def __init__(self, a, n, channels, store=None, flush_every=None):
+        self.store = store
+        self.n = n
+        self.flush_every = flush_every or n
+        self._acc = {name: GridAccumulator(a, n) for name in channels}
+        self._xs = []
+        self._ys = []
+        self._values = {name: [] for name in channels}
+
+    @classmethod
+    def for_store(cls, store, a, flush_every=None):
+        """继续写入已有的网格存储：由保存的平均值和采样数恢复累加状态"""
+        channels = [name for name in store.channels if name != SAMPLES_CHANNEL]
+        buffer = cls(a, store.shape[0], channels, store, flush_every)
+        counts = np.asarray(store.channel(SAMPLES_CHANNEL), dtype=float).ravel()
+        for name, acc in buffer._acc.items():
+            means = np.asarray(store.channel(name), dtype=float).ravel()
+            acc.counts = counts.copy()
+            acc.sums = np.where(counts > 0, means, 0.0) * counts
+        return buffer
+
+    def append(self, x, y, **values):
+        self._xs.append(x)
+        self._ys.append(y)
+        for name, v in values.items():
+            self._values[name].append(v)
+        if len(self._xs) < self.flush_every:
+            return None
+        return self.flush()
+
+    def flush(self, fill=False):
+        """把已累积的采样加入网格并写入存储，返回 (0, {通道名: 整幅网格})"""
+        for name, acc in self._acc.items():
+            acc.add(self._xs, self._ys, self._values[name])
+            self._values[name].clear()
+        self._xs.clear()
+        self._ys.clear()
+        images = {name: acc.image(fill=fill) for name, acc in self._acc.items()}
+        if self.store is not None:
+            counts = next(iter(self._acc.values())).counts.reshape(self.n, self.n)
+            self.store.write_lines(0, dict(images, **{SAMPLES_CHANNEL: counts}))
+        return 0, images
+
+    def finish(self):
+        return self.flush(fill=True)
+
+
+def read_checkpoint(path):
+    """读取存储目录中的断点，没有则返回 None"""
+    try:
+        with open(os.path.join(path, CHECKPOINT_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(path, meta):
+    _write_json(os.path.join(path, META_FILE), meta)
+
+
+def _write_json(filename, data):
+    # 先写临时文件再替换，避免读取方读到写了一半的 JSON
+    tmp = filename + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, filename)
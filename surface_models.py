@@ -0,0 +1,118 @@
+# 样品表面模型
+# 模拟扫描原来每个像素都调用一次解析函数 sample_surface。这里把表面预先算成（或读入）
+# 高度网格，任意 (x, y) 用向量化双线性插值取值：
+#   - GridSurface：网格表面，可像函数一样调用 surface(x, y)，x、y 可以是标量或数组
+#   - cached_grid()：把解析函数按参数生成网格，最近用过的网格保存在 LRU 缓存中，
+#                    重复模拟同一表面不必重新计算
+#   - load_surface()：读入以前采集的形貌图（.npy/.npz/文本/ScanStore 目录），同样缓存
+#
+# 网格的行对应 y、列对应 x，与扫描图像的方向一致。
+
+import functools
+import os
+
+import numpy as np
+
+# 缓存的网格数量上限
+CACHE_SIZE = 32
+
+
+class GridSurface:
+    """规则网格上的高度图
+
+    heights：二维数组，heights[j, i] 为 (x0 + i*dx, y0 + j*dy) 处的高度
+    x_len, y_len：网格覆盖的范围 (μm)，首末网格点分别位于 x0 和 x0 + x_len
+    超出网格范围的点取边缘值。
+    """
+
+    def __init__(self, heights, x_len, y_len, x0=0.0, y0=0.0):
+        heights = np.asarray(heights, dtype=float)
+        if heights.ndim != 2 or min(heights.shape) < 2:
+            raise ValueError(f"表面网格至少为 2×2 的二维数组，实际形状 {heights.shape}")
+        self.heights = heights
+        self.x_len = float(x_len)
+        self.y_len = float(y_len)
+        self.x0 = float(x0)
+        self.y0 = float(y0)
+        self.heights.flags.writeable = False  # 缓存中共享，防止被意外修改
+
+    @property
+    def shape(self):
+        return self.heights.shape
+
+    @classmethod
+    def from_function(cls, fn, x_len, y_len, step):
+        """在间距为 step 的网格点上计算 fn(x, y)"""
+        nx = int(round(x_len / step)) + 1
+        ny = int(round(y_len / step)) + 1
+        xs = np.arange(nx) * step
+        ys = np.arange(ny) * step
+        heights = fn(xs[np.newaxis, :], ys[:, np.newaxis]) * np.ones((ny, nx))
+        return cls(heights, (nx - 1) * step, (ny - 1) * step)
+
+    def __call__(self, x, y):
+        ny, nx = self.heights.shape
+        fx = (np.asarray(x, dtype=float) - self.x0) * ((nx - 1) / self.x_len)
+        fy = (np.asarray(y, dtype=float) - self.y0) * ((ny - 1) / self.y_len)
+        fx, fy = np.broadcast_arrays(np.clip(fx, 0, nx - 1), np.clip(fy, 0, ny - 1))
+        i0 = np.minimum(fx.astype(int), nx - 2)
+        j0 = np.minimum(fy.astype(int), ny - 2)
+        tx = fx - i0
+        ty = fy - j0
+        h = self.heights
+        top = h[j0, i0] * (1 - tx) + h[j0, i0 + 1] * tx
+        bottom = h[j0 + 1, i0] * (1 - tx) + h[j0 + 1, i0 + 1] * tx
+        z = top * (1 - ty) + bottom * ty
+        return float(z) if z.ndim == 0 else z
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def cached_grid(fn, x_len, y_len, step):
+    """解析表面 fn 在给定范围和间距下的网格（按参数缓存）"""
+    return GridSurface.from_function(fn, x_len, y_len, step)
+
+
+def load_surface(path, x_len, y_len, key=None, level=True):
+    """读入形貌图作为表面
+
+    path：.npy、.npz（key 指定数组名，默认第一个）、文本（np.loadtxt 可读的 .txt/.csv/.dat）
+          或 scan_store 的存储目录（key 为通道名，默认第一个通道，只取已完成的行）
+    x_len, y_len：形貌图对应的扫描范围 (μm)
+    level：减去平均值，使表面以 0 为中心
+    文件修改后会重新读取（缓存键包含修改时间）。
+    """
+    path = os.path.abspath(path)
+    return _load_surface(path, os.path.getmtime(path), float(x_len), float(y_len), key, level)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _load_surface(path, mtime, x_len, y_len, key, level):
+    heights = _read_map(path, key)
+    heights = np.asarray(heights, dtype=float)
+    if level:
+        heights = heights - np.nanmean(heights)
+    if np.isnan(heights).any():
+        raise ValueError(f"形貌图包含 NaN: {path}")
+    return GridSurface(heights, x_len, y_len)
+
+
+def _read_map(path, key):
+    if os.path.isdir(path):
+        from scan_store import ScanStore
+
+        store = ScanStore.open(path)
+        data = np.array(store.completed(key or store.channels[0]))
+        store.close()
+        return data
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return np.load(path)
+    if ext == ".npz":
+        with np.load(path) as archive:
+            return archive[key or archive.files[0]]
+    return np.loadtxt(path, delimiter="," if ext == ".csv" else None)
+
+
+def clear_cache():
+    cached_grid.cache_clear()
+    _load_surface.cache_clear()
@@ -1,15 +1,11 @@
 
 
 import serial
-import time
+from anc300_transport import ANC300Transport
 
-def send_command(ser, cmd, wait=0.1):
-    """发送命令并读取响应"""
-    cmd_line = cmd + '\r\n'  # ANC300命令结尾是CR+LF
-    ser.write(cmd_line.encode())
-    time.sleep(wait)  # 等待设备响应
-    response = ser.read_all().decode(errors='ignore')
-    return response.strip()
+def send_command(transport, cmd, timeout=None):
+    """发送命令并读取响应（读到 OK/ERROR 或超时为止）"""
+    return transport.command(cmd, timeout=timeout, check=False).text
 
 def main():
     # 修改为你的串口号和波特率
@@ -21,6 +17,7 @@ def main():
     except Exception as e:
         print(f'打开串口失败: {e}')
         return
+    transport = ANC300Transport(ser)
 
     # 测试流程示例
     commands = [
@@ -38,7 +35,7 @@ def main():
 
     for cmd in commands:
         print(f"> {cmd}")
-        resp = send_command(ser, cmd)
+        resp = send_command(transport, cmd)
         print(resp)
 
     ser.close()
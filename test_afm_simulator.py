@@ -0,0 +1,118 @@
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # 只做数值检查，不需要显示窗口
+
+import afm_simulator
+import image_processing
+import kpfm_simulator
+
+
+def test_modes_agree():
+    """固定随机种子时，向量化模式与逐点参考模式的结果一致"""
+    ref = afm_simulator.scan_surface(mode="reference", seed=1234)
+    vec = afm_simulator.scan_surface(mode="vectorized", seed=1234)
+    assert ref.shape == vec.shape == (afm_simulator.y_points, afm_simulator.x_points)
+    np.testing.assert_allclose(vec, ref, rtol=1e-12, atol=1e-12)
+
+
+def test_block_size_independent():
+    """行块大小不影响结果（PID 状态在块之间正确衔接）"""
+    a = afm_simulator.scan_surface(seed=7, rows_per_block=1)
+    b = afm_simulator.scan_surface(seed=7, rows_per_block=1000)
+    np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-12)
+
+
+def test_update_block_matches_update():
+    """update_block 与逐点 update 等价（含积分和微分项）"""
+    rng = np.random.RandomState(0)
+    measured = rng.normal(size=200)
+    pid_a = afm_simulator.PIDController(Kp=1.5, Ki=0.3, Kd=0.02)
+    pid_b = afm_simulator.PIDController(Kp=1.5, Ki=0.3, Kd=0.02)
+    expected = [pid_a.update(0.1, m, dt=0.01) for m in measured]
+    got = np.concatenate([pid_b.update_block(0.1, measured[:73], dt=0.01),
+                          pid_b.update_block(0.1, measured[73:], dt=0.01)])
+    np.testing.assert_allclose(got, expected, rtol=1e-10, atol=1e-12)
+
+
+def test_limits():
+    """积分限幅与输出饱和：update_block 与逐点 update 一致，且不超出限制"""
+    measured = np.full(300, -1.0)  # 持续的正误差，积分会一直增长
+    pid_a = afm_simulator.PIDController(Kp=1.0, Ki=5.0, integral_limit=0.5, output_limits=(-1.2, 1.2))
+    pid_b = afm_simulator.PIDController(Kp=1.0, Ki=5.0, integral_limit=0.5, output_limits=(-1.2, 1.2))
+    expected = [pid_a.update(0.0, m, dt=0.01) for m in measured]
+    got = pid_b.update_block(0.0, measured, dt=0.01)
+    np.testing.assert_allclose(got, expected)
+    assert pid_b.integral == 0.5
+    assert max(got) == 1.2
+
+
+def test_tracking():
+    """闭环跟踪：相同种子结果相同；积分控制能跟上表面，增益过大则发散"""
+    a, err = afm_simulator.simulate_tracking(Kp=0.1, Ki=50.0, seed=5)
+    b, _ = afm_simulator.simulate_tracking(Kp=0.1, Ki=50.0, seed=5)
+    np.testing.assert_array_equal(a, b)
+    assert np.sqrt(np.mean(err[:, 5:] ** 2)) < 0.05
+    assert afm_simulator.step_response(Kp=3.0)["settling_time"] == np.inf
+
+
+def test_kpfm():
+    """锁相解调得到正确的谐波振幅；Kelvin 回路恢复的 CPD 与设定的电势图一致"""
+    fs, n = 1.0e6, 200
+    freq = kpfm_simulator.coherent_frequency(23.0e3, fs, n)
+    t = np.arange(n) / fs
+    z = kpfm_simulator.lockin(0.3 * np.sin(2 * np.pi * freq * t) + 0.1 * np.cos(4 * np.pi * freq * t),
+                              fs, freq)
+    np.testing.assert_allclose(z, [0.3, 0.1j], atol=1e-12)
+
+    result = kpfm_simulator.scan_kpfm(cpd="domains", seed=3)
+    assert result["cpd"].shape == result["topography"].shape
+    err = result["cpd"][:, 5:] - result["true_cpd"][:, 5:]
+    assert np.sqrt(np.mean(err ** 2)) < 0.02
+    assert result["realtime_factor"] > 1
+
+
+def test_image_processing(tmp_path):
+    """平面扣除、带异常点屏蔽的逐行调平和漂移估计；按块处理内存映射数组与整体处理结果一致"""
+    height = afm_simulator.scan_surface(seed=2)
+    rows, cols = height.shape
+    yy, xx = np.mgrid[:rows, :cols]
+    tilted = height + 0.01 * xx - 0.02 * yy + 1.0
+    path = tmp_path / "tilted.npy"
+    np.save(path, tilted)
+    mapped = np.load(path, mmap_mode="r")
+    out = image_processing.empty_like(mapped, tmp_path / "out.npy", dtype="float64")
+    _, coef = image_processing.subtract_plane(mapped, out=out, chunk_rows=7)
+    np.testing.assert_allclose(coef[1:], [0.01, -0.02], atol=2e-3)
+    whole, _ = image_processing.subtract_plane(tilted)
+    np.testing.assert_allclose(out, whole)
+
+    rng = np.random.default_rng(0)
+    lines = (0.01 * rng.standard_normal((rows, cols)) + rng.standard_normal((rows, 1))
+             + rng.standard_normal((rows, 1)) * np.linspace(-1, 1, cols))
+    lines[:, 10:14] += 5.0  # 每行都有一段异常高的点
+    flat = image_processing.flatten_lines(lines, order=1, sigma=3.0)
+    assert np.abs(np.delete(flat, np.s_[10:14], axis=1)).max() < 0.1
+
+    shifted = np.roll(tilted, (2, -3), axis=(0, 1))
+    dy, dx = image_processing.estimate_drift(tilted[5:-5, 5:-5], shifted[5:-5, 5:-5])
+    assert abs(dy - 2) < 0.3 and abs(dx + 3) < 0.3
+
+
+if __name__ == "__main__":
+    test_modes_agree()
+    test_block_size_independent()
+    test_update_block_matches_update()
+    test_limits()
+    test_tracking()
+    test_kpfm()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_image_processing(pathlib.Path(tmp))
+    for mode in ("reference", "vectorized"):
+        t0 = time.perf_counter()
+        afm_simulator.scan_surface(mode=mode, seed=0)
+        print(f"{mode}: {time.perf_counter() - t0:.4f} s")
+    print("全部检查通过")
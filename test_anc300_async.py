@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from anc300_async import AsyncANC300, open_all
+from anc300_emulator import ANC300Emulator
+from controller_session import SessionManager
+
+
+@pytest.fixture
+def emulators():
+    emus = [ANC300Emulator(latency=0.0005, cap_time=0.02) for _ in range(2)]
+    for emu in emus:
+        emu.start()
+    yield emus
+    for emu in emus:
+        emu.stop()
+
+
+def test_open_all(emulators):
+    """同时连接两台控制器；run() 流水线执行并按顺序返回回应，各控制器互不干扰"""
+    async def main():
+        devices = await open_all([emu.device for emu in emulators])
+        try:
+            a, b = devices.values()
+            replies = await asyncio.gather(
+                a.run(["setm 1 off", "seta 1 1.5", "geta 1"]),
+                b.run(["setm 1 off", "seta 1 2.5", "geta 1"]))
+            assert [r[2].value for r in replies] == [1.5, 2.5]
+            assert "ANC300" in await a.ver()
+            await b.setm(2, "stp")
+            assert await b.measure_capacitance(2) == 1000.0
+            assert await b.getm(2) == "stp"  # 测量后恢复原模式
+        finally:
+            await asyncio.gather(*(d.close() for d in devices.values()))
+        return devices
+
+    devices = asyncio.run(main())
+    assert all(not d.session.connected for d in devices.values())  # 自己打开的会话已关闭
+    assert [emu.axes[1].offset for emu in emulators] == [1.5, 2.5]
+
+
+def test_shared_session(emulators):
+    """使用 SessionManager 的会话：命令更新会话的模式镜像，close() 不关闭共用的连接"""
+    sessions = SessionManager(keepalive=None)
+    port = emulators[0].device
+
+    async def main():
+        devices = await open_all([port], sessions=sessions)
+        device = devices[port]
+        try:
+            await device.run(["setm 3 off", "seta 3 4.0"])
+            assert await device.geta(3) == 4.0
+        finally:
+            await device.close()
+
+    try:
+        asyncio.run(main())
+        session = sessions.get(port)
+        assert session.connected
+        assert session.modes[3] == "off" and session.offsets[3] == 4.0
+        assert not session.set_mode(3, "off")  # 镜像已知，不再发送
+    finally:
+        sessions.close_all()
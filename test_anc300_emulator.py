@@ -0,0 +1,34 @@
+import pytest
+import serial
+
+from anc300_emulator import ANC300Emulator
+from anc300_transport import ANC300Error, ANC300Timeout, ANC300Transport
+
+
+@pytest.fixture
+def emulator():
+    emu = ANC300Emulator(latency=0.0005, command_latency={"getf": 0.3})
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+@pytest.fixture
+def transport(emulator):
+    t = ANC300Transport(serial.Serial(emulator.device, timeout=1.0), timeout=1.0)
+    yield t
+    t.close()
+
+
+def test_transport_reply(transport):
+    """按结束符读取回应并解析数值；ERROR 按 check 抛出或返回；超时抛出 ANC300Timeout"""
+    assert "ANC300" in transport.command("ver").lines[0]
+    transport.command("setm 2 off")
+    transport.command("seta 2 2.5")
+    reply = transport.command("geta 2")
+    assert reply.value == 2.5 and reply.units == {"voltage": "V"}
+    with pytest.raises(ANC300Error):
+        transport.command("stepu 2 10")  # 不在步进模式
+    assert not transport.command("stepu 2 10", check=False).ok
+    with pytest.raises(ANC300Timeout):
+        transport.command("getf 1", timeout=0.05)
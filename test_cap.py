@@ -6,48 +6,48 @@ ANC300 读取电容值示例
 3. 安装 pyserial:  pip install pyserial
 4. 运行脚本，脚本会:
    - 关闭回显
-   - 切换到电容测量模式 (cap)
-   - 等待测量完成 (capw)
+   - 把 AXES 中的所有轴同时切换到电容测量模式 (cap)
+   - 等待测量完成 (capw，读到 OK 即返回)
    - 读取并打印 getc 结果
+   - 把各轴恢复到原来的模式
 """
 
-import serial
-import time
+from anc300_transport import ANC300Error
+from capacitance import CapacitanceSurvey
+from controller_session import ControllerSession
 
 # === 根据实际情况修改 ===
 COM_PORT = "/dev/tty.usbmodem01"        # Windows 示例；macOS/Linux 示例: "/dev/tty.usbserial-FTxxxx"
 BAUDRATE = 38400
-AXIS_ID  = 3             # 你要测哪一根 ANS/ANP，就写对应轴号 1~7
-
-def send(ser, cmd, delay=0.1):
-    """发送命令并返回回显"""
-    ser.write((cmd + "\r\n").encode())
-    time.sleep(delay)
-    return ser.read_all().decode(errors="ignore").strip()
+AXES = [3]               # 要测的 ANS/ANP 轴号 1~7，可以一次写多个，如 range(1, 8)
 
 def main():
+    session = ControllerSession(COM_PORT, BAUDRATE, keepalive=None)
     try:
-        ser = serial.Serial(COM_PORT, BAUDRATE, timeout=1)
+        session.open()
     except Exception as e:
         print(f"串口打开失败: {e}")
         return
 
-    # 关闭回显，界面更清爽
-    print(send(ser, "echo off"))
-
-    # 步骤 1: 切到 cap 模式
-    print(send(ser, f"setm {AXIS_ID} cap"))
+    try:
+        # 关闭回显，界面更清爽
+        print(session.command("echo off", check=False).text)
 
-    # 步骤 2: 等待测量完成
-    print(send(ser, f"capw {AXIS_ID}", delay=0.3))
+        results = CapacitanceSurvey(session).measure(AXES)
+    except ANC300Error as e:
+        print(f"通信错误: {e}")
+        session.close()
+        return
 
-    # 步骤 3: 读取电容值
-    response = send(ser, f"getc {AXIS_ID}")
     print("\n========== 测量结果 ==========")
-    print(response)
+    for axis, result in results.items():
+        if result.ok:
+            print(f"轴 {axis}: {result.value:g} {result.unit}")
+        else:
+            print(f"轴 {axis}: 失败 ({result.error})")
     print("================================\n")
 
-    ser.close()
+    session.close()
 
 if __name__ == "__main__":
     main()
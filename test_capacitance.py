@@ -0,0 +1,34 @@
+import pytest
+
+from anc300_emulator import ANC300Emulator
+from capacitance import CapacitanceSurvey
+from controller_session import ControllerSession
+
+
+@pytest.fixture
+def emulator():
+    emu = ANC300Emulator(latency=0.0005, cap_time=0.02)
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+def test_capacitance_survey(emulator):
+    """批量测量后各轴恢复原模式；缓存期内不再发送命令"""
+    session = ControllerSession(emulator.device, keepalive=None).open()
+    try:
+        session.set_mode(1, "off")
+        session.set_mode(2, "stp")
+        emulator.axes[2].capacitance = 20.0  # 断线的定位器
+        survey = CapacitanceSurvey(session)
+        results = survey.measure([1, 2, 3])
+        assert results[1].value == 1000.0 and results[2].value == 20.0
+        assert [emulator.axes[a].mode for a in (1, 2, 3)] == ["off", "stp", "gnd"]
+
+        count = emulator.command_count
+        assert list(survey.check([1, 2, 3])) == [2]
+        assert emulator.command_count == count
+        survey.measure([1], max_age=0)
+        assert emulator.command_count > count
+    finally:
+        session.close()
@@ -0,0 +1,129 @@
+import pytest
+
+from anc300_emulator import ANC300Emulator
+from anc300_transport import ANC300Error
+from coarse_approach import CoarseApproach
+from controller_session import ControllerSession
+
+COARSE_AXIS = 1
+Z_AXIS = 3
+Z_MAX = 60.0
+Z_TRAVEL = 5.0   # μm
+STEP_SIZE = 0.05  # μm/步
+
+
+@pytest.fixture
+def emulator():
+    emu = ANC300Emulator(latency=0.0002)
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+@pytest.fixture
+def session(emulator):
+    s = ControllerSession(emulator.device, keepalive=None).open()
+    yield s
+    s.close()
+
+
+class Sample:
+    """位于 surface μm 处的样品；接触前信号完全平坦，接触后为 1
+
+    记录 Z 收回时探针是否已越过表面（一簇步子撞上样品）。
+    """
+
+    def __init__(self, emulator, surface):
+        self.emulator = emulator
+        self.surface = surface
+        self.reads = 0
+        self.crashed = False
+        self.on_read = None
+
+    def gap(self):
+        coarse = self.emulator.axes[COARSE_AXIS].position * STEP_SIZE
+        z = self.emulator.axes[Z_AXIS].offset / Z_MAX * Z_TRAVEL
+        if self.surface - coarse < 0:
+            self.crashed = True
+        return self.surface - coarse - z
+
+    def __call__(self):
+        self.reads += 1
+        if self.on_read is not None:
+            self.on_read(self)
+        return 1.0 if self.gap() <= 0 else 0.0
+
+
+def make_approach(session, sample, **kwargs):
+    kwargs.setdefault("max_burst", 1000)
+    return CoarseApproach(session, session, sample, COARSE_AXIS, Z_AXIS, z_travel=Z_TRAVEL,
+                          step_size=STEP_SIZE, threshold=0.5, z_max=Z_MAX, z_points=20,
+                          z_settle=0.0, frequency=10000, **kwargs)
+
+
+def assert_safe(emulator):
+    # 每种结束方式都要收回 Z、粗调轴接地
+    assert emulator.axes[Z_AXIS].offset == 0.0
+    assert emulator.axes[COARSE_AXIS].mode == "gnd"
+
+
+def test_contact(emulator, session):
+    """信号平坦时每簇也不越过 Z 行程，表面在某次 Z 检查中被发现"""
+    sample = Sample(emulator, surface=30.0)
+    result = make_approach(session, sample).run()
+    assert result.contact and not sample.crashed
+    assert 0 < result.contact_z <= Z_MAX
+    assert max(p["steps"] for p in result.phases if p["phase"] == "burst") <= 50
+    assert_safe(emulator)
+
+
+def test_contact_ground_error(emulator, session, monkeypatch):
+    """接触后接地失败只记入日志，仍然返回结果"""
+    sample = Sample(emulator, surface=3.0)
+    approach = make_approach(session, sample)
+    set_mode = session.set_mode
+
+    def failing_set_mode(axis, mode):
+        if mode == "gnd":
+            raise ANC300Error("模拟接地失败")
+        return set_mode(axis, mode)
+    monkeypatch.setattr(session, "set_mode", failing_set_mode)
+    result = approach.run()
+    assert result.contact
+    assert emulator.axes[Z_AXIS].offset == 0.0
+
+
+def test_step_limit(emulator, session):
+    sample = Sample(emulator, surface=1000.0)
+    result = make_approach(session, sample, max_steps=120).run()
+    assert not result.contact and "步数上限" in result.reason
+    assert result.total_steps == 120
+    assert_safe(emulator)
+
+
+def test_stop_requested(emulator, session):
+    sample = Sample(emulator, surface=1000.0)
+    approach = make_approach(session, sample)
+    sample.on_read = lambda s: s.reads == 50 and approach.stop()
+    result = approach.run()
+    assert not result.contact and result.reason == "用户中止"
+    assert_safe(emulator)
+
+
+def test_error_during_burst(emulator, session):
+    """步进命令回应 ERROR 时停止逼近并安全收尾"""
+    sample = Sample(emulator, surface=1000.0)
+
+    def leave_stepping_mode(s):
+        if s.reads == 30:
+            emulator.axes[COARSE_AXIS].mode = "gnd"  # 下一簇 stepu 返回 ERROR
+    sample.on_read = leave_stepping_mode
+    result = make_approach(session, sample).run()
+    assert not result.contact and "通信错误" in result.reason
+    assert_safe(emulator)
+
+
+def test_axes_must_differ(session):
+    with pytest.raises(ValueError):
+        CoarseApproach(session, session, lambda: 0.0, 1, 1, z_travel=Z_TRAVEL,
+                       step_size=STEP_SIZE)
@@ -0,0 +1,38 @@
+import pytest
+import serial
+
+from anc300_emulator import ANC300Emulator
+from anc300_transport import ANC300Error, ANC300Transport, CommandPipeline
+
+
+@pytest.fixture
+def emulator():
+    emu = ANC300Emulator(latency=0.0005)
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+@pytest.fixture
+def transport(emulator):
+    t = ANC300Transport(serial.Serial(emulator.device, timeout=1.0), timeout=1.0)
+    yield t
+    t.close()
+
+
+@pytest.mark.parametrize("echo", ["on", "off"])
+def test_pipeline(transport, echo):
+    """流水线按提交顺序返回回应；出错或回应错位时排空在途命令，之后仍能对齐"""
+    transport.command(f"echo {echo}")
+    pipeline = CommandPipeline(transport, window=3)
+    replies = pipeline.run(["setm 1 off", "seta 1 1.0", "geta 1", "seta 1 2.0", "geta 1"])
+    assert [r.value for r in replies] == [None, None, 1.0, None, 2.0]
+
+    with pytest.raises(ANC300Error):
+        pipeline.run(["seta 1 3.0", "stepu 1 5", "geta 1"])
+    assert pipeline.run(["geta 1"])[0].value == 3.0
+
+    transport.write("geta 1")  # 一条不在流水线记录中的命令，其回应会让后面的回应错位
+    with pytest.raises(ANC300Error, match="不匹配"):
+        pipeline.run(["seta 1 4.0", "geta 1"])
+    assert pipeline.run(["geta 1"])[0].value == 4.0
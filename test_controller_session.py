@@ -0,0 +1,36 @@
+import pytest
+
+from anc300_emulator import ANC300Emulator
+from anc300_transport import ANC300Error
+from controller_session import ControllerSession
+
+
+@pytest.fixture
+def emulator():
+    emu = ANC300Emulator(latency=0.0005)
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+def test_session_mode_mirror_and_reconnect(emulator):
+    """已知模式的 setm 不发送；串口断开后命令失败并清空镜像，下一条命令自动重连"""
+    session = ControllerSession(emulator.device, keepalive=None).open()
+    try:
+        assert session.set_mode(1, "off")
+        count = emulator.command_count
+        assert not session.set_mode(1, "off")
+        assert emulator.command_count == count and session.skipped == 1
+
+        session.set_offset(1, 5.0)
+        assert session.offsets[1] == 5.0
+        session.transport.ser.close()  # 模拟 USB 断开
+        with pytest.raises(ANC300Error):
+            session.command("geta 1")
+        assert not session.connected and session.modes == {}
+
+        assert session.command("geta 1").value == 5.0
+        assert session.reconnects == 1
+        assert session.set_mode(1, "off")  # 镜像已清空，重新发送
+    finally:
+        session.close()
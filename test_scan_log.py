@@ -0,0 +1,44 @@
+import json
+
+import scan_log
+from scan_log import ScanLog, throttle
+
+
+def test_ring_buffer_bound():
+    """最近日志和待显示行都有上限，超出的待显示行在 drain() 中注明省略数"""
+    log = ScanLog(capacity=5, batch_limit=3)
+    for k in range(20):
+        log.log(f"line {k}")
+    assert log.count == 20
+    assert log.recent() == [f"line {k}" for k in range(15, 20)]
+    lines = log.drain()
+    assert "省略 17 行" in lines[0]
+    assert lines[1:] == ["line 17", "line 18", "line 19"]
+    assert log.drain() == []
+
+
+def test_unique_file_names(tmp_path, monkeypatch):
+    """同一时刻启动的扫描各自写入不同的日志文件，文件内容为完整的 JSON Lines"""
+    monkeypatch.setattr(scan_log.time, "time", lambda: 1700000000.5)
+    logs = [ScanLog.for_scan(str(tmp_path)) for _ in range(10)]
+    assert len({log.path for log in logs}) == 10
+    assert logs[1].path.endswith("_500_1.jsonl")
+    for k, log in enumerate(logs):
+        log.log("start", index=k)
+        log.close()
+    for k, log in enumerate(logs):
+        with open(log.path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert [(r["msg"], r["index"]) for r in records] == [("start", k)]
+
+
+def test_throttle(monkeypatch):
+    """两次实际调用至少间隔 interval，期间的调用被忽略"""
+    now = [0.0]
+    monkeypatch.setattr(scan_log.time, "monotonic", lambda: now[0])
+    calls = []
+    wrapped = throttle(calls.append, 0.1)
+    for t in (0.0, 0.05, 0.099, 0.1, 0.15, 0.25):
+        now[0] = t
+        wrapped(t)
+    assert calls == [0.0, 0.1, 0.25]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from scan_store import LineBuffer, ScanStore
+
+
+def test_round_trip(tmp_path):
+    """逐行写入的数据以内存映射方式读回；只读打开时不能写入"""
+    path = str(tmp_path / "scan")
+    store = ScanStore.create(path, 4, 3, channels=("height", "phase"), a=10.0, pattern="raster")
+    rows = np.arange(12, dtype=float).reshape(4, 3)
+    store.write_line(0, height=rows[0], phase=-rows[0])
+    store.write_lines(1, {"height": rows[1:3], "phase": -rows[1:3]})
+
+    reader = ScanStore.open(path)
+    assert reader.shape == (4, 3) and reader.channels == ["height", "phase"]
+    assert reader.metadata == {"a": 10.0, "pattern": "raster"}
+    assert reader.lines_completed == 3
+    assert isinstance(reader.channel("height"), np.memmap)
+    np.testing.assert_array_equal(reader.completed("height"), rows[:3])
+    np.testing.assert_array_equal(reader.completed("phase"), -rows[:3])
+    assert np.isnan(reader.line_times[3]) and np.all(np.isfinite(reader.line_times[:3]))
+    with pytest.raises(IOError):
+        reader.write_line(3, height=rows[3])
+
+    store.write_line(3, height=rows[3], phase=-rows[3])
+    store.finish()
+    assert reader.refresh() == 4 and reader.meta["finished"] is not None
+    np.testing.assert_array_equal(reader.completed("height"), rows)
+
+
+def test_line_buffer_partial_line(tmp_path):
+    """不满一行时不写盘；折返扫描的奇数行反向存放"""
+    store = ScanStore.create(str(tmp_path / "scan"), 2, 3, channels=("height",))
+    lines = LineBuffer.for_store(store, serpentine=True)
+    assert lines.append(height=1.0) is None
+    assert lines.append(height=2.0) is None
+    assert store.lines_completed == 0
+    row, line = lines.append(height=3.0)
+    assert row == 0 and store.lines_completed == 1
+    for v in (4.0, 5.0):
+        assert lines.append(height=v) is None
+    assert store.lines_completed == 1  # 第二行只有两个点，仍未写入
+    row, line = lines.append(height=6.0)
+    assert row == 1
+    np.testing.assert_array_equal(line["height"], [6.0, 5.0, 4.0])
+    np.testing.assert_array_equal(store.channel("height"), [[1, 2, 3], [6, 5, 4]])
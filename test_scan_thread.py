@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from anc300_emulator import ANC300Emulator
+from scanUI import ScanThread
+from scan_patterns import make_pattern
+from scan_store import ScanStore
+
+
+@pytest.fixture
+def emulator():
+    emu = ANC300Emulator(latency=0.0002)
+    emu.start()
+    yield emu
+    emu.stop()
+
+
+def scan(emulator, save_dir, stop_after=None, checkpoint=None, **kwargs):
+    """在模拟器上运行一次 ScanThread（在当前线程中），stop_after 个像素后请求停止"""
+    if checkpoint is not None:
+        thread = ScanThread.from_checkpoint(emulator.device, checkpoint)
+    else:
+        thread = ScanThread(emulator.device, 10.0, 2.0, 0.0, save_dir=str(save_dir), z_axis=3,
+                            **kwargs)
+    pixels = [0]
+
+    def on_pixel():
+        pixels[0] += 1
+        if pixels[0] == stop_after:
+            thread.stop()
+    thread.on_pixel = on_pixel
+    thread.run()
+    return thread
+
+
+@pytest.mark.parametrize("pattern", ["spiral", "lissajous", "cycloid"])
+def test_gridded_pattern(emulator, tmp_path, pattern):
+    """非光栅轨迹平均到网格上存储，每个采样恰好计入一次；中途停止后继续，结果与一次扫完相同"""
+    full = scan(emulator, tmp_path / "full", pattern=pattern)
+    assert full.completed
+    store = ScanStore.open(full.store.path)
+    assert store.shape == (6, 6) and store.metadata["layout"] == "grid"
+    assert store.channel("samples").sum() == make_pattern(pattern, 10.0, 2.0).count()
+    assert not np.isnan(store.channel("z_volt")).any()  # 空格已填充
+    # 行对应 X：每行的 X 电压随行号增大
+    assert np.all(np.diff(np.nanmean(store.channel("x_volt"), axis=1)) > 0)
+
+    stopped = scan(emulator, tmp_path / "resumed", stop_after=15, pattern=pattern)
+    assert not stopped.completed
+    resumed = scan(emulator, None, checkpoint=stopped.checkpoint)
+    assert resumed.completed
+    again = ScanStore.open(stopped.store.path)
+    np.testing.assert_array_equal(again.channel("samples"), store.channel("samples"))
+    np.testing.assert_allclose(again.channel("x_volt"), store.channel("x_volt"), atol=1e-4)
+
+
+def test_resume_raster(emulator, tmp_path, monkeypatch):
+    """光栅扫描在行中间停止后继续：每行恰好写入一次、按顺序，数据与网格位置一致"""
+    written = []
+    write_lines = ScanStore.write_lines
+
+    def record(store, row, blocks):
+        written.extend(range(row, row + len(next(iter(blocks.values())))))
+        return write_lines(store, row, blocks)
+    monkeypatch.setattr(ScanStore, "write_lines", record)
+
+    stopped = scan(emulator, tmp_path, stop_after=15)  # 第 3 行（行号 2）中间
+    assert not stopped.completed
+    assert stopped.checkpoint["row"] == 2 and stopped.checkpoint["path_index"] == 12
+    resumed = scan(emulator, None, checkpoint=stopped.checkpoint)
+    assert resumed.completed and resumed.store.path == stopped.store.path
+    assert written == list(range(6))
+
+    store = ScanStore.open(stopped.store.path)
+    assert store.lines_completed == 6
+    grid = np.arange(6) * 2.0 * 1.2  # 每 2 μm 对应 2.4 V
+    np.testing.assert_allclose(store.channel("x_volt"), np.repeat(grid[:, None], 6, axis=1),
+                               atol=1e-3)
+    np.testing.assert_allclose(store.channel("y_volt"), np.repeat(grid[None, :], 6, axis=0),
+                               atol=1e-3)
+    assert np.all(np.diff(store.line_times) >= 0)
+    assert store.read_checkpoint()["completed"]
@@ -1,5 +1,6 @@
 import time
 import serial
+from anc300_transport import ANC300Error, ANC300Transport
 
 # ==== 参数设置 ====
 a = 20.0  # 正方形扫描区域边长（单位：μm）
@@ -16,41 +17,55 @@ y_range = 50.0  # Y轴最大位移
 volt_per_um_x = Vmax / x_range
 volt_per_um_y = Vmax / y_range
 
-# ==== 初始化串口 ====
-ser = serial.Serial(serial_port, baudrate=9600, timeout=1)
-
-def send_cmd(cmd):
-    """向ANC300发送命令并返回响应"""
-    full_cmd = cmd + "\r\n"
-    ser.write(full_cmd.encode())
-    time.sleep(0.05)
-    response = ser.read_all().decode().strip()
+def send_cmd(transport, cmd):
+    """向ANC300发送命令并返回响应（读到 OK/ERROR 即返回）"""
+    response = transport.command(cmd, check=False).text
     print(f">>> {cmd}\n{response}")
     return response
 
-# ==== 初始化为 offset 模式 ====
-send_cmd("setm 1 off")  # X轴
-send_cmd("setm 2 off")  # Y轴
+def raster_scan(transport, a, d, pause_time, on_pixel=None):
+    """逐行光栅扫描；on_pixel 在每个像素到位后调用
+
+    通信出错（超时、串口断开）时异常向上抛出，但无论如何都先回到原点并接地
+    """
+    try:
+        # ==== 初始化为 offset 模式 ====
+        send_cmd(transport, "setm 1 off")  # X轴
+        send_cmd(transport, "setm 2 off")  # Y轴
 
-# ==== 计算步数 ====
-num_steps = int(a / d)
+        # ==== 计算步数 ====
+        num_steps = int(a / d)
 
-# ==== 开始扫描 ====
-for iy in range(num_steps):
-    y_pos = iy * d
-    y_voltage = y_pos * volt_per_um_y
-    send_cmd(f"seta 2 {y_voltage:.3f}")  # 设置Y轴偏压
+        # ==== 开始扫描 ====
+        for iy in range(num_steps):
+            y_pos = iy * d
+            y_voltage = y_pos * volt_per_um_y
+            send_cmd(transport, f"seta 2 {y_voltage:.3f}")  # 设置Y轴偏压
 
-    for ix in range(num_steps):
-        x_pos = ix * d
-        x_voltage = x_pos * volt_per_um_x
-        send_cmd(f"seta 1 {x_voltage:.3f}")  # 设置X轴偏压
+            for ix in range(num_steps):
+                x_pos = ix * d
+                x_voltage = x_pos * volt_per_um_x
+                send_cmd(transport, f"seta 1 {x_voltage:.3f}")  # 设置X轴偏压
+                if on_pixel is not None:
+                    on_pixel()
 
-        # 模拟扫描操作
-        time.sleep(pause_time)
+                # 模拟扫描操作
+                time.sleep(pause_time)
+    finally:
+        # ==== 扫描结束或出错，回到原点并接地 ====
+        for cmd in ("seta 1 0.000", "seta 2 0.000", "setm 1 gnd", "setm 2 gnd"):
+            try:
+                send_cmd(transport, cmd)
+            except (ANC300Error, serial.SerialException, OSError) as e:
+                print(f"!!! {cmd} 失败: {e}")
 
-# ==== 扫描结束，回到原点 ====
-send_cmd("seta 1 0.000")
-send_cmd("seta 2 0.000")
-ser.close()
-print("扫描完成！")
+if __name__ == "__main__":
+    # ==== 初始化串口 ====
+    ser = serial.Serial(serial_port, baudrate=9600, timeout=1)
+    try:
+        raster_scan(ANC300Transport(ser), a, d, pause_time)
+        print("扫描完成！")
+    except (ANC300Error, serial.SerialException, OSError) as e:
+        print(f"扫描中止: {e}")
+    finally:
+        ser.close()